@@ -0,0 +1,160 @@
+"""
+OpenAI兼容的本地LLM桩服务：按用户问题中的关键词回放预设的工具调用，收到工具结果后返回总结。
+支持非流式与SSE流式（含tool_calls增量与usage），可模拟首token延迟与生成速度。
+
+用法: python benchmarks/fake_llm_server.py --port 18080 --ttft-ms 200 --tokens-per-s 50
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (问题关键词, 工具名, 参数)；参数中的"{input}"替换为用户问题
+SCENARIOS = [
+    (r"第[一二三四五六七八九十百零\d]+条", "lookup_regulation_article", {"law_name": "水法", "article": "第十二条"}),
+    (r"法|规定|条例|许可", "search_regulations", {"query": "{input}", "k": 3}),
+    (r"批量|多组|站点", "predict_water_batch", {"samples": [
+        {"ph": 7.1, "hardness": 190.0, "solids": 21000.0, "turbidity": 3.9},
+        {"ph": 5.8, "hardness": 240.0, "solids": 35000.0, "sulfate": 410.0},
+    ]}),
+    (r"水质|可饮用|ph|浊度", "predict_water", {
+        "ph": 7.2, "hardness": 200.0, "solids": 20000.0, "chloramines": 7.0, "sulfate": 330.0,
+        "conductivity": 420.0, "organic_carbon": 14.0, "trihalomethanes": 66.0, "turbidity": 4.0,
+    }),
+    (r"代码|计算|python", "execute_code", {"code": "print(sum(i * i for i in range(1000)))", "language": "python"}),
+]
+
+ANSWER = "根据查询结果，{summary}。以上为模拟回答，仅用于基准测试。"
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+def plan_response(body: dict) -> dict:
+    """返回 {"content": str} 或 {"tool_call": (name, arguments)}"""
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {}
+    if last.get("role") == "tool":
+        summary = str(last.get("content", ""))[:80].replace("\n", " ")
+        return {"content": ANSWER.format(summary=summary)}
+    user_input = str(last.get("content", ""))
+    available = {tool.get("function", {}).get("name") for tool in body.get("tools") or []}
+    for pattern, name, arguments in SCENARIOS:
+        if name in available and re.search(pattern, user_input, re.IGNORECASE):
+            arguments = json.loads(json.dumps(arguments, ensure_ascii=False).replace("{input}", user_input[:50]))
+            return {"tool_call": (name, arguments)}
+    return {"content": ANSWER.format(summary="该问题无需调用工具")}
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    ttft = 0.0
+    tokens_per_s = 0.0
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with FakeLLMHandler._lock:
+            FakeLLMHandler.requests += 1
+        plan = plan_response(body)
+        prompt_tokens = sum(_estimate_tokens(str(message.get("content") or "")) for message in body.get("messages", []))
+        time.sleep(self.ttft)
+        if body.get("stream"):
+            self._stream(body, plan, prompt_tokens)
+        else:
+            self._complete(body, plan, prompt_tokens)
+
+    def _tool_call(self, plan: dict) -> dict:
+        name, arguments = plan["tool_call"]
+        return {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+    def _complete(self, body: dict, plan: dict, prompt_tokens: int):
+        content = plan.get("content")
+        if content and self.tokens_per_s:
+            time.sleep(_estimate_tokens(content) / self.tokens_per_s)
+        message = {"role": "assistant", "content": content}
+        if "tool_call" in plan:
+            message["tool_calls"] = [self._tool_call(plan)]
+        completion_tokens = _estimate_tokens(content or json.dumps(message.get("tool_calls")))
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if "tool_call" in plan else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, body: dict, plan: dict, prompt_tokens: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+
+        def send(delta: dict, finish_reason=None, **extra):
+            chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        if "tool_call" in plan:
+            call = self._tool_call(plan)
+            send({"role": "assistant", "content": None, "tool_calls": [dict(call, index=0)]})
+            send({}, "tool_calls")
+            completion_tokens = _estimate_tokens(call["function"]["arguments"])
+        else:
+            content = plan["content"]
+            send({"role": "assistant", "content": ""})
+            # 每次输出两个字符，近似一个token
+            for i in range(0, len(content), 2):
+                send({"content": content[i:i + 2]})
+                if self.tokens_per_s:
+                    time.sleep(1 / self.tokens_per_s)
+            send({}, "stop")
+            completion_tokens = _estimate_tokens(content)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            chunk = dict(base, choices=[], usage=usage)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, data: dict):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_server(port: int = 0, ttft_ms: float = 0, tokens_per_s: float = 0) -> ThreadingHTTPServer:
+    # 在后台线程启动，port为0时自动分配端口
+    FakeLLMHandler.ttft = ttft_ms / 1000
+    FakeLLMHandler.tokens_per_s = tokens_per_s
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLLMHandler)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地LLM桩服务")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--ttft-ms", type=float, default=0, help="模拟首token延迟（毫秒）")
+    parser.add_argument("--tokens-per-s", type=float, default=0, help="模拟生成速度，0为不限速")
+    args = parser.parse_args()
+    FakeLLMHandler.ttft = args.ttft_ms / 1000
+    FakeLLMHandler.tokens_per_s = args.tokens_per_s
+    print(f"LLM桩服务: http://127.0.0.1:{args.port}/v1")
+    ThreadingHTTPServer(("127.0.0.1", args.port), FakeLLMHandler).serve_forever()
+
+if __name__ == "__main__":
+    main()
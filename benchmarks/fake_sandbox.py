@@ -0,0 +1,69 @@
+"""
+SandboxFusion本地替身：实现 POST /run_code，用子进程执行Python代码并按SandboxFusion的响应格式返回。
+不做任何隔离，只用于离线基准测试。
+
+用法: python benchmarks/fake_sandbox.py --port 18081
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def run_code(code: str, timeout: float) -> dict:
+    start = time.time()
+    try:
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "Failed", "message": f"timeout after {timeout}s",
+                "run_result": {"status": "TimeLimitExceeded", "stdout": "", "stderr": "",
+                               "execution_time": time.time() - start, "return_code": None}}
+    return {
+        "status": "Success" if completed.returncode == 0 else "Failed",
+        "message": "",
+        "run_result": {
+            "status": "Finished",
+            "stdout": completed.stdout.decode("utf-8", errors="replace"),
+            "stderr": completed.stderr.decode("utf-8", errors="replace"),
+            "execution_time": time.time() - start,
+            "return_code": completed.returncode,
+        },
+    }
+
+class FakeSandboxHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/run_code":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if str(body.get("language", "python")).lower() not in ("python", "python3", "py"):
+            result = {"status": "Failed", "message": f"unsupported language: {body.get('language')}", "run_result": None}
+        else:
+            result = run_code(body.get("code", ""), float(body.get("run_timeout") or 30))
+        payload = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_server(port: int = 0) -> ThreadingHTTPServer:
+    # 在后台线程启动，port为0时自动分配端口
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSandboxHandler)
+    threading.Thread(target=server.serve_forever, name="fake-sandbox", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="SandboxFusion本地替身")
+    parser.add_argument("--port", type=int, default=18081)
+    args = parser.parse_args()
+    print(f"沙箱替身服务: http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(("127.0.0.1", args.port), FakeSandboxHandler).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+离线端到端基准测试：LLM与SandboxFusion使用本地桩服务，嵌入使用哈希桩（EMBEDDING_BACKEND=hash），
+向量库在临时目录中由build_vector_db.py构建，全程无需网络。
+
+测量项:
+- index_build: 用哈希嵌入构建临时向量库的耗时（主要反映PDF解析与分块）
+- cold_start:  新进程中导入、智能体初始化、首次检索（含加载向量库）的耗时与峰值内存
+- turns:       按预设问题逐轮对话的延迟（阻塞与流式首token），以及各阶段p50/p95/p99
+- retrieval:   各检索模式的QPS与单次延迟
+- prediction:  不同批大小的水质预测吞吐（需已训练的CatBoost模型）
+- memory:      各阶段结束时的进程峰值RSS
+
+用法:
+    python benchmarks/run_benchmarks.py                          # 运行并保存到 benchmarks/results/
+    python benchmarks/run_benchmarks.py --baseline old.json      # 运行并与基线对比
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import fake_llm_server
+import fake_sandbox
+
+PROMPTS = [
+    "取水许可需要满足哪些条件？",
+    "水法第十二条规定了什么？",
+    "这组水样可以饮用吗？ph 7.2，浊度 4",
+    "帮我用python计算1到1000的平方和",
+    "批量预测两个站点的水质",
+    "你好，介绍一下你自己",
+    "防洪法对河道管理有哪些规定？",
+    "水土保持的法律责任有哪些？",
+]
+
+SEARCH_QUERIES = [
+    "取水许可", "水资源费征收", "河道管理范围", "防洪规划", "水土保持方案", "水污染防治",
+    "水库大坝安全", "蓄滞洪区", "水文监测", "农田水利", "节约用水", "地下水超采",
+    "法律责任 罚款", "水工程建设", "流域管理机构", "饮用水水源保护区",
+]
+
+COLD_START_SCRIPT = """
+import json, time, resource
+start = time.perf_counter()
+from src.agent.core import WaterAgent
+imported = time.perf_counter()
+agent = WaterAgent(enable_streaming=False, warm_up_tools=False)
+ready = time.perf_counter()
+from src.tools.vector_search import search_tool
+search_tool.search("取水许可", k=3)
+searched = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "agent_init_s": ready - imported,
+    "first_search_s": searched - ready,
+    "total_s": searched - start,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentiles(values_ms) -> dict:
+    ordered = sorted(values_ms)
+    if not ordered:
+        return {}
+    def quantile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "p50_ms": quantile(0.5), "p95_ms": quantile(0.95),
+            "p99_ms": quantile(0.99), "mean_ms": sum(ordered) / len(ordered)}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def configure_env(llm_port: int, sandbox_port: int, db_path: str):
+    # 所有外部依赖指向本地桩；关闭各类缓存，测量完整路径
+    for key in ("DASHSCOPE_API_KEY", "DEEPSEEK_API_KEY", "EMBEDDING_CACHE_DB", "TRACE_EXPORT_PATH",
+                "MEMORY_DB_PATH", "AGENT_SESSION_ID"):
+        os.environ.pop(key, None)
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_MODEL": "fake-model",
+        "SANDBOX_FUSION_URL": f"http://127.0.0.1:{sandbox_port}",
+        "CODE_EXECUTOR_BACKEND": "sandbox_fusion",
+        "CODE_RESULT_CACHE": "0",
+        "EMBEDDING_BACKEND": "hash",
+        "EMBEDDING_CACHE_SIZE": "0",
+        "RESPONSE_CACHE_ENABLED": "0",
+        "VECTOR_DB_PATH": db_path,
+        "TRACE_ENABLED": "1",
+    })
+
+def bench_index_build(db_path: str) -> dict:
+    print("构建临时向量库（哈希嵌入）...")
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "scripts/data_processing/build_vector_db.py", "--full", "--db-path", db_path, "--numpy-store"],
+        cwd=PROJECT_ROOT, env=os.environ.copy(), capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        print(completed.stderr[-2000:])
+        return {"error": f"build_vector_db.py 退出码 {completed.returncode}"}
+    manifest = json.loads((Path(db_path) / "manifest.json").read_text(encoding="utf-8"))
+    return {"total_s": elapsed, "chunks": manifest.get("chunks"), "chunks_per_s": manifest.get("chunks", 0) / elapsed}
+
+def bench_cold_start(runs: int) -> dict:
+    print(f"冷启动测试（{runs}次）...")
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT], cwd=PROJECT_ROOT,
+                                   env=os.environ.copy(), capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:])
+            return {"error": f"冷启动进程退出码 {completed.returncode}"}
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {key: median(sample[key] for sample in samples) for key in samples[0]}
+
+def bench_turns(agent, turns: int) -> dict:
+    from src.utils.tracing import tracer
+    from src.utils.tokens import estimate_message_tokens
+    print(f"对话轮次测试（{turns}轮）...")
+    blocking, first_token, streaming, history_tokens = [], [], [], []
+    for i in range(turns):
+        prompt = PROMPTS[i % len(PROMPTS)]
+        start = time.perf_counter()
+        agent.chat(prompt)
+        blocking.append((time.perf_counter() - start) * 1000)
+        # 每轮随请求发送的历史记忆大小，长会话中应保持平稳
+        history_tokens.append(estimate_message_tokens(agent.memory.load_memory_variables({})["chat_history"]))
+
+    async def stream_turns():
+        for i in range(turns):
+            prompt = PROMPTS[i % len(PROMPTS)]
+            start = time.perf_counter()
+            first = None
+            async for event in agent.astream(prompt):
+                if first is None and event["type"] == "token":
+                    first = time.perf_counter()
+            end = time.perf_counter()
+            streaming.append((end - start) * 1000)
+            if first is not None:
+                first_token.append((first - start) * 1000)
+
+    asyncio.run(stream_turns())
+    return {
+        "blocking": percentiles(blocking),
+        "streaming": percentiles(streaming),
+        "first_token": percentiles(first_token),
+        "llm_requests": fake_llm_server.FakeLLMHandler.requests,
+        "history_tokens": {"last": history_tokens[-1] if history_tokens else 0, "max": max(history_tokens, default=0)},
+        "stages": tracer.stage_stats(),
+    }
+
+def bench_retrieval(queries: int, k: int) -> dict:
+    from src.tools.vector_search import search_tool
+    print(f"检索测试（每种模式{queries}次）...")
+    results = {}
+    for mode in ("lexical", "vector", "hybrid"):
+        latencies = []
+        start = time.perf_counter()
+        for i in range(queries):
+            query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+            t0 = time.perf_counter()
+            search_tool.search(query, k=k, mode=mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+        results[mode] = dict(percentiles(latencies), qps=queries / elapsed)
+    return results
+
+def bench_prediction(batch_sizes, min_seconds: float) -> dict:
+    import numpy as np
+    from src.tools.water_predictor import predictor
+    print("水质预测吞吐测试...")
+    try:
+        predictor.get()
+    except Exception as e:
+        return {"error": f"模型不可用: {e}"}
+    rng = np.random.default_rng(0)
+    # 各特征的大致取值范围
+    low = np.array([0, 50, 300, 0.5, 130, 200, 2, 0, 1.5])
+    high = np.array([14, 320, 60000, 13, 480, 750, 28, 120, 6.5])
+    results = {}
+    for size in batch_sizes:
+        matrix = rng.uniform(low, high, size=(size, len(low)))
+        latencies = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds or len(latencies) < 3:
+            t0 = time.perf_counter()
+            predictor.predict_batch(matrix)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+        results[f"batch_{size}"] = dict(percentiles(latencies), rows_per_s=size * len(latencies) / elapsed)
+    return results
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    # 延迟/耗时/内存越小越好，吞吐越大越好；变差超过阈值视为回归
+    old, new = flatten(baseline), flatten(current)
+    regressions = 0
+    print(f"\n对比基线 {baseline.get('meta', {}).get('commit')} -> {current.get('meta', {}).get('commit')}")
+    print(f"{'指标':<50} {'基线':>12} {'当前':>12} {'变化':>9}")
+    for name in sorted(old.keys() & new.keys()):
+        if name.startswith("meta.") or ".count" in name:
+            continue
+        higher_better = "qps" in name or "per_s" in name
+        lower_better = name.endswith(("_ms", "_s", "_mb"))
+        if not (higher_better or lower_better) or old[name] == 0:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        regressed = change < -threshold if higher_better else change > threshold
+        regressions += regressed
+        flag = "  <-- 回归" if regressed else ""
+        print(f"{name:<50} {old[name]:>12.3f} {new[name]:>12.3f} {change:>+8.1%}{flag}")
+    print(f"\n回归指标数: {regressions}（阈值 {threshold:.0%}）")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("--turns", type=int, default=16, help="对话轮数（阻塞与流式各一遍）")
+    parser.add_argument("--cold-runs", type=int, default=3, help="冷启动重复次数，取中位数")
+    parser.add_argument("--search-queries", type=int, default=300, help="每种检索模式的查询次数")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-sizes", default="1,100,10000", help="预测批大小，逗号分隔")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="每个批大小的最短测量时间")
+    parser.add_argument("--llm-ttft-ms", type=float, default=0, help="LLM桩的模拟首token延迟")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=0, help="LLM桩的模拟生成速度，0为不限速")
+    parser.add_argument("--output", default=None, help="结果JSON路径，默认 benchmarks/results/<时间>_<提交>.json")
+    parser.add_argument("--baseline", default=None, help="与指定结果JSON对比")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定回归的相对变化阈值")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="只对比两个已有结果，不运行")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.compare:
+        baseline, current = (json.loads(Path(path).read_text(encoding="utf-8")) for path in args.compare)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    llm_server = fake_llm_server.start_server(ttft_ms=args.llm_ttft_ms, tokens_per_s=args.llm_tokens_per_s)
+    sandbox_server = fake_sandbox.start_server()
+    db_dir = tempfile.mkdtemp(prefix="bench_vector_db_")
+    configure_env(llm_server.server_address[1], sandbox_server.server_address[1], db_dir)
+
+    results = {"meta": {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "llm_ttft_ms": args.llm_ttft_ms,
+        "llm_tokens_per_s": args.llm_tokens_per_s,
+    }, "memory": {}}
+
+    results["index_build"] = bench_index_build(db_dir)
+    results["cold_start"] = bench_cold_start(args.cold_runs)
+
+    from src.agent.core import WaterAgent
+    agent = WaterAgent(enable_streaming=False)
+    if agent.warmup_thread:
+        agent.warmup_thread.join()
+    results["memory"]["after_init_mb"] = peak_rss_mb()
+    results["turns"] = bench_turns(agent, args.turns)
+    results["memory"]["after_turns_mb"] = peak_rss_mb()
+    results["retrieval"] = bench_retrieval(args.search_queries, args.k)
+    results["memory"]["after_retrieval_mb"] = peak_rss_mb()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",") if size]
+    results["prediction"] = bench_prediction(batch_sizes, args.min_seconds)
+    results["memory"]["peak_mb"] = peak_rss_mb()
+
+    output = Path(args.output) if args.output else \
+        PROJECT_ROOT / "benchmarks/results" / f"{datetime.now():%Y%m%d_%H%M%S}_{results['meta']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n结果已保存: {output}")
+
+    llm_server.shutdown()
+    sandbox_server.shutdown()
+    shutil.rmtree(db_dir, ignore_errors=True)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        sys.exit(1 if compare(baseline, results, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
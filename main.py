@@ -1,40 +1,88 @@
+import time
+import asyncio
+from src.utils.lazy import record_timing, format_startup_report
+
+_import_start = time.perf_counter()
 from src.agent.core import WaterAgent
+record_timing("模块导入", time.perf_counter() - _import_start)
 from src.utils.logger import setup_logger
 
 logger = setup_logger("Main")
 
+EXIT_COMMANDS = ['quit', 'exit', '退出', 'q']
+
+def run_blocking(agent: WaterAgent):
+    # 对话循环
+    while True:
+        try:
+            user_input = input("\n用户: ").strip()
+            # 退出命令
+            if user_input.lower() in EXIT_COMMANDS:
+                logger.info("再见！")
+                break
+            # 空输入跳过
+            if not user_input:
+                continue
+            # 获取智能体响应
+            response = agent.chat(user_input)
+            # print(f"\n智能体: {response}")
+
+        except KeyboardInterrupt:
+            logger.info("用户中断，再见！")
+            break
+        except Exception as e:
+            logger.error(f"对话处理失败: {e}")
+
+async def run_streaming(agent: WaterAgent):
+    # 流式对话循环：边生成边输出
+    while True:
+        try:
+            user_input = (await asyncio.to_thread(input, "\n用户: ")).strip()
+            # 退出命令
+            if user_input.lower() in EXIT_COMMANDS:
+                logger.info("再见！")
+                break
+            # 空输入跳过
+            if not user_input:
+                continue
+
+            print("\n智能体: ", end="", flush=True)
+            async for event in agent.astream(user_input):
+                if event["type"] == "token":
+                    print(event["content"], end="", flush=True)
+                elif event["type"] == "tool_start":
+                    print(f"\n[调用工具: {event['name']}]", flush=True)
+                elif event["type"] == "tool_end":
+                    print(f"[工具完成: {event['name']}]", flush=True)
+                elif event["type"] == "final" and event.get("cached"):
+                    # 命中语义缓存时没有逐token输出，直接打印完整回答
+                    print(event["content"], end="", flush=True)
+                elif event["type"] == "error":
+                    print(event["content"], flush=True)
+            print()
+
+        except Exception as e:
+            logger.error(f"对话处理失败: {e}")
+
 def main():
     try:
         # 初始化智能体
         agent = WaterAgent()
+        logger.info(format_startup_report())
         logger.info("开始对话 (输入 'quit' 或 'exit' 退出)")
         logger.info("-" * 50)
-        
-        # 对话循环
-        while True:
-            try:
-                user_input = input("\n用户: ").strip()
-                # 退出命令
-                if user_input.lower() in ['quit', 'exit', '退出', 'q']:
-                    logger.info("再见！")
-                    break
-                # 空输入跳过
-                if not user_input:
-                    continue
-                # 获取智能体响应
-                response = agent.chat(user_input)
-                # print(f"\n智能体: {response}")
-                
-            except KeyboardInterrupt:
-                logger.info("用户中断，再见！")
-                break
-            except Exception as e:
-                logger.error(f"对话处理失败: {e}")
-        
+
+        if agent.enable_streaming:
+            asyncio.run(run_streaming(agent))
+        else:
+            run_blocking(agent)
+
+    except KeyboardInterrupt:
+        logger.info("用户中断，再见！")
     except ValueError as e:
         logger.error(f"智能体启动失败: {e}")
     except Exception as e:
         logger.error(f"系统错误: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
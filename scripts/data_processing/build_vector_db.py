@@ -1,57 +1,215 @@
 import os
+import sys
+import json
+import hashlib
+import argparse
+from contextlib import closing
+from datetime import datetime
 from tqdm import tqdm
 from pathlib import Path
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from document_processor import process_pdf
+from document_processor import iter_pdf_chunks, prefetch, CHUNK_SIZE, CHUNK_OVERLAP, SEPARATORS, CHUNKER_VERSION
+
+# 引用src中的检索组件
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.tools.lexical_index import BM25Index
+from src.tools.article_index import ArticleIndex
+from src.tools.embeddings import create_embeddings, embedding_model_id, vector_db_path
+from src.tools.numpy_store import DTYPES, STORE_DIR, write_numpy_store
+
+COLLECTION_NAME = "water_regulations"
+MANIFEST_NAME = "manifest.json"
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_id(doc, seen: dict) -> str:
+    # 以块内容哈希作为Chroma ID，内容相同的块按出现次序区分
+    content_hash = hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+    occurrence = seen.get(content_hash, 0)
+    seen[content_hash] = occurrence + 1
+    doc.metadata['content_hash'] = content_hash
+    return f"{content_hash[:32]}_{occurrence}"
+
+def iter_corpus_chunks(pdf_paths, args):
+    # 多个PDF统一编号，依次流式产出
+    next_id = 0
+    for pdf_path in pdf_paths:
+        for chunk in iter_pdf_chunks(str(pdf_path), chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                                     workers=args.workers, start_id=next_id):
+            next_id += 1
+            yield chunk
+
+def load_manifest(db_path: Path) -> dict:
+    manifest_path = db_path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(db_path: Path, manifest: dict):
+    with open(db_path / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="构建/增量更新水利法规向量数据库")
+    parser.add_argument("--full", action="store_true", help="忽略清单，强制全量重建")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBEDDING_BATCH_SIZE", "256")),
+                        help="向量化批大小")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--workers", type=int, default=None, help="PDF解析进程数，默认为CPU核数")
+    parser.add_argument("--queue-size", type=int, default=1024, help="分块与向量化之间的缓冲队列长度")
+    parser.add_argument("--db-path", default=None, help="向量库目录，默认为VECTOR_DB_PATH或models/vector_db")
+    parser.add_argument("--numpy-store", action="store_true",
+                        help="同时导出内存映射的NumPy精确检索库（VECTOR_STORE_BACKEND=numpy使用）")
+    parser.add_argument("--numpy-dtype", choices=DTYPES, default="float16", help="NumPy检索库的向量存储类型")
+    return parser.parse_args()
+
+def export_numpy_store(vectorstore, doc_ids, docs, db_path: Path, dtype: str, model_name: str, batch_size: int):
+    # 直接读取Chroma中已有的向量，按文档块顺序导出，无需重新向量化
+    vectors = {}
+    for i in range(0, len(doc_ids), batch_size):
+        batch = vectorstore._collection.get(ids=doc_ids[i:i+batch_size], include=["embeddings"])
+        vectors.update(zip(batch['ids'], batch['embeddings']))
+    write_numpy_store(
+        str(db_path / STORE_DIR),
+        [vectors[doc_id] for doc_id in doc_ids],
+        [doc.page_content for doc in docs],
+        [doc.metadata for doc in docs],
+        dtype=dtype,
+        embedding_model=model_name,
+    )
+
+def numpy_store_current(db_path: Path, dtype: str, model_name: str, chunks) -> bool:
+    info_path = db_path / STORE_DIR / "store.json"
+    if not info_path.exists():
+        return False
+    with open(info_path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    return info.get("dtype") == dtype and info.get("embedding_model") == model_name and info.get("count") == chunks
 
 def main():
+    args = parse_args()
     print("开始构建向量数据库...")
-    
-    # 处理PDF文档
+
     project_root = Path(__file__).parent.parent.parent
-    pdf_path = project_root / "data/regulations/水利法律法规汇编（2023版）.pdf"
-    print("处理PDF文档...")
-    docs = process_pdf(str(pdf_path))
-    print(f"生成 {len(docs)} 个文档块")
-    
-    # 创建向量存储
-    print("创建向量存储...")
+    pdf_paths = sorted((project_root / "data/regulations").glob("*.pdf"))
+    db_path = Path(args.db_path) if args.db_path else vector_db_path()
+    db_path.mkdir(parents=True, exist_ok=True)
+    # 嵌入后端由EMBEDDING_BACKEND选择，模型标识写入清单，切换后端会触发全量重建
+    model_name = embedding_model_id()
+
+    # 模型或分块参数变化时必须全量重建
+    config = {
+        "embedding_model": model_name,
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "separators": SEPARATORS,
+        "chunker": CHUNKER_VERSION,
+    }
+    corpus = {path.name: file_sha256(path) for path in pdf_paths}
+    manifest = load_manifest(db_path)
+    full_rebuild = args.full or manifest.get("config") != config
+    if full_rebuild:
+        print("清单缺失或模型/分块参数已变化，执行全量重建")
+    elif manifest.get("corpus") == corpus and (db_path / "lexical_index.pkl").exists() \
+            and (db_path / "article_index.json").exists() \
+            and (not args.numpy_store or numpy_store_current(db_path, args.numpy_dtype, model_name, manifest.get("chunks"))):
+        print("语料与配置均未变化，向量数据库已是最新")
+        return
+
     # 初始化embedding模型
-    model_name = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-large-zh-v1.5")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
+    embeddings, _ = create_embeddings(batch_size=args.batch_size)
+    vectorstore = Chroma(
+        persist_directory=str(db_path),
+        embedding_function=embeddings,
+        collection_name=COLLECTION_NAME
     )
-    
-    # 创建向量数据库
-    Path('models').mkdir(exist_ok=True)
-    db_path = project_root / "models/vector_db"
-    print(f"正在向量化 {len(docs)} 个文档块...")
-    # 分批处理文档
-    batch_size = 10  # 每批处理10个文档
-    vectorstore = None
-
-    with tqdm(total=len(docs), desc="向量化进度", unit="块") as pbar:
-        for i in range(0, len(docs), batch_size):
-            batch_docs = docs[i:i+batch_size]
-            if vectorstore is None:
-                # 创建初始向量存储
-                vectorstore = Chroma.from_documents(
-                    documents=batch_docs,
-                    embedding=embeddings,
-                    persist_directory=str(db_path),
-                    collection_name="water_regulations"
-                )
+    if full_rebuild:
+        vectorstore.delete_collection()
+        vectorstore = Chroma(
+            persist_directory=str(db_path),
+            embedding_function=embeddings,
+            collection_name=COLLECTION_NAME
+        )
+
+    # 对比内容哈希：解析/分块在后台流水线进行，新增块攒满一批即向量化，保留块只更新元数据
+    existing_ids = set(vectorstore.get(include=[])['ids'])
+    docs, doc_ids, seen_ids, seen_hashes = [], [], set(), {}
+    added, kept = [], []
+    n_added = n_kept = 0
+
+    def flush_added():
+        vectorstore.add_documents([doc for _, doc in added], ids=[doc_id for doc_id, _ in added])
+        added.clear()
+
+    def flush_kept():
+        # 保留块的位置可能变化，仅更新元数据，不重新向量化
+        vectorstore._collection.update(
+            ids=[doc_id for doc_id, _ in kept],
+            metadatas=[doc.metadata for _, doc in kept]
+        )
+        kept.clear()
+
+    print("处理PDF文档并向量化...")
+    # 循环中出错时立即关闭预取线程与解析进程池，而不是等到回溯释放
+    with tqdm(desc="处理进度", unit="块") as pbar, \
+            closing(prefetch(iter_corpus_chunks(pdf_paths, args), maxsize=args.queue_size)) as chunks:
+        for doc in chunks:
+            doc_id = content_id(doc, seen_hashes)
+            docs.append(doc)
+            doc_ids.append(doc_id)
+            seen_ids.add(doc_id)
+            if doc_id in existing_ids:
+                kept.append((doc_id, doc))
+                n_kept += 1
+                if len(kept) >= args.batch_size:
+                    flush_kept()
             else:
-                # 添加文档到现有向量存储
-                vectorstore.add_documents(batch_docs)
-            
-            # 更新进度条
-            pbar.update(len(batch_docs))
-    
-    print("向量数据库创建完成")
+                added.append((doc_id, doc))
+                n_added += 1
+                if len(added) >= args.batch_size:
+                    flush_added()
+            pbar.update(1)
+        if added:
+            flush_added()
+        if kept:
+            flush_kept()
+
+    removed = sorted(existing_ids - seen_ids)
+    for i in range(0, len(removed), args.batch_size):
+        vectorstore.delete(ids=removed[i:i+args.batch_size])
+    print(f"生成 {len(docs)} 个文档块: 新增 {n_added}, 删除 {len(removed)}, 保留 {n_kept}")
+
+    print("向量数据库更新完成")
+
+    # 与向量库一同构建BM25倒排索引
+    print("构建BM25倒排索引...")
+    BM25Index().build(docs).save(str(db_path / "lexical_index.pkl"))
+    print("BM25倒排索引构建完成")
+
+    # (法律, 条) -> 条文 精确查找索引
+    article_index = ArticleIndex.from_chunks(docs)
+    article_index.save(str(db_path / "article_index.json"))
+    print(f"条文索引构建完成: {len(article_index.laws)} 部法规, {len(article_index)} 条")
+
+    if args.numpy_store:
+        print(f"导出NumPy精确检索库（{args.numpy_dtype}）...")
+        export_numpy_store(vectorstore, doc_ids, docs, db_path, args.numpy_dtype, model_name, args.batch_size)
+        print(f"NumPy检索库导出完成: {db_path / STORE_DIR}")
+
+    save_manifest(db_path, {
+        "config": config,
+        "corpus": corpus,
+        "chunks": len(docs),
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    print(f"清单已保存: {db_path / MANIFEST_NAME}")
 
 if __name__ == "__main__":
     main()
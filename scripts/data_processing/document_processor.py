@@ -1,10 +1,29 @@
+import os
 import re
+import sys
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
 
+# 引用src中的条款编号解析
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.tools.article_index import chinese_to_int
+
+# 默认分块参数（变更后build_vector_db.py会自动全量重建）
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", "。", "；", "，", " "]
+# 分块策略版本，写入向量库清单，变化时触发全量重建
+CHUNKER_VERSION = "article-v2"
+
+# 每个解析任务包含的页数
+PAGES_PER_TASK = 8
+
 def clean_text(text: str) -> str:
     # 移除多余空白
     text = re.sub(r'\s+', ' ', text)
@@ -12,32 +31,284 @@ def clean_text(text: str) -> str:
     text = re.sub(r'第\s*\d+\s*页|页\s*共\s*\d+', '', text)
     return text.strip()
 
-def process_pdf(pdf_path: str) -> List[Document]:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", "。", "；", "，", " "]
-    )
-    print(f"文档处理器初始化: chunk_size={1000}")
-    print(f"处理PDF: {pdf_path}")
-    
+# 解析进程内复用的PdfReader
+_reader = None
+
+def _init_parse_worker(pdf_path: str):
+    global _reader
+    from pypdf import PdfReader
+    _reader = PdfReader(pdf_path)
+
+def clean_lines(text: str) -> str:
+    # 逐行清理，保留换行以便识别法律标题、章、条等结构
+    lines = (clean_text(line) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def _parse_pages(start: int, end: int) -> List[Tuple[int, str]]:
+    # 在子进程中提取并清理一段页面的文本
+    return [(i, clean_lines(_reader.pages[i].extract_text() or "")) for i in range(start, end)]
+
+_NUMERAL = r'[零〇一二两三四五六七八九十百千\d]+'
+_ARTICLE_RE = re.compile(rf'^第\s*({_NUMERAL})\s*条')
+_CHAPTER_RE = re.compile(rf'^第\s*({_NUMERAL})\s*章')
+_TITLE_RE = re.compile(r'^[\u4e00-\u9fff（）()、]{2,40}(法|条例|规定|办法|细则|决定|规则)$')
+# 过长标题折行后的前半行
+_TITLE_FRAGMENT_RE = re.compile(r'^[\u4e00-\u9fff（）()、]{2,38}$')
+# 标题后的"（2016年修订）"等注记
+_TITLE_NOTE_RE = re.compile(r'[（(][^（）()]*[）)]$')
+# 条款编号重新从1开始时，向前查找未识别标题的最大行数
+TITLE_LOOKBACK = 6
+
+def as_title(text: str) -> Optional[str]:
+    # 法律标题返回标题本身（去掉末尾注记），否则返回None
+    if _TITLE_RE.match(text):
+        return text
+    stripped = _TITLE_NOTE_RE.sub('', text)
+    return stripped if stripped != text and _TITLE_RE.match(stripped) else None
+
+def _joined_title(first: str, second: str) -> Optional[str]:
+    # 折成两行的标题：前半行本身不是标题，拼接后才是
+    if _TITLE_FRAGMENT_RE.match(first) and not as_title(first):
+        return as_title(first + second)
+    return None
+
+class ArticleSplitter:
+    """按法律标题、章、第X条边界切分，跨页保持状态，写入law_name/chapter/article_no元数据"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        # 非条文内容（标题、目录、序言等）按窗口切分
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=SEPARATORS
+        )
+        # 超长条文按句切分且不重叠，便于条文索引按序拼回全文
+        self.article_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=0, separators=SEPARATORS
+        )
+        self.law_name = ""
+        self.chapter = ""
+        self.candidate_title = None  # (标题, 占用行数)
+        self.article = None  # (article_no, article_num)
+        self.last_article_num = 0
+        self.lines: List[str] = []
+        self.metadata = {}
+
+    def _flush(self) -> List[Document]:
+        if not self.lines:
+            return []
+        text = clean_text(" ".join(self.lines))
+        self.lines = []
+        metadata = dict(self.metadata, law_name=self.law_name, chapter=self.chapter)
+        if self.article:
+            metadata['article_no'], metadata['article_num'] = self.article
+            splitter = self.article_splitter
+        else:
+            metadata['article_no'] = ""
+            splitter = self.text_splitter
+        return splitter.split_documents([Document(page_content=text, metadata=metadata)])
+
+    def _confirms_title(self, line: str) -> bool:
+        # 标题后紧跟通过/修订日期、目录或第一章/第一条时才确认为法律标题
+        return (line[0] in "（(" and "年" in line) or line == "目录" or line.startswith(("第一章", "第一条"))
+
+    def _start_law(self, law_name: str, header: List[str], page_doc: Document) -> List[Document]:
+        # 新法律开始：上一条/上一段结束，标题等行作为新法律的开头
+        chunks = self._flush()
+        self.law_name, self.chapter, self.article = law_name, "", None
+        self.last_article_num = 0
+        self.metadata = dict(page_doc.metadata)
+        self.lines = header
+        return chunks
+
+    def _pop_lines(self, n: int) -> List[str]:
+        if n <= 0:
+            return []
+        popped = self.lines[-n:]
+        del self.lines[-n:]
+        return popped
+
+    def _title_of(self, line: str) -> Optional[Tuple[str, int]]:
+        # 返回(标题, 占用行数)，过长标题折成两行时与上一行拼接后再匹配
+        if self.lines:
+            joined = _joined_title(self.lines[-1], line)
+            if joined:
+                return joined, 2
+        title = as_title(line)
+        return (title, 1) if title else None
+
+    def _find_title(self) -> Optional[Tuple[str, int]]:
+        # 在缓冲的最后几行中向前查找未被确认的标题，返回(标题, 起始行)；第0行是上一条的开头，不参与查找
+        for i in range(len(self.lines) - 1, max(len(self.lines) - 1 - TITLE_LOOKBACK, 0), -1):
+            if i > 1:
+                joined = _joined_title(self.lines[i - 1], self.lines[i])
+                if joined:
+                    return joined, i - 1
+            title = as_title(self.lines[i])
+            if title:
+                return title, i
+        return None
+
+    def _restart(self, page_doc: Document, found: Optional[Tuple[str, int]]) -> List[Document]:
+        # 编号重新从1开始而之前没有确认新标题：这是另一部法律，绝不并入上一部。
+        # 找不到标题时法律名称留空（不进入条文索引），宁缺勿错
+        if found is None:
+            print(f"警告: 第{page_doc.metadata.get('page')}页条款编号重新从1开始，但未识别到法律标题"
+                  f"（上一部: {self.law_name}）")
+            return self._start_law("", [], page_doc)
+        title, start = found
+        header = self.lines[start:]
+        del self.lines[start:]
+        return self._start_law(title, header, page_doc)
+
+    def feed(self, page_doc: Document) -> List[Document]:
+        chunks = []
+        for line in page_doc.page_content.split("\n"):
+            if self.candidate_title and self._confirms_title(line):
+                # 新法律开始：标题行移出上一段
+                title, n = self.candidate_title
+                chunks.extend(self._start_law(title, self._pop_lines(n), page_doc))
+            self.candidate_title = None
+
+            article_match = _ARTICLE_RE.match(line)
+            number = chinese_to_int(article_match.group(1)) if article_match else None
+            chapter_match = _CHAPTER_RE.match(line)
+            # 只接受连续编号（或新法律的第一条），避免把换行后以"第X条规定"开头的正文误判为新条文
+            is_article = number is not None and number in (1, self.last_article_num + 1)
+            if is_article and number == 1 and self.last_article_num > 0:
+                # 编号重新从1开始：找到标题，或"第一条"后是空白（真正的条文标题）时才是新法律，
+                # 否则是"本法第一条规定的……"这类折行正文
+                found = self._find_title()
+                rest = line[article_match.end():]
+                is_article = found is not None or not rest or rest[0].isspace()
+                if is_article:
+                    chunks.extend(self._restart(page_doc, found))
+            if is_article:
+                chunks.extend(self._flush())
+                self.article = (f"第{article_match.group(1)}条", number)
+                self.last_article_num = number
+                self.metadata = dict(page_doc.metadata)
+            elif chapter_match:
+                # 已有条文后又出现第一章：找到标题时在此处开始新法律，否则留给随后的第一条处理
+                if chinese_to_int(chapter_match.group(1)) == 1 and self.last_article_num > 0:
+                    found = self._find_title()
+                    if found:
+                        chunks.extend(self._restart(page_doc, found))
+                chunks.extend(self._flush())
+                self.chapter, self.article = line, None
+                self.metadata = dict(page_doc.metadata)
+            else:
+                title = self._title_of(line)
+                if title and title[0].startswith("中华人民共和国"):
+                    chunks.extend(self._start_law(title[0], self._pop_lines(title[1] - 1), page_doc))
+                elif title:
+                    self.candidate_title = title
+            if not self.metadata:
+                self.metadata = dict(page_doc.metadata)
+            self.lines.append(line)
+        return chunks
+
+    def finish(self) -> List[Document]:
+        return self._flush()
+
+def iter_pdf_pages(pdf_path: str, workers: Optional[int] = None, max_pending: Optional[int] = None) -> Iterator[Document]:
+    # 进程池并行解析+清理，按页序流式产出非空页面；在途任务数有上限，内存占用与PDF大小无关
+    from pypdf import PdfReader
     if not Path(pdf_path).exists():
-        raise FileNotFoundError(f"文件不存在: {pdf_path}")     
-    # 加载PDF
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-    print(f"加载 {len(documents)} 页")
-    # 清理文本
-    for doc in documents:
-        doc.page_content = clean_text(doc.page_content)
-    # 过滤空页面
-    documents = [doc for doc in documents if doc.page_content.strip()]
-    # 分块
-    chunks = text_splitter.split_documents(documents)
-    # 添加ID
-    for i, chunk in enumerate(chunks):
-        chunk.metadata['chunk_id'] = f"chunk_{i:06d}"
-    
+        raise FileNotFoundError(f"文件不存在: {pdf_path}")
+    total_pages = len(PdfReader(pdf_path).pages)
+    workers = workers or int(os.getenv("PDF_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    print(f"加载 {total_pages} 页（{workers} 个解析进程）")
+
+    ranges = iter([(start, min(start + PAGES_PER_TASK, total_pages))
+                   for start in range(0, total_pages, PAGES_PER_TASK)])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(pdf_path,)) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_parse_pages, start, end))
+            if len(pending) >= max_pending:
+                break
+        try:
+            while pending:
+                pages = pending.popleft().result()
+                # 取走一个结果后补充一个任务
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append(pool.submit(_parse_pages, *next_range))
+                for page, text in pages:
+                    # 过滤空页面
+                    if text:
+                        yield Document(page_content=text, metadata={'source': pdf_path, 'page': page})
+        finally:
+            # 下游提前关闭时取消尚未开始的任务，进程池随即关闭
+            for future in pending:
+                future.cancel()
+
+def iter_pdf_chunks(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    workers: Optional[int] = None, start_id: int = 0) -> Iterator[Document]:
+    # 流式分块：页面解析完成即按条文结构切分产出，下游无需等待整本PDF
+    splitter = ArticleSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    print(f"文档处理器初始化: chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+    print(f"处理PDF: {pdf_path}")
+
+    def _pages_and_tail():
+        for page_doc in iter_pdf_pages(pdf_path, workers=workers):
+            yield splitter.feed(page_doc)
+        yield splitter.finish()
+
+    chunk_index = start_id
+    for chunks in _pages_and_tail():
+        for chunk in chunks:
+            # 添加ID
+            chunk.metadata['chunk_id'] = f"chunk_{chunk_index:06d}"
+            chunk_index += 1
+            yield chunk
+
+def prefetch(items: Iterable, maxsize: int = 256) -> Iterator:
+    # 在后台线程中消费上游生成器，经有界队列交给下游（如向量化），使解析与向量化重叠进行
+    buffer: "queue.Queue" = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+    errors = []
+
+    def _put(item) -> bool:
+        # 下游提前退出（异常或break）后不再阻塞在已满的队列上
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in items:
+                if not _put(item):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # 关闭上游生成器，使其中的进程池等资源随之释放
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            _put(done)
+
+    producer = threading.Thread(target=_produce, name="ingest-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+    if errors:
+        raise errors[0]
+
+def process_pdf(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    chunks = list(iter_pdf_chunks(pdf_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
     print(f"生成 {len(chunks)} 个文档块")
     return chunks
-
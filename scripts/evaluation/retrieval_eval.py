@@ -0,0 +1,277 @@
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import itertools
+import numpy as np
+from pathlib import Path
+
+# 引用src与数据处理脚本中的组件
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts/data_processing"))
+from document_processor import process_pdf
+from src.tools.article_index import ArticleIndex, parse_article_number
+from src.tools.embedding_cache import CachedEmbeddings
+from src.tools.embeddings import create_embeddings
+from src.tools.lexical_index import BM25Index
+from src.tools.numpy_store import NumpyVectorStore, write_numpy_store
+from src.tools.vector_search import VectorSearchTool
+
+COLLECTION_NAME = "water_regulations"
+ADD_BATCH_SIZE = 4096
+
+def parse_int_list(text: str):
+    return [int(value) for value in text.split(",") if value]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="检索质量与延迟评测：在分块与HNSW参数网格上比较recall@k、MRR与单次查询延迟")
+    parser.add_argument("--labels", default=None,
+                        help='标注集JSONL，每行 {"question": ..., "law_name": ..., "article": "第十二条"}')
+    parser.add_argument("--synthetic", type=int, default=200,
+                        help="未提供标注集时，从条文中随机截取片段作为问题的样本数")
+    parser.add_argument("--chunk-sizes", default="1000", help="分块大小，逗号分隔")
+    parser.add_argument("--chunk-overlaps", default="200", help="分块重叠，逗号分隔")
+    parser.add_argument("--ks", default="1,3,5,10", help="评测的k值，逗号分隔")
+    parser.add_argument("--modes", default="vector,hybrid,lexical", help="检索模式，逗号分隔")
+    parser.add_argument("--hnsw-m", default="16", help="HNSW M，逗号分隔")
+    parser.add_argument("--hnsw-ef-construction", default="100", help="HNSW ef_construction，逗号分隔")
+    parser.add_argument("--hnsw-ef-search", default="10,50,100", help="HNSW ef_search，逗号分隔")
+    parser.add_argument("--numpy-dtypes", default="float32,float16,int8",
+                        help="评测的NumPy精确检索库存储类型，逗号分隔，留空则跳过")
+    parser.add_argument("--target-recall", type=float, default=0.9, help="推荐配置需达到的recall@k")
+    parser.add_argument("--output", default="models/retrieval_eval.json", help="结果JSON路径")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def load_labels(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def synthetic_labels(article_index: ArticleIndex, n: int, seed: int):
+    # 从条文正文随机截取片段作为问题，评测"按原文片段找回条文"的能力
+    rng = random.Random(seed)
+    entries = [(law, num, entry) for law, articles in article_index.laws.items()
+               for num, entry in articles.items() if len(entry['content']) >= 60]
+    labels = []
+    for law, num, entry in rng.sample(entries, min(n, len(entries))):
+        body = entry['content'].split('条', 1)[-1].strip()
+        length = rng.randint(20, 40)
+        start = rng.randint(0, max(0, len(body) - length))
+        labels.append({"question": body[start:start + length], "law_name": law, "article": num})
+    return labels
+
+def resolve_targets(labels, article_index: ArticleIndex):
+    # 标注中的法律简称解析为语料中的规范名称；无法解析的标注跳过
+    targets = []
+    for label in labels:
+        law = article_index.resolve_law(label["law_name"])
+        if law is None:
+            print(f"  跳过无法匹配的标注: {label['law_name']} {label['article']}")
+            continue
+        targets.append((label["question"], (law, parse_article_number(label["article"]))))
+    return targets
+
+def is_relevant(metadata: dict, target) -> bool:
+    return (metadata.get("law_name"), metadata.get("article_num")) == target
+
+def score(results_per_query, targets, k: int):
+    # recall@k: 前k个结果中包含目标条文的比例；MRR: 目标条文首次出现排名的倒数均值
+    hits, reciprocal = 0, 0.0
+    for results, (_, target) in zip(results_per_query, targets):
+        for rank, metadata in enumerate(results[:k], 1):
+            if is_relevant(metadata, target):
+                hits += 1
+                reciprocal += 1 / rank
+                break
+    return hits / len(targets), reciprocal / len(targets)
+
+def latency_stats(latencies):
+    ordered = sorted(latencies)
+    return {"p50_ms": ordered[len(ordered) // 2] * 1000,
+            "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000}
+
+def build_index(db_path: Path, docs, vectors, m: int, ef_construction: int, ef_search: int) -> float:
+    from langchain_community.vectorstores import Chroma
+    start = time.perf_counter()
+    store = Chroma(
+        persist_directory=str(db_path),
+        collection_name=COLLECTION_NAME,
+        collection_metadata={"hnsw:M": m, "hnsw:construction_ef": ef_construction, "hnsw:search_ef": ef_search},
+    )
+    # 复用预先计算的文档向量，不同HNSW参数之间无需重复向量化
+    for i in range(0, len(docs), ADD_BATCH_SIZE):
+        batch = docs[i:i + ADD_BATCH_SIZE]
+        store._collection.add(
+            ids=[f"chunk_{i + j}" for j in range(len(batch))],
+            embeddings=vectors[i:i + ADD_BATCH_SIZE].tolist(),
+            metadatas=[doc.metadata for doc in batch],
+            documents=[doc.page_content for doc in batch],
+        )
+    return time.perf_counter() - start
+
+def run_search(tool: VectorSearchTool, targets, k: int, mode: str):
+    # 先预热一遍（查询向量进入缓存），再计时，延迟只反映索引与融合开销
+    for question, _ in targets:
+        tool.search(question, k=k, mode=mode)
+    results, latencies = [], []
+    for question, _ in targets:
+        start = time.perf_counter()
+        hits = tool.search(question, k=k, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit['metadata'] for hit in hits])
+    return results, latencies
+
+def exact_search(doc_matrix: np.ndarray, query_matrix: np.ndarray, k: int):
+    # 暴力精确检索基线：向量已归一化，内积排序与L2距离排序一致
+    top, latencies = [], []
+    for query in query_matrix:
+        start = time.perf_counter()
+        scores = doc_matrix @ query
+        idx = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        top.append(idx[np.argsort(-scores[idx])])
+        latencies.append(time.perf_counter() - start)
+    return top, latencies
+
+def run_numpy_store(store: NumpyVectorStore, query_matrix: np.ndarray, k: int):
+    # 逐条查询测单次延迟，再一次矩阵乘法完成全部查询，得到批量摊薄后的单条耗时
+    results, latencies = [], []
+    for query in query_matrix:
+        start = time.perf_counter()
+        hits = store.search(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit['metadata'] for hit in hits])
+    start = time.perf_counter()
+    store.search_batch(query_matrix, k=k)
+    batch_ms = (time.perf_counter() - start) / len(query_matrix) * 1000
+    return results, latencies, batch_ms
+
+def main():
+    args = parse_args()
+    ks, modes = parse_int_list(args.ks), [mode for mode in args.modes.split(",") if mode]
+    max_k = max(ks)
+    pdf_paths = sorted((PROJECT_ROOT / "data/regulations").glob("*.pdf"))
+
+    print("加载嵌入模型...")
+    base_embeddings, model_name = create_embeddings()
+    embeddings = CachedEmbeddings(base_embeddings, model_name=model_name, max_entries=100000)
+    print(f"嵌入模型: {model_name}")
+
+    rows = []
+    labels = load_labels(args.labels) if args.labels else None
+    for chunk_size, chunk_overlap in itertools.product(parse_int_list(args.chunk_sizes), parse_int_list(args.chunk_overlaps)):
+        if chunk_overlap >= chunk_size:
+            continue
+        print(f"\n分块 size={chunk_size} overlap={chunk_overlap}")
+        docs = [doc for path in pdf_paths for doc in process_pdf(str(path), chunk_size, chunk_overlap)]
+        article_index = ArticleIndex.from_chunks(docs)
+        if labels is None:
+            # 合成问题只生成一次，各分块配置使用同一问题集
+            labels = synthetic_labels(article_index, args.synthetic, args.seed)
+        targets = resolve_targets(labels, article_index)
+        print(f"  文档块: {len(docs)}, 评测问题: {len(targets)}")
+        if not targets:
+            continue
+
+        start = time.perf_counter()
+        doc_matrix = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        embed_docs_s = time.perf_counter() - start
+        query_matrix = np.asarray([embeddings.embed_query(question) for question, _ in targets], dtype=np.float32)
+        # 查询向量化耗时绕过缓存单独测量
+        sample = [question for question, _ in targets[:50]]
+        start = time.perf_counter()
+        for question in sample:
+            base_embeddings.embed_query(question)
+        embed_query_ms = (time.perf_counter() - start) / len(sample) * 1000
+        print(f"  文档向量化 {embed_docs_s:.1f}s, 查询向量化 {embed_query_ms:.2f}ms/次")
+
+        base = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "chunks": len(docs),
+                "questions": len(targets), "embed_query_ms": embed_query_ms}
+
+        # 暴力精确检索基线
+        exact_top, exact_latencies = exact_search(doc_matrix, query_matrix, max_k)
+        exact_results = [[docs[i].metadata for i in idx] for idx in exact_top]
+        exact_ids = [[docs[i].metadata.get("chunk_id") for i in idx] for idx in exact_top]
+        for k in ks:
+            recall, mrr = score(exact_results, targets, k)
+            rows.append({**base, "index": "exact", "mode": "vector", "k": k, "recall": recall, "mrr": mrr,
+                         **latency_stats(exact_latencies)})
+
+        for dtype in [value for value in args.numpy_dtypes.split(",") if value]:
+            store_path = Path(tempfile.mkdtemp(prefix="retrieval_eval_numpy_"))
+            try:
+                write_numpy_store(str(store_path), doc_matrix, [doc.page_content for doc in docs],
+                                  [doc.metadata for doc in docs], dtype=dtype)
+                results, latencies, batch_ms = run_numpy_store(NumpyVectorStore(str(store_path)), query_matrix, max_k)
+            finally:
+                shutil.rmtree(store_path, ignore_errors=True)
+            for k in ks:
+                recall, mrr = score(results, targets, k)
+                overlap = [len({metadata.get("chunk_id") for metadata in result[:k]} & set(ids[:k])) / k
+                           for result, ids in zip(results, exact_ids)]
+                row = {**base, "index": f"numpy({dtype})", "mode": "vector", "k": k, "recall": recall, "mrr": mrr,
+                       "ann_recall": sum(overlap) / len(overlap), "batch_ms_per_query": batch_ms, **latency_stats(latencies)}
+                rows.append(row)
+                print(f"  {row['index']:<28} vector   k={k:<3} recall={recall:.3f} mrr={mrr:.3f} "
+                      f"p50={row['p50_ms']:.3f}ms batch={batch_ms:.3f}ms/条 ann_recall={row['ann_recall']:.3f}")
+
+        lexical_path = None
+        lexical_done = False
+        for m, ef_construction, ef_search in itertools.product(
+                parse_int_list(args.hnsw_m), parse_int_list(args.hnsw_ef_construction), parse_int_list(args.hnsw_ef_search)):
+            db_path = Path(tempfile.mkdtemp(prefix="retrieval_eval_"))
+            try:
+                build_s = build_index(db_path, docs, doc_matrix, m, ef_construction, ef_search)
+                # BM25索引与分块参数相关，同一分块下只构建一次
+                if lexical_path is None:
+                    lexical_path = db_path.parent / f"{db_path.name}_lexical.pkl"
+                    BM25Index().build(docs).save(str(lexical_path))
+                shutil.copy(lexical_path, db_path / "lexical_index.pkl")
+                tool = VectorSearchTool(db_path=str(db_path), embeddings=embeddings)
+                index = f"hnsw(M={m},efc={ef_construction},efs={ef_search})"
+                for mode in modes:
+                    # 纯BM25与HNSW参数无关，只评测一次
+                    if mode == "lexical":
+                        if lexical_done:
+                            continue
+                        lexical_done = True
+                    for k in ks:
+                        results, latencies = run_search(tool, targets, k, mode)
+                        recall, mrr = score(results, targets, k)
+                        row = {**base, "index": "bm25" if mode == "lexical" else index, "mode": mode, "k": k,
+                               "recall": recall, "mrr": mrr, "build_s": build_s, **latency_stats(latencies)}
+                        if mode == "vector":
+                            # 近似检索相对精确检索的召回率
+                            overlap = [len({hit.get("chunk_id") for hit in result} & set(ids[:k])) / k
+                                       for result, ids in zip(results, exact_ids)]
+                            row["ann_recall"] = sum(overlap) / len(overlap)
+                        rows.append(row)
+                        print(f"  {row['index']:<28} {mode:<8} k={k:<3} recall={recall:.3f} mrr={mrr:.3f} "
+                              f"p50={row['p50_ms']:.2f}ms" + (f" ann_recall={row['ann_recall']:.3f}" if "ann_recall" in row else ""))
+            finally:
+                shutil.rmtree(db_path, ignore_errors=True)
+        if lexical_path is not None:
+            lexical_path.unlink(missing_ok=True)
+
+    output = PROJECT_ROOT / args.output
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    # 每个k下达到目标召回率的最快配置
+    print(f"\n推荐配置（recall@k >= {args.target_recall}，按p50延迟最小）:")
+    for k in ks:
+        candidates = [row for row in rows if row["k"] == k and row["index"] != "exact" and row["recall"] >= args.target_recall]
+        if not candidates:
+            print(f"  k={k}: 无配置达到目标召回率")
+            continue
+        best = min(candidates, key=lambda row: row["p50_ms"])
+        print(f"  k={k}: size={best['chunk_size']} overlap={best['chunk_overlap']} {best['index']} {best['mode']} "
+              f"recall={best['recall']:.3f} mrr={best['mrr']:.3f} p50={best['p50_ms']:.2f}ms")
+
+if __name__ == "__main__":
+    main()
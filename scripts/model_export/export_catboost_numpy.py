@@ -0,0 +1,120 @@
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+# 引用src中的NumPy求值器
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from src.tools.catboost_numpy import CatBoostNumpyModel, convert_model_json, model_json
+
+MODEL_PATH = PROJECT_ROOT / "models/catboost_models/catboost_water_quality.cbm"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="把CatBoost对称树模型导出为NumPy数组（.npz），并检查与predict_proba的一致性")
+    parser.add_argument("--model", default=str(MODEL_PATH))
+    parser.add_argument("--output", default=None, help="默认与模型同目录的 .npz")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="允许的最大概率误差")
+    return parser.parse_args()
+
+def model_borders(model) -> dict:
+    # 每个特征的全部分裂阈值
+    return {feature["flat_feature_index"]: feature.get("borders", [])
+            for feature in model_json(model)["features_info"]["float_features"]}
+
+def export(model, output: Path, feature_names):
+    arrays = convert_model_json(model_json(model), feature_names)
+    np.savez(output, **arrays)
+    n_trees, depth = arrays["split_feature"].shape
+    print(f"已导出: {output}（{n_trees} 棵树, 深度 {depth}, {output.stat().st_size / 1024:.1f} KB）")
+
+def load_reference_rows(n_features: int):
+    # 训练数据集中的真实样本，不存在时返回None
+    df_path = PROJECT_ROOT / "data/water_potability.csv"
+    if not df_path.exists():
+        return None
+    import pandas as pd
+    return pd.read_csv(df_path).drop(columns="Potability", errors="ignore").to_numpy(dtype=float)[:, :n_features]
+
+def parity_samples(borders: dict, n_features: int, rng: np.random.Generator, reference=None) -> np.ndarray:
+    # 真实数据、随机缺失、恰好等于阈值（检验严格大于）与极端值
+    rows = []
+    if reference is not None:
+        rows.append(reference)
+        masked = reference.copy()
+        masked[rng.random(masked.shape) < 0.3] = np.nan
+        rows.append(masked)
+        base = reference[rng.integers(0, len(reference), size=2000)]
+    else:
+        # 没有真实数据时在阈值覆盖的范围内（两端各放宽10%）均匀采样，使各分裂两侧都被覆盖；
+        # 忽略缺失值处理为Min时CatBoost加入的 -FLT_MAX 阈值
+        base = rng.normal(size=(2000, n_features))
+        for feature, values in borders.items():
+            values = [value for value in values if abs(value) < np.finfo(np.float32).max]
+            if values:
+                low, high = min(values), max(values)
+                margin = 0.1 * (high - low) or 1.0
+                base[:, feature] = rng.uniform(low - margin, high + margin, size=len(base))
+    at_border = base.copy()
+    for feature, values in borders.items():
+        if values:
+            at_border[:, feature] = rng.choice(values, size=len(at_border))
+    rows.append(at_border)
+    extreme = base.copy()
+    extreme[rng.random(extreme.shape) < 0.2] = 1e12
+    extreme[rng.random(extreme.shape) < 0.2] = -1e12
+    rows.append(extreme)
+    rows.append(np.full((1, n_features), np.nan))
+    return np.vstack(rows)
+
+def parity_error(model, numpy_model: CatBoostNumpyModel, x: np.ndarray):
+    """与CatBoostClassifier.predict_proba逐行比较正类概率，返回(最大概率误差, 类别不一致数)"""
+    expected = model.predict_proba(x)[:, 1]
+    actual = numpy_model.predict_proba(x)[:, 1]
+    return float(np.max(np.abs(expected - actual))), int(np.sum((expected > 0.5) != (actual > 0.5)))
+
+def latency_us(fn, x: np.ndarray, repeat: int) -> float:
+    fn(x)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(x)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def test_parity(model, npz_path: Path, tolerance: float) -> bool:
+    """与CatBoostClassifier.predict_proba逐行比较正类概率"""
+    print("\n一致性检查（与CatBoost predict_proba对比）...")
+    numpy_model = CatBoostNumpyModel(str(npz_path))
+    n_features = len(numpy_model.feature_names)
+    x = parity_samples(model_borders(model), n_features, np.random.default_rng(0), load_reference_rows(n_features))
+    max_error, label_mismatch = parity_error(model, numpy_model, x)
+    passed = max_error <= tolerance and label_mismatch == 0
+    print(f"  样本数 {len(x)}, 最大概率误差 {max_error:.2e}, 类别不一致 {label_mismatch} 个 {'通过' if passed else '未通过'}")
+
+    for rows, repeat in ((1, 2000), (1000, 200), (100000, 3)):
+        batch = x[np.arange(rows) % len(x)]
+        catboost_us = latency_us(model.predict_proba, batch, repeat)
+        numpy_us = latency_us(numpy_model.predict_proba, batch, repeat)
+        print(f"  {rows:>6} 行: CatBoost {catboost_us:>10.1f} µs, NumPy {numpy_us:>10.1f} µs（{catboost_us / numpy_us:.1f}x）")
+    return passed
+
+def main():
+    from catboost import CatBoostClassifier
+    args = parse_args()
+    model_path = Path(args.model)
+    output = Path(args.output) if args.output else model_path.with_suffix(".npz")
+    model = CatBoostClassifier()
+    model.load_model(str(model_path))
+    features_path = model_path.parent / "features.txt"
+    if features_path.exists():
+        feature_names = [line.strip() for line in features_path.read_text(encoding='utf-8').splitlines() if line.strip()]
+    else:
+        feature_names = list(model.feature_names_)
+    export(model, output, feature_names)
+    if not test_parity(model, output, args.tolerance):
+        print("\n一致性检查未通过，请勿使用NumPy后端")
+        sys.exit(1)
+    print("\n一致性检查通过。启用方式: WATER_MODEL_BACKEND=numpy")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+# 引用src中的嵌入组件
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from src.tools.embeddings import DEFAULT_MODEL_NAME, OnnxEmbeddings
+
+# 一致性检查使用的样本：短查询与法规长文本
+PARITY_TEXTS = [
+    "取水许可",
+    "水资源属于国家所有吗？",
+    "河道管理范围内禁止哪些行为",
+    "防洪工作实行全面规划、统筹兼顾、预防为主、综合治理、局部利益服从全局利益的原则。",
+    "国家对水资源依法实行取水许可制度和有偿使用制度。但是，农村集体经济组织及其成员使用本集体经济组织的"
+    "水塘、水库中的水除外。国务院水行政主管部门负责全国取水许可制度和水资源有偿使用制度的组织实施。",
+    "在江河、湖泊新建、改建或者扩大排污口，应当经过有管辖权的水行政主管部门或者流域管理机构同意，"
+    "由环境保护行政主管部门负责对该建设项目的环境影响报告书进行审批。" * 3,
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="导出BGE嵌入模型为ONNX并进行int8动态量化，检查与PyTorch嵌入的一致性")
+    parser.add_argument("--model-name", default=os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_MODEL_NAME))
+    parser.add_argument("--output-dir", default=None, help="默认 models/onnx/<模型名>")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", "0")),
+                        help="一致性检查与测速使用的ONNX线程数，0为默认")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="int8模型与PyTorch嵌入的最低余弦相似度")
+    parser.add_argument("--skip-export", action="store_true", help="跳过导出，只做一致性检查")
+    return parser.parse_args()
+
+def export_onnx(model_name: str, output_dir: Path, opset: int):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    print(f"导出ONNX模型: {model_name}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    inputs = tokenizer(["导出样例"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(inputs[name] for name in input_names), str(output_dir / "model.onnx"),
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True,
+        )
+    # 保存快速分词器（tokenizer.json），推理时只依赖tokenizers库
+    tokenizer.save_pretrained(str(output_dir))
+    print(f"ONNX模型已保存: {output_dir / 'model.onnx'}")
+
+def quantize(output_dir: Path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    print("int8动态量化...")
+    quantize_dynamic(str(output_dir / "model.onnx"), str(output_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    for name in ("model.onnx", "model.int8.onnx"):
+        print(f"  {name}: {(output_dir / name).stat().st_size / 1024 / 1024:.1f} MB")
+
+def query_latency_ms(embeddings, texts, repeat: int = 5) -> float:
+    embeddings.embed_query(texts[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            embeddings.embed_query(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1000
+
+def test_parity(model_name: str, output_dir: Path, threads: int, min_cosine: float) -> bool:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    print("\n一致性检查（与PyTorch嵌入对比）...")
+    reference = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'},
+                                      encode_kwargs={'normalize_embeddings': True})
+    expected = np.asarray(reference.embed_documents(PARITY_TEXTS))
+    torch_ms = query_latency_ms(reference, PARITY_TEXTS[:3])
+    print(f"  PyTorch 查询延迟: {torch_ms:.1f} ms")
+
+    passed = True
+    for quantized, threshold in ((False, 0.9999), (True, min_cosine)):
+        label = "int8" if quantized else "fp32"
+        engine = OnnxEmbeddings(str(output_dir), quantized=quantized, threads=threads)
+        actual = np.asarray(engine.embed_documents(PARITY_TEXTS))
+        cosine = np.sum(actual * expected, axis=1)
+        # 检索排序一致性：以每个文本为查询，比较对全部文本的相似度排序
+        same_order = np.mean(np.argsort(-(actual @ actual.T), axis=1) == np.argsort(-(expected @ expected.T), axis=1))
+        onnx_ms = query_latency_ms(engine, PARITY_TEXTS[:3])
+        ok = cosine.min() >= threshold
+        passed &= ok
+        print(f"  ONNX {label}: 最小余弦 {cosine.min():.5f}, 平均余弦 {cosine.mean():.5f}, 排序一致率 {same_order:.3f}, "
+              f"查询延迟 {onnx_ms:.1f} ms（{torch_ms / onnx_ms:.1f}x） {'通过' if ok else '未通过'}")
+    return passed
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_dir) if args.output_dir else PROJECT_ROOT / "models/onnx" / Path(args.model_name).name
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if not args.skip_export:
+        export_onnx(args.model_name, output_dir, args.opset)
+        quantize(output_dir)
+    if not test_parity(args.model_name, output_dir, args.threads, args.min_cosine):
+        print("\n一致性检查未通过，请勿切换到ONNX后端")
+        sys.exit(1)
+    print(f"\n一致性检查通过。启用方式: EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_DIR={output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,45 @@
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from catboost import CatBoostClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
 from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, classification_report
 
+DATA_PATH = 'data/water_potability.csv'
+
+def parse_args():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="训练CatBoost水质预测模型")
+    parser.add_argument("--search", choices=["halving", "grid"], default="halving",
+                        help="halving: 随机采样+逐次减半（默认，分钟级）；grid: 原81组合网格搜索")
+    parser.add_argument("--candidates", type=int, default=27, help="逐次减半的初始候选数")
+    parser.add_argument("--eta", type=int, default=3, help="每轮保留前1/eta的候选，迭代上限扩大eta倍")
+    parser.add_argument("--max-iterations", type=int, default=1000, help="最后一轮的迭代上限")
+    parser.add_argument("--early-stopping", type=int, default=50, help="每折验证集AUC不再提升的早停轮数")
+    parser.add_argument("--folds", type=int, default=5, help="交叉验证折数")
+    parser.add_argument("--cores", type=int, default=cores, help="可用CPU核数")
+    parser.add_argument("--jobs", type=int, default=None, help="并行训练数，默认为 核数//4")
+    parser.add_argument("--checkpoint", default="models/catboost_models/search_checkpoint.json",
+                        help="逐次减半的检查点文件")
+    parser.add_argument("--resume", action="store_true", help="从检查点继续未完成的搜索")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    # 显式划分核数：并行训练数 × 每次训练的线程数 不超过可用核数，避免超额订阅
+    args.jobs = max(1, min(args.jobs or args.cores // 4, args.cores))
+    args.threads = max(1, args.cores // args.jobs)
+    return args
+
 def load_and_preprocess_data():
     print("加载数据...")
-    df = pd.read_csv('data/water_potability.csv')
+    df = pd.read_csv(DATA_PATH)
     # 中位数填充空值
     df = df.fillna(df.median())
     # 设置X和Y
@@ -27,7 +60,7 @@ def split_data(x, y):
     print(f"训练集: {len(x_train)} | 测试集: {len(x_test)}")
     return x_train, x_test, y_train, y_test
 
-def grid_search_catboost(x_train, y_train):
+def grid_search_catboost(x_train, y_train, args):
     print("\n开始网格搜索...")
     
     # 定义参数网格
@@ -44,14 +77,15 @@ def grid_search_catboost(x_train, y_train):
         eval_metric='AUC',
         train_dir=None,  # 禁用训练日志目录
         allow_writing_files=False,  # 禁止写入文件
+        thread_count=args.threads,
     )
     # 网格搜索
     grid_search = GridSearchCV(
         base_model,
         param_grid,
-        cv=10,  # 10折交叉验证
+        cv=args.folds,
         scoring='roc_auc',
-        n_jobs=-1,
+        n_jobs=args.jobs,
         verbose=2  # 显示详细进度
     )
     
@@ -62,6 +96,115 @@ def grid_search_catboost(x_train, y_train):
     
     return grid_search.best_estimator_, grid_search.best_params_
 
+def sample_params(rng: random.Random) -> dict:
+    # 学习率与正则系数按对数均匀采样
+    return {
+        'learning_rate': round(math.exp(rng.uniform(math.log(0.01), math.log(0.3))), 5),
+        'depth': rng.randint(4, 8),
+        'l2_leaf_reg': round(math.exp(rng.uniform(math.log(1), math.log(10))), 4),
+        'random_strength': round(rng.uniform(0, 2), 4),
+        'bagging_temperature': round(rng.uniform(0, 1), 4),
+    }
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class SearchCheckpoint:
+    """逐次减半的检查点：记录搜索设置、候选参数与已完成的评估，中断后可继续"""
+
+    def __init__(self, path: str, settings: dict):
+        self.path = Path(path)
+        self.settings = settings
+        self.candidates = []
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('settings') != self.settings:
+            raise ValueError(f"检查点与当前数据或搜索设置不一致，请去掉--resume重新搜索: {self.path}")
+        self.candidates, self.results = state['candidates'], state['results']
+        print(f"从检查点继续: 已完成 {len(self.results)} 次评估")
+
+    def record(self, key: str, result: dict):
+        # 每完成一个候选即写盘，先写临时文件再替换，中断不会损坏检查点
+        with self._lock:
+            self.results[key] = result
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'settings': self.settings, 'candidates': self.candidates, 'results': self.results},
+                          f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+def cv_score(params: dict, iterations: int, folds, x_train, y_train, args):
+    # 每折以验证集AUC早停，返回平均最佳AUC与平均最佳迭代数
+    scores, best_iterations = [], []
+    for train_idx, valid_idx in folds:
+        model = CatBoostClassifier(
+            **params, iterations=iterations, eval_metric='AUC', random_seed=args.seed, verbose=False,
+            allow_writing_files=False, thread_count=args.threads,
+        )
+        model.fit(x_train.iloc[train_idx], y_train.iloc[train_idx],
+                  eval_set=(x_train.iloc[valid_idx], y_train.iloc[valid_idx]),
+                  early_stopping_rounds=args.early_stopping, use_best_model=True)
+        scores.append(model.get_best_score()['validation']['AUC'])
+        best_iterations.append(model.get_best_iteration() + 1)
+    return {'score': sum(scores) / len(scores), 'best_iteration': round(sum(best_iterations) / len(best_iterations)),
+            'fold_scores': scores}
+
+def halving_search_catboost(x_train, y_train, args):
+    print(f"\n开始逐次减半搜索: {args.candidates} 个候选, eta={args.eta}, {args.folds} 折, "
+          f"{args.jobs} 个并行训练 × 每个 {args.threads} 线程")
+    settings = {
+        'data_sha256': file_sha256(DATA_PATH), 'candidates': args.candidates, 'eta': args.eta,
+        'max_iterations': args.max_iterations, 'early_stopping': args.early_stopping,
+        'folds': args.folds, 'seed': args.seed,
+    }
+    checkpoint = SearchCheckpoint(args.checkpoint, settings)
+    if args.resume and checkpoint.path.exists():
+        checkpoint.load()
+    else:
+        rng = random.Random(args.seed)
+        checkpoint.candidates = [sample_params(rng) for _ in range(args.candidates)]
+    folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed).split(x_train, y_train))
+
+    # 每轮保留前1/eta，迭代上限扩大eta倍，最后一轮达到max_iterations
+    rungs = max(int(math.log(args.candidates, args.eta) + 1e-9), 0)
+    survivors = list(range(len(checkpoint.candidates)))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for rung in range(rungs + 1):
+            iterations = max(args.max_iterations // args.eta ** (rungs - rung), 1)
+            pending = [i for i in survivors if f"{rung}:{i}" not in checkpoint.results]
+            print(f"第{rung + 1}轮: {len(survivors)} 个候选, 迭代上限 {iterations}（待评估 {len(pending)}）")
+
+            def evaluate(i, rung=rung, iterations=iterations):
+                result = cv_score(checkpoint.candidates[i], iterations, folds, x_train, y_train, args)
+                checkpoint.record(f"{rung}:{i}", result)
+                print(f"  候选{i:>3} AUC={result['score']:.4f} 最佳迭代={result['best_iteration']} "
+                      f"{checkpoint.candidates[i]}")
+
+            # CatBoost训练时释放GIL，线程池即可并行，且无需复制数据到子进程
+            list(pool.map(evaluate, pending))
+            ranked = sorted(survivors, key=lambda i: checkpoint.results[f"{rung}:{i}"]['score'], reverse=True)
+            if rung < rungs:
+                survivors = ranked[:max(len(ranked) // args.eta, 1)]
+    best = ranked[0]
+    result = checkpoint.results[f"{rungs}:{best}"]
+    print(f"搜索完成，耗时 {time.perf_counter() - start:.1f}s")
+    print(f"最佳参数: {checkpoint.candidates[best]}")
+    print(f"最佳CV分数: {result['score']:.4f}")
+
+    # 以交叉验证的平均最佳迭代数在全部训练集上重新训练
+    best_params = dict(checkpoint.candidates[best], iterations=result['best_iteration'])
+    model = CatBoostClassifier(**best_params, eval_metric='AUC', random_seed=args.seed, verbose=False,
+                               allow_writing_files=False, thread_count=args.cores)
+    model.fit(x_train, y_train)
+    return model, best_params
+
 def evaluate_model(model, x_test, y_test):
     # 测试集评估
     test_pred = model.predict(x_test)
@@ -124,11 +267,15 @@ def test_model_loading():
     print(f"模型加载成功")
 
 def main():
+    args = parse_args()
     # 数据准备
     x, y = load_and_preprocess_data()
     x_train, x_test, y_train, y_test = split_data(x, y)  
-    # 网格搜索
-    best_model, best_params = grid_search_catboost(x_train, y_train) 
+    # 超参数搜索
+    if args.search == "grid":
+        best_model, best_params = grid_search_catboost(x_train, y_train, args)
+    else:
+        best_model, best_params = halving_search_catboost(x_train, y_train, args)
     # 模型评估
     results = evaluate_model(best_model, x_test, y_test)
     # 保存模型
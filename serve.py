@@ -0,0 +1,17 @@
+import asyncio
+from src.server.http_server import AgentServer
+from src.utils.logger import setup_logger
+
+logger = setup_logger("Serve")
+
+def main():
+    try:
+        server = AgentServer.from_env()
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        logger.info("服务已停止")
+    except ValueError as e:
+        logger.error(f"服务启动失败: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferWindowMemory
 from langchain.callbacks.base import BaseCallbackHandler
 from src.utils.logger import setup_logger
+from src.utils.lazy import timed
+from src.utils.tracing import TracingCallback, trace_span
 from src.agent.llm_manager import LLMManager
+from src.agent.memory import SQLiteSessionStore, create_memory, create_session_store
 from src.agent.tool_manager import ToolManager
+from src.agent.response_cache import SemanticResponseCache, ToolUsageTracker, is_context_dependent, CACHEABLE_TOOLS
+from src.tools.vector_search import search_tool
 
 logger = setup_logger("Agent")
 
@@ -15,11 +22,40 @@ class SimpleCallback(BaseCallbackHandler):
     def on_tool_end(self, output, **kwargs):
         logger.info(f"工具输出: {output[:100]}...")
 
+def _mark_cached(span):
+    if span is not None:
+        span.set(cached=True)
+
+def create_response_cache() -> Optional[SemanticResponseCache]:
+    # 语义回答缓存复用检索工具已加载的BGE模型
+    if os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() not in ("1", "true", "yes"):
+        return None
+    return SemanticResponseCache(
+        embed_fn=lambda text: search_tool.embed_query(text),
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    )
+
 class WaterAgent:
-    def __init__(self, llm_type: str = "auto", enable_streaming: bool = True):
-        self.llm_manager = LLMManager(llm_type)
-        self.tool_manager = ToolManager()
+    def __init__(self, llm_type: str = "auto", enable_streaming: bool = True, warm_up_tools: bool = True,
+                 llm_manager: Optional[LLMManager] = None, tool_manager: Optional[ToolManager] = None,
+                 response_cache: Optional[SemanticResponseCache] = None, session_id: Optional[str] = None,
+                 memory_store: Optional[SQLiteSessionStore] = None):
+        # 多会话服务时传入共享的LLM与工具管理器，每个会话只持有自己的对话记忆
+        if llm_manager is None:
+            with timed("LLM"):
+                llm_manager = LLMManager(llm_type, streaming=enable_streaming)
+        if tool_manager is None:
+            with timed("工具管理器"):
+                tool_manager = ToolManager()
+        self.llm_manager = llm_manager
+        self.tool_manager = tool_manager
         self.enable_streaming = enable_streaming
+        # 多会话服务时传入共享缓存，常见问题在会话间复用
+        self.response_cache = response_cache if response_cache is not None else create_response_cache()
+        # 后台预热工具后端，不阻塞首次交互
+        self.warmup_thread = self.tool_manager.warm_up() if warm_up_tools else None
         # 创建系统提示词
         self.system_prompt = """你是水利法规智能体，可以查询法规、生成代码、预测水质。
                             请根据用户的需求选择合适的工具来帮助用户。如果不需要使用工具，直接回答用户的问题。
@@ -28,15 +64,17 @@ class WaterAgent:
                             2. 如果要使用了工具，请执行工具调用并解释工具的结果
                             3. 如果使用了代码执行工具，请返回代码运行结果并解释代码的作用和结果
                             4. 如果使用了水质预测工具，请解释预测结果的含义
-                            5. 如果使用了法规查询工具，请总结相关要点，最后对法规结果给出来源片段（哪部法律的哪一条）与相似度分数
+                            5. 如果使用了法规查询工具，请总结相关要点，最后对法规结果给出来源片段（哪部法律的哪一条）与检索分数（向量距离越小越相关）；用户直接询问某部法律的某一条时，优先使用条文精确查询工具
                             6. 请在回答时使用markdown格式，并使用```python代码块包裹代码
                             7. 如果某工具出现根本性调用错误（如无法连接/无法加载等）则不再重复调用此工具并请根据报错信息给出解决方案"""
-        # 创建对话记忆
-        self.memory = ConversationBufferWindowMemory(
-            k=10,  # 保留最近10轮对话
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # 确保LLM已初始化
+        if not self.llm_manager.llm:
+            raise ValueError("LLM初始化失败")
+        # 创建对话记忆：按token预算保留近期轮次，较早轮次并入摘要；配置MEMORY_DB_PATH时按会话持久化
+        if memory_store is None:
+            memory_store = create_session_store()
+        self.memory = create_memory(self.llm_manager.llm, session_id=session_id, store=memory_store)
+        self.session_id = self.memory.session_id
         # 创建提示模板
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", self.system_prompt),
@@ -44,36 +82,71 @@ class WaterAgent:
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
-        # 确保LLM已初始化
-        if not self.llm_manager.llm:
-            raise ValueError("LLM初始化失败")
-        # 创建工具调用agent
-        self.agent = create_tool_calling_agent(
-            llm=self.llm_manager.llm,
-            tools=self.tool_manager.get_tools(),
-            prompt=self.prompt
-        )
-        # 创建agent执行器
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tool_manager.get_tools(),
-            memory=self.memory,
-            verbose=True,  # 保持现有的verbose
-            handle_parsing_errors=True,
-            max_iterations=5,
-            early_stopping_method="generate",  # 处理超限情况
-            callbacks=[SimpleCallback()],
-        )
+        with timed("智能体构建"):
+            # 创建工具调用agent
+            self.agent = create_tool_calling_agent(
+                llm=self.llm_manager.llm,
+                tools=self.tool_manager.get_tools(),
+                prompt=self.prompt
+            )
+            # 创建agent执行器
+            self.agent_executor = AgentExecutor(
+                agent=self.agent,
+                tools=self.tool_manager.get_tools(),
+                memory=self.memory,
+                verbose=True,  # 保持现有的verbose
+                handle_parsing_errors=True,
+                max_iterations=5,
+                early_stopping_method="generate",  # 处理超限情况
+                callbacks=[SimpleCallback()],
+            )
         
         logger.info(f"智能体初始化完成 (LLM: {self.llm_manager.llm_type})")
     
+    def _cached_response(self, user_input: str) -> Optional[str]:
+        # 仅对不依赖上下文的独立问题查缓存；嵌入模型尚未加载时不为缓存而阻塞
+        if self.response_cache is None or not search_tool.loaded:
+            return None
+        if is_context_dependent(user_input, bool(self.memory.chat_memory.messages)):
+            self.response_cache.bypassed += 1
+            return None
+        try:
+            answer = self.response_cache.lookup(user_input)
+        except Exception as e:
+            logger.warning(f"语义缓存查询失败: {e}")
+            return None
+        if answer is not None:
+            # 命中时同样写入对话记忆，保持上下文连贯
+            self.memory.save_context({"input": user_input}, {"output": answer})
+        return answer
+    
+    def _remember_response(self, user_input: str, answer: str, tools: List[str]):
+        if self.response_cache is None or not search_tool.loaded:
+            return
+        if is_context_dependent(user_input, len(self.memory.chat_memory.messages) > 2):
+            return
+        if not set(tools) <= CACHEABLE_TOOLS:
+            return
+        try:
+            self.response_cache.store(user_input, answer)
+        except Exception as e:
+            logger.warning(f"语义缓存写入失败: {e}")
+    
     def chat(self, user_input: str) -> str:
         logger.info(f"用户输入: {user_input}")
         
         try:
-            # 使用LangChain AgentExecutor处理用户输入
-            response = self.agent_executor.invoke({"input": user_input})
-            result = response["output"]
+            with trace_span("agent.turn") as span:
+                cached = self._cached_response(user_input)
+                if cached is not None:
+                    _mark_cached(span)
+                    return cached
+                
+                # 使用LangChain AgentExecutor处理用户输入
+                tracker = ToolUsageTracker()
+                response = self.agent_executor.invoke({"input": user_input}, config={"callbacks": [tracker, TracingCallback()]})
+                result = response["output"]
+                self._remember_response(user_input, result, tracker.tools)
             
             # logger.info(f"\n智能体: {result}")
             logger.info("响应生成完成")
@@ -81,4 +154,68 @@ class WaterAgent:
             
         except Exception as e:
             logger.error(f"处理用户请求失败: {e}")
-            return "抱歉，处理您的请求时出现了错误。"
\ No newline at end of file
+            return "抱歉，处理您的请求时出现了错误。"
+    
+    async def achat(self, user_input: str) -> str:
+        logger.info(f"用户输入: {user_input}")
+        
+        try:
+            with trace_span("agent.turn") as span:
+                # 缓存查询与写入需要计算问题向量，放到线程中执行，不阻塞事件循环上的其他会话
+                cached = await asyncio.to_thread(self._cached_response, user_input)
+                if cached is not None:
+                    _mark_cached(span)
+                    return cached
+                
+                tracker = ToolUsageTracker()
+                response = await self.agent_executor.ainvoke({"input": user_input}, config={"callbacks": [tracker, TracingCallback()]})
+                result = response["output"]
+                await asyncio.to_thread(self._remember_response, user_input, result, tracker.tools)
+            logger.info("响应生成完成")
+            return result
+            
+        except Exception as e:
+            logger.error(f"处理用户请求失败: {e}")
+            return "抱歉，处理您的请求时出现了错误。"
+    
+    async def astream(self, user_input: str) -> AsyncIterator[Dict[str, Any]]:
+        """流式对话，逐个产出事件:
+        - {"type": "token", "content": ...}        LLM生成的文本片段
+        - {"type": "tool_start", "name": ..., "input": ...}
+        - {"type": "tool_end", "name": ..., "output": ...}
+        - {"type": "final", "content": ...}        完整回答
+        - {"type": "error", "content": ...}
+        """
+        logger.info(f"用户输入: {user_input}")
+        
+        try:
+            with trace_span("agent.turn") as span:
+                cached = await asyncio.to_thread(self._cached_response, user_input)
+                if cached is not None:
+                    _mark_cached(span)
+                    yield {"type": "final", "content": cached, "cached": True}
+                    return
+            
+                tracker = ToolUsageTracker()
+                async for event in self.agent_executor.astream_events(
+                    {"input": user_input}, config={"callbacks": [tracker, TracingCallback()]}, version="v2"
+                ):
+                    kind = event["event"]
+                    if kind == "on_chat_model_stream":
+                        content = event["data"]["chunk"].content
+                        if content and isinstance(content, str):
+                            yield {"type": "token", "content": content}
+                    elif kind == "on_tool_start":
+                        yield {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+                    elif kind == "on_tool_end":
+                        yield {"type": "tool_end", "name": event["name"], "output": str(event["data"].get("output"))}
+                    elif kind == "on_chain_end" and not event.get("parent_ids"):
+                        # 顶层AgentExecutor结束，输出完整回答
+                        result = event["data"]["output"]["output"]
+                        await asyncio.to_thread(self._remember_response, user_input, result, tracker.tools)
+                        logger.info("响应生成完成")
+                        yield {"type": "final", "content": result}
+                    
+        except Exception as e:
+            logger.error(f"处理用户请求失败: {e}")
+            yield {"type": "error", "content": "抱歉，处理您的请求时出现了错误。"}
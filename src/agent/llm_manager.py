@@ -1,24 +1,43 @@
 import os
+from typing import Any, Dict, List, Optional, Tuple
 from src.utils.logger import setup_logger
 
 logger = setup_logger("LLMManager")
 
+# 提供方: (显示名, 环境变量前缀, 默认模型, 默认地址)
+PROVIDERS = {
+    "openai": ("OpenAI", "OPENAI", "gpt-3.5-turbo", None),
+    "qwen": ("Qwen", "DASHSCOPE", "qwen-turbo", None),
+    "deepseek": ("DeepSeek", "DEEPSEEK", "deepseek-chat", "https://api.deepseek.com/v1"),
+}
+
 class LLMManager:
-    def __init__(self, llm_type: str = "auto"):
+    def __init__(self, llm_type: str = "auto", streaming: bool = False):
         self.llm = None
         self.llm_type = None
+        self.streaming = streaming
         self.failed_providers = []
         self._init_llm(llm_type)
-    
+
     def _init_llm(self, llm_type: str):
         # 初始化LLM
         if llm_type == "auto":
-            for provider in ["openai", "qwen", "deepseek"]:
-                if self._try_init(provider):
-                    return
+            # 自动模式：初始化所有已配置的提供方，多个时按运行时健康状况路由
+            configured = [provider for provider, (_, prefix, _, _) in PROVIDERS.items() if os.getenv(f"{prefix}_API_KEY")]
+            routed = len(configured) > 1
+            clients = {provider: self._try_init(provider, routed) for provider in configured}
+            clients = {provider: client for provider, client in clients.items() if client}
+            if len(clients) > 1:
+                self._init_router(list(clients.values()))
+            elif clients:
+                # 只有一个提供方初始化成功时不路由，按单提供方的超时与重试重新创建
+                provider, client = next(iter(clients.items()))
+                self.llm_type, self.llm = (self._try_init(provider) or client) if routed else client
         else:
-            self._try_init(llm_type)
-        
+            client = self._try_init(llm_type)
+            if client:
+                self.llm_type, self.llm = client
+
         # 所有LLM都失败了
         if not self.llm:
             error_msg = "所有LLM初始化失败，请检查API key配置"
@@ -26,55 +45,61 @@ class LLMManager:
                 error_msg += f"\n失败详情: {'; '.join(self.failed_providers)}"
             logger.error(error_msg)
             raise ValueError(error_msg)
-    
-    def _try_init(self, provider: str) -> bool:
-        # 尝试初始化指定LLM
+
+    def _init_router(self, clients: List[Tuple[str, Any]]):
+        from src.agent.llm_router import Provider, ProviderHealth, RoutedChatModel
+        providers = [
+            Provider(name, client, ProviderHealth(
+                window=int(os.getenv("LLM_HEALTH_WINDOW", "50")),
+                failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "3")),
+                cooldown_seconds=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+            ))
+            for name, client in clients
+        ]
+        self.llm = RoutedChatModel(
+            providers=providers,
+            # 对冲请求默认关闭：慢请求会同时在两个提供方计费；设为正数时首选提供方超时后向次优提供方对冲
+            hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")),
+            streaming=self.streaming,
+        )
+        self.llm_type = "+".join(name for name, _ in clients)
+        logger.info(f"LLM路由已启用: {self.llm_type}")
+
+    def _try_init(self, provider: str, routed: bool = False) -> Optional[Tuple[str, Any]]:
+        # 尝试初始化指定LLM。路由时SDK不重试且超时较短：卡住或出错的提供方尽快交给路由器切换或熔断，
+        # 而不是在SDK内部重试数分钟；重试（换提供方）由路由器负责
+        if routed:
+            timeout = float(os.getenv("LLM_ROUTED_TIMEOUT", "20"))
+            max_retries = 0
+        else:
+            timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+            max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
         try:
-            if provider == "openai" and os.getenv("OPENAI_API_KEY"):
-                from langchain_openai import ChatOpenAI
-                self.llm = ChatOpenAI(
-                    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-                    api_key=os.getenv("OPENAI_API_KEY"),
-                    base_url=os.getenv("OPENAI_BASE_URL"),
-                    max_completion_tokens=int(os.getenv("OPENAI_TOKEN", "5120")),
-                    temperature=0.7,
-                    timeout=60,
-                    max_retries=3,
-                )
-                self.llm_type = "OpenAI"
-                
-            elif provider == "qwen" and os.getenv("DASHSCOPE_API_KEY"):
-                from langchain_openai import ChatOpenAI
-                self.llm = ChatOpenAI(
-                    model=os.getenv("DASHSCOPE_MODEL", "qwen-turbo"),
-                    api_key=os.getenv("DASHSCOPE_API_KEY"),
-                    base_url=os.getenv("DASHSCOPE_BASE_URL"),
-                    max_completion_tokens=int(os.getenv("DASHSCOPE_TOKEN", "5120")),
-                    temperature=0.7,
-                    timeout=60,
-                    max_retries=3,
-                )
-                self.llm_type = "Qwen"
-                
-            elif provider == "deepseek" and os.getenv("DEEPSEEK_API_KEY"):
-                from langchain_openai import ChatOpenAI
-                self.llm = ChatOpenAI(
-                    model=os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
-                    api_key=os.getenv("DEEPSEEK_API_KEY"),
-                    base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
-                    max_completion_tokens=int(os.getenv("DEEPSEEK_TOKEN", "5120")),
-                    temperature=0.7,
-                    timeout=60,
-                    max_retries=3,
-                )
-                self.llm_type = "DeepSeek"
-            
-            if self.llm:
-                logger.info(f"{self.llm_type} 初始化成功")
-                return True
-                
+            name, prefix, default_model, default_url = PROVIDERS[provider]
+            api_key = os.getenv(f"{prefix}_API_KEY")
+            if not api_key:
+                return None
+            from langchain_openai import ChatOpenAI
+            client = ChatOpenAI(
+                model=os.getenv(f"{prefix}_MODEL", default_model),
+                api_key=api_key,
+                base_url=os.getenv(f"{prefix}_BASE_URL", default_url),
+                max_completion_tokens=int(os.getenv(f"{prefix}_TOKEN", "5120")),
+                temperature=0.7,
+                timeout=timeout,
+                max_retries=max_retries,
+                streaming=self.streaming,
+            )
+            logger.info(f"{name} 初始化成功")
+            return name, client
+
         except Exception as e:
             self.failed_providers.append(f"{provider}: {str(e)}")
             logger.warning(f"{provider} 初始化失败，尝试下一个")
-        
-        return False
+
+        return None
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        # 各提供方的路由健康状况（未启用路由时为空）
+        stats = getattr(self.llm, "stats", None)
+        return stats() if callable(stats) else {}
@@ -0,0 +1,317 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from src.utils.logger import setup_logger
+
+logger = setup_logger("LLMRouter")
+
+# 对冲请求使用的线程池（同步调用路径）
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+class ProvidersFailed(RuntimeError):
+    def __init__(self, errors: List[str]):
+        super().__init__("所有LLM提供方调用失败: " + "; ".join(errors))
+        self.errors = errors
+
+class ProviderHealth:
+    """滑动窗口内的延迟与错误率统计，连续失败达到阈值后熔断一段时间"""
+
+    def __init__(self, window: int = 50, failure_threshold: int = 3, cooldown_seconds: float = 30):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+
+    def record_abandoned(self, elapsed: float):
+        # 对冲落败被取消的请求：已等待时间是其真实延迟的下界，计入延迟窗口以降低排序
+        with self._lock:
+            self.latencies.append(elapsed)
+
+    def record_failure(self) -> bool:
+        # 返回本次失败是否触发熔断
+        with self._lock:
+            self.calls += 1
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.cooldown_seconds
+                return True
+            return False
+
+    def state(self, now: Optional[float] = None) -> str:
+        # closed: 正常; half_open: 冷却结束，允许一次试探; open: 熔断中
+        if self.consecutive_failures < self.failure_threshold:
+            return "closed"
+        return "half_open" if (now or time.monotonic()) >= self.open_until else "open"
+
+    def begin_probe(self):
+        # 试探请求期间重新进入冷却，避免并发请求同时涌向刚恢复的提供方
+        with self._lock:
+            self.open_until = time.monotonic() + self.cooldown_seconds
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def latency_quantile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def score(self) -> float:
+        # 越小越好：按p90延迟衡量尾延迟，并按错误率加权
+        return self.latency_quantile(0.9) * (1 + 4 * self.error_rate)
+
+class Provider:
+    def __init__(self, name: str, client: BaseChatModel, health: ProviderHealth):
+        self.name = name
+        self.client = client
+        self.health = health
+
+class RoutedChatModel(BaseChatModel):
+    """在多个OpenAI兼容提供方之间路由：每次调用选择最健康的提供方，失败自动切换，
+    可选在首选提供方响应过慢时向次优提供方发起对冲请求，取先返回的结果"""
+
+    providers: List[Any]
+    # 首选提供方超过该秒数未返回时发起对冲请求，0表示关闭
+    hedge_after: float = 0.0
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"providers": [provider.name for provider in self.providers]}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # 所有提供方均为OpenAI兼容接口，统一转换为OpenAI工具格式后透传
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _candidates(self) -> List[Provider]:
+        # 排序：冷却结束的试探 > 正常提供方（按健康分）> 熔断中的提供方（兜底，不直接拒绝请求）
+        now = time.monotonic()
+        probes, healthy, tripped = [], [], []
+        for provider in self.providers:
+            state = provider.health.state(now)
+            if state == "half_open":
+                probes.append(provider)
+            elif state == "closed":
+                healthy.append(provider)
+            else:
+                tripped.append(provider)
+        for provider in probes:
+            provider.health.begin_probe()
+        healthy.sort(key=lambda provider: provider.health.score())
+        tripped.sort(key=lambda provider: provider.health.open_until)
+        return probes + healthy + tripped
+
+    def _groups(self) -> Iterator[List[Provider]]:
+        # 开启对冲时每次同时准备两个提供方，否则逐个切换
+        candidates = self._candidates()
+        size = 2 if self.hedge_after > 0 else 1
+        for i in range(0, len(candidates), size):
+            yield candidates[i:i + size]
+
+    def _record_failure(self, provider: Provider, error: Exception) -> str:
+        if provider.health.record_failure():
+            logger.warning(f"{provider.name} 连续失败{provider.health.consecutive_failures}次，熔断{provider.health.cooldown_seconds:.0f}秒")
+        else:
+            logger.warning(f"{provider.name} 调用失败，切换提供方: {error}")
+        return f"{provider.name}: {error}"
+
+    def _call(self, provider: Provider, fn: Callable[[], BaseMessage]) -> BaseMessage:
+        start = time.perf_counter()
+        try:
+            message = fn()
+        except Exception as e:
+            self._record_failure(provider, e)
+            raise
+        provider.health.record_success(time.perf_counter() - start)
+        return message
+
+    async def _acall(self, provider: Provider, messages: List[BaseMessage], stop, kwargs) -> BaseMessage:
+        start = time.perf_counter()
+        try:
+            message = await provider.client.ainvoke(messages, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            provider.health.record_abandoned(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            self._record_failure(provider, e)
+            raise
+        provider.health.record_success(time.perf_counter() - start)
+        return message
+
+    def _race(self, group: List[Provider], messages: List[BaseMessage], stop, kwargs) -> Tuple[Provider, BaseMessage]:
+        if len(group) == 1:
+            provider = group[0]
+            return provider, self._call(provider, lambda: provider.client.invoke(messages, stop=stop, **kwargs))
+        futures = {}
+        errors = []
+
+        def launch():
+            provider = group[len(futures)]
+            futures[_hedge_pool.submit(self._call, provider,
+                                       lambda: provider.client.invoke(messages, stop=stop, **kwargs))] = provider
+
+        launch()
+        handled = set()
+        while len(handled) < len(futures):
+            timeout = self.hedge_after if len(futures) < len(group) else None
+            done, _ = wait(set(futures) - handled, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                handled.add(future)
+                try:
+                    return futures[future], future.result()
+                except Exception as e:
+                    errors.append(f"{futures[future].name}: {e}")
+            if len(futures) < len(group):
+                # 首选超时未返回或已失败，启动对冲请求；落后的请求在后台结束并照常计入健康统计
+                if not done:
+                    logger.info(f"{group[0].name} 超过{self.hedge_after}秒未返回，对冲请求 {group[len(futures)].name}")
+                launch()
+        raise ProvidersFailed(errors)
+
+    async def _arace(self, group: List[Provider], messages: List[BaseMessage], stop, kwargs) -> Tuple[Provider, BaseMessage]:
+        tasks = {}
+        errors = []
+
+        def launch():
+            provider = group[len(tasks)]
+            tasks[asyncio.create_task(self._acall(provider, messages, stop, kwargs))] = provider
+
+        launch()
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = self.hedge_after if len(tasks) < len(group) else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task], task.result()
+                    errors.append(f"{tasks[task].name}: {task.exception()}")
+                if len(tasks) < len(group):
+                    if not done:
+                        logger.info(f"{group[0].name} 超过{self.hedge_after}秒未返回，对冲请求 {group[len(tasks)].name}")
+                    launch()
+                    pending = {task for task in tasks if not task.done()}
+        finally:
+            # 已取得结果后取消落后的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        raise ProvidersFailed(errors)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        errors = []
+        for group in self._groups():
+            try:
+                provider, message = self._race(group, messages, stop, kwargs)
+            except ProvidersFailed as e:
+                errors.extend(e.errors)
+                continue
+            except Exception as e:
+                errors.append(f"{group[0].name}: {e}")
+                continue
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"provider": provider.name})
+        raise ProvidersFailed(errors)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        errors = []
+        for group in self._groups():
+            try:
+                provider, message = await self._arace(group, messages, stop, kwargs)
+            except ProvidersFailed as e:
+                errors.extend(e.errors)
+                continue
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"provider": provider.name})
+        raise ProvidersFailed(errors)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # 流式输出只在首个chunk之前切换提供方，按首token延迟计入健康统计
+        errors = []
+        for provider in self._candidates():
+            start = time.perf_counter()
+            stream = provider.client.stream(messages, stop=stop, **kwargs)
+            try:
+                first = next(stream, None)
+            except Exception as e:
+                errors.append(self._record_failure(provider, e))
+                continue
+            provider.health.record_success(time.perf_counter() - start)
+            if first is None:
+                return
+            yield ChatGenerationChunk(message=first)
+            try:
+                for chunk in stream:
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                # 已输出部分内容，无法再切换
+                self._record_failure(provider, e)
+                raise
+            return
+        raise ProvidersFailed(errors)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        errors = []
+        for provider in self._candidates():
+            start = time.perf_counter()
+            stream = provider.client.astream(messages, stop=stop, **kwargs)
+            try:
+                first = await anext(stream, None)
+            except Exception as e:
+                errors.append(self._record_failure(provider, e))
+                continue
+            provider.health.record_success(time.perf_counter() - start)
+            if first is None:
+                return
+            yield ChatGenerationChunk(message=first)
+            try:
+                async for chunk in stream:
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                self._record_failure(provider, e)
+                raise
+            return
+        raise ProvidersFailed(errors)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            provider.name: {
+                "state": provider.health.state(now),
+                "calls": provider.health.calls,
+                "error_rate": round(provider.health.error_rate, 3),
+                "p50_ms": round(provider.health.latency_quantile(0.5) * 1000, 1),
+                "p90_ms": round(provider.health.latency_quantile(0.9) * 1000, 1),
+            }
+            for provider in self.providers
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.messages import BaseMessage, SystemMessage, messages_from_dict, messages_to_dict
+from langchain_core.prompts import PromptTemplate
+from src.utils.logger import setup_logger
+from src.utils.tokens import estimate_message_tokens, estimate_tokens, message_text
+from src.utils.tracing import trace_span
+
+logger = setup_logger("Memory")
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""在已有摘要的基础上加入新的对话内容，返回更新后的摘要。
+摘要需保留用户的问题与意图、关键结论、涉及的法规名称与条款、水质指标与预测结果、代码的用途与运行结果；省略寒暄和大段原文，尽量简短。
+
+已有摘要:
+{summary}
+
+新的对话:
+{new_lines}
+
+更新后的摘要:"""
+)
+
+_CODE_BLOCK = re.compile(r'```.*?```', re.DOTALL)
+
+class SQLiteSessionStore:
+    """会话记忆持久化：每个会话保存滚动摘要与近期消息，恢复会话时无需重放历史"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info(f"会话存储: {self.db_path}")
+
+    def load(self, session_id: str) -> Optional[Tuple[str, List[BaseMessage]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], messages_from_dict(json.loads(row[1]))
+
+    def save(self, session_id: str, summary: str, messages: List[BaseMessage]):
+        payload = json.dumps(messages_to_dict(messages), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, summary, messages, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, summary, payload, time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """按token预算管理的对话记忆：最近几轮原样保留；超出预算时先压缩较早轮次中的代码块和长篇法规摘录，
+    仍超出再把最早的轮次并入滚动摘要。可选SQLite持久化，按会话ID恢复"""
+
+    prompt: PromptTemplate = SUMMARY_PROMPT
+    # 原样保留的最近轮次
+    keep_recent_turns: int = 2
+    # 较早轮次中单条消息超过该token数时压缩
+    bulky_tokens: int = 300
+    # 触发摘要后降到预算的该比例，留出余量，之后几轮无需再摘要
+    fold_ratio: float = 0.6
+    session_id: Optional[str] = None
+    store: Optional[Any] = None
+
+    def _total_tokens(self, messages: List[BaseMessage]) -> int:
+        # 用估算代替模型分词器，离线可用且不随LLM切换而变化
+        return estimate_message_tokens(messages) + estimate_tokens(self.moving_summary_buffer)
+
+    def _shrink(self, message: BaseMessage) -> BaseMessage:
+        text = message_text(message)
+        if isinstance(message, SystemMessage) or estimate_tokens(text) <= self.bulky_tokens:
+            return message
+        text = _CODE_BLOCK.sub("```\n（代码已省略）\n```", text)
+        if estimate_tokens(text) > self.bulky_tokens:
+            # 每个字符至多计1个token，截断后不会再次触发压缩
+            keep = max(self.bulky_tokens - 20, 0)
+            text = text[:keep] + f"…（以下省略{len(text) - keep}字）"
+        return message.model_copy(update={"content": text})
+
+    def predict_new_summary(self, messages: List[BaseMessage], existing_summary: str) -> str:
+        new_lines = "\n".join(f"{self.human_prefix if message.type == 'human' else self.ai_prefix}: {message_text(message)}"
+                              for message in messages)
+        with trace_span("memory.summarize", messages=len(messages)):
+            # 不继承当前运行的回调，摘要内容不会混入流式输出
+            result = self.llm.invoke(self.prompt.format(summary=existing_summary or "无", new_lines=new_lines),
+                                     config={"callbacks": []})
+        return message_text(result).strip()
+
+    def prune(self) -> None:
+        messages = list(self.chat_memory.messages)
+        if self._total_tokens(messages) <= self.max_token_limit:
+            return
+        recent = 2 * self.keep_recent_turns
+        older = max(len(messages) - recent, 0)
+        messages = [self._shrink(message) for message in messages[:older]] + messages[older:]
+
+        folded: List[BaseMessage] = []
+        if self._total_tokens(messages) > self.max_token_limit:
+            target = int(self.max_token_limit * self.fold_ratio)
+            while len(messages) > recent and self._total_tokens(messages) > target:
+                folded.extend(messages[:2])
+                messages = messages[2:]
+        if folded:
+            try:
+                self.moving_summary_buffer = self.predict_new_summary(folded, self.moving_summary_buffer)
+                logger.info(f"已将 {len(folded)} 条较早消息并入摘要，当前记忆约 {self._total_tokens(messages)} tokens")
+            except Exception as e:
+                # 摘要失败时保留原消息，下一轮再试
+                logger.warning(f"对话摘要失败: {e}")
+                messages = folded + messages
+        self.chat_memory.messages = messages
+
+    async def aprune(self) -> None:
+        await asyncio.to_thread(self.prune)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self._persist()
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await super().asave_context(inputs, outputs)
+        self._persist()
+
+    def _persist(self):
+        if self.store is not None and self.session_id:
+            self.store.save(self.session_id, self.moving_summary_buffer, self.chat_memory.messages)
+
+    def restore(self) -> bool:
+        if self.store is None or not self.session_id:
+            return False
+        state = self.store.load(self.session_id)
+        if state is None:
+            return False
+        self.moving_summary_buffer, self.chat_memory.messages = state
+        logger.info(f"恢复会话 {self.session_id}: {len(self.chat_memory.messages)} 条消息，"
+                    f"{'含' if self.moving_summary_buffer else '无'}摘要")
+        return True
+
+    def clear(self) -> None:
+        super().clear()
+        if self.store is not None and self.session_id:
+            self.store.delete(self.session_id)
+
+def create_session_store() -> Optional[SQLiteSessionStore]:
+    # MEMORY_DB_PATH 为空时不持久化
+    db_path = os.getenv("MEMORY_DB_PATH", "")
+    return SQLiteSessionStore(db_path) if db_path else None
+
+def create_memory(llm: Any, session_id: Optional[str] = None,
+                  store: Optional[SQLiteSessionStore] = None) -> TokenBudgetMemory:
+    # 未指定会话ID时使用AGENT_SESSION_ID；启用持久化但没有会话ID时新建一个
+    session_id = session_id or os.getenv("AGENT_SESSION_ID") or (uuid.uuid4().hex if store is not None else None)
+    memory = TokenBudgetMemory(
+        llm=llm,
+        max_token_limit=int(os.getenv("MEMORY_TOKEN_BUDGET", "2000")),
+        keep_recent_turns=int(os.getenv("MEMORY_KEEP_TURNS", "2")),
+        bulky_tokens=int(os.getenv("MEMORY_BULKY_TOKENS", "300")),
+        memory_key="chat_history",
+        return_messages=True,
+        session_id=session_id,
+        store=store,
+    )
+    if store is not None and not memory.restore():
+        logger.info(f"新会话: {session_id}（设置 AGENT_SESSION_ID={session_id} 可恢复）")
+    return memory
@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from langchain.callbacks.base import BaseCallbackHandler
+from src.utils.logger import setup_logger
+
+logger = setup_logger("ResponseCache")
+
+# 指代上文的表达：出现在有历史的对话中时，问题不是独立问题，不走缓存。
+# "为什么"本身常见于独立问题（如"为什么要划定地下水超采区"），只有追问上文时才算
+_CONTEXT_MARKERS = re.compile(
+    r'它|他们|她们|这个|那个|这些|那些|这条|那条|这部|那部|该法|该条|上面|上述|以上|刚才|之前|前面|'
+    r'继续|接着|还有呢|然后呢|再来|同样|其中|第[一二三四五六七八九十\d]+个|'
+    r'为什么(?:呢|这样|如此|会这样|不行|不可以)|^\s*为什么\s*[？?]?\s*$'
+)
+_NUMBER = re.compile(r'\d+(?:\.\d+)?|[零〇一二两三四五六七八九十百千]+')
+
+# 结果只取决于问题本身的工具；其余工具（代码执行、水质预测）的回答不缓存
+CACHEABLE_TOOLS = {"search_regulations", "lookup_regulation_article"}
+
+def is_context_dependent(question: str, has_history: bool) -> bool:
+    if not has_history:
+        return False
+    return len(question.strip()) < 4 or bool(_CONTEXT_MARKERS.search(question))
+
+class ToolUsageTracker(BaseCallbackHandler):
+    """记录一轮对话中调用过的工具"""
+
+    def __init__(self):
+        self.tools: List[str] = []
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.tools.append((serialized or {}).get("name") or kwargs.get("name", ""))
+
+@dataclass
+class _Entry:
+    question: str
+    vector: np.ndarray
+    numbers: Tuple[str, ...]
+    answer: str
+    expires_at: float
+
+class SemanticResponseCache:
+    """按问题向量相似度复用历史回答：命中时完全跳过LLM。
+    问题中的数字（条款号、水质参数等）必须完全一致才算命中，避免相似问题返回错误数值"""
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], threshold: float = 0.95,
+                 ttl_seconds: float = 3600, max_entries: int = 512):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, question: str) -> Optional[str]:
+        vector = self._embed(question)
+        numbers = tuple(_NUMBER.findall(question))
+        now = time.monotonic()
+        with self._lock:
+            # 清理过期条目
+            for key in [key for key, entry in self._entries.items() if entry.expires_at < now]:
+                del self._entries[key]
+            candidates = [entry for entry in self._entries.values() if entry.numbers == numbers]
+            if candidates:
+                scores = np.stack([entry.vector for entry in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = candidates[best]
+                    self._entries.move_to_end(entry.question)
+                    self.hits += 1
+                    logger.info(f"语义缓存命中 (相似度{scores[best]:.3f}): {entry.question}")
+                    return entry.answer
+            self.misses += 1
+        return None
+
+    def store(self, question: str, answer: str):
+        entry = _Entry(question, self._embed(question), tuple(_NUMBER.findall(question)),
+                       answer, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[question] = entry
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "bypassed": self.bypassed, "evictions": self.evictions}
@@ -1,13 +1,54 @@
-from typing import List, Optional
-from langchain.tools import tool
+import os
+import asyncio
+from typing import Callable, Dict, List, Optional
+from langchain.tools import StructuredTool
 from src.utils.logger import setup_logger
+from src.utils.lazy import warm_up
 from src.tools.code_executor import executor
 from src.tools.water_predictor import predictor
 from src.tools.vector_search import search_tool
+from src.tools.article_index import article_index
+from src.tools.context_packer import pack_context
 
 logger = setup_logger("ToolManager")
 
-@tool
+# 工具参数名到模型特征名的映射
+WATER_PARAM_NAMES = {
+    "ph": "ph", "hardness": "Hardness", "solids": "Solids", "chloramines": "Chloramines",
+    "sulfate": "Sulfate", "conductivity": "Conductivity", "organic_carbon": "Organic_carbon",
+    "trihalomethanes": "Trihalomethanes", "turbidity": "Turbidity"
+}
+
+# 检索结果中各路分数的显示名称；similarity_score是平方L2距离，越小越相关
+SCORE_LABELS = {
+    "similarity_score": "向量距离（越小越相关）", "bm25_score": "BM25", "rrf_score": "融合分", "rerank_score": "重排分"
+}
+
+def async_tool(func: Optional[Callable] = None, *, coroutine: Optional[Callable] = None):
+    """与@tool相同，额外提供异步实现：默认把阻塞调用放到线程池执行，不阻塞事件循环；
+    后端自带异步接口时可通过coroutine传入"""
+    if func is None:
+        return lambda f: async_tool(f, coroutine=coroutine)
+    
+    async def _arun(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return StructuredTool.from_function(func=func, coroutine=coroutine or _arun)
+
+def _format_execution_result(result) -> str:
+    if result.success:
+        return f"代码执行成功。输出: {result.output}。执行时间: {result.execution_time:.3f}\n"
+    else:
+        return f"代码执行失败，错误: {result.error}\n"
+
+async def _aexecute_code(code: str, language: str = "python") -> str:
+    try:
+        result = await executor.aexecute_code(code, language)
+        return _format_execution_result(result)
+    except Exception as e:
+        logger.error(f"代码执行工具调用失败: {e}\n")
+        return f"代码执行工具调用失败: {str(e)}\n"
+
+@async_tool(coroutine=_aexecute_code)
 def execute_code(code: str, language: str = "python") -> str:
     """执行Python或其他编程语言代码并返回结果。
     
@@ -20,15 +61,21 @@ def execute_code(code: str, language: str = "python") -> str:
     """
     try:
         result = executor.execute_code(code, language)
-        if result.success:
-            return f"代码执行成功。输出: {result.output}。执行时间: {result.execution_time:.3f}\n"
-        else:
-            return f"代码执行失败，错误: {result.error}\n"
+        return _format_execution_result(result)
     except Exception as e:
         logger.error(f"代码执行工具调用失败: {e}\n")
         return f"代码执行工具调用失败: {str(e)}\n"
 
-@tool
+def _format_drivers(result, n: int) -> str:
+    # 主要影响因素：特征取值与贡献方向（对数几率），缺失的参数同样会影响预测
+    parts = []
+    for name, value in result.top_drivers(n):
+        observed = result.input_features.get(name)
+        shown = "缺失" if observed is None else f"{float(observed):g}"
+        parts.append(f"{name}={shown}（{'倾向可饮用' if value > 0 else '倾向不可饮用'} {value:+.2f}）")
+    return "；".join(parts)
+
+@async_tool
 def predict_water(ph: Optional[float] = None, hardness: Optional[float] = None, solids: Optional[float] = None, 
                  chloramines: Optional[float] = None, sulfate: Optional[float] = None, conductivity: Optional[float] = None, 
                  organic_carbon: Optional[float] = None, trihalomethanes: Optional[float] = None, turbidity: Optional[float] = None) -> str:
@@ -46,7 +93,7 @@ def predict_water(ph: Optional[float] = None, hardness: Optional[float] = None,
     - turbidity: 浊度
     
     返回:
-    预测结果字符串，包含是否可饮用、置信度和输入参数信息
+    预测结果字符串，包含是否可饮用、置信度、输入参数信息以及对结果影响最大的几个参数
     """
     try:
         # 构建参数字典，过滤None值
@@ -58,42 +105,112 @@ def predict_water(ph: Optional[float] = None, hardness: Optional[float] = None,
         # 移除None值
         water_params = {k: v for k, v in water_params.items() if v is not None}
         
-        result = predictor.predict(water_params)
-        return f"水质预测完成。结果: {'可饮用' if result.is_potable else '不可饮用'}，置信度: {result.confidence:.3f}，输入参数: {result.input_features}\n"
+        result = predictor.predict(water_params, explain=True)
+        output = f"水质预测完成。结果: {'可饮用' if result.is_potable else '不可饮用'}，置信度: {result.confidence:.3f}，输入参数: {result.input_features}"
+        if result.contributions:
+            output += f"。主要影响因素: {_format_drivers(result, 3)}"
+        return output + "\n"
     except Exception as e:
         logger.error(f"水质预测工具调用失败: {e}")
         return f"水质预测失败: {str(e)}\n"
 
-@tool
-def search_regulations(query: str, k: int = 3) -> str:
+@async_tool
+def predict_water_batch(samples: List[Dict[str, float]]) -> str:
+    """批量预测多组水样是否可饮用，适用于一次提供多个监测站点或多组水质参数的情况。
+    
+    参数:
+    - samples: 水样列表，每个水样是一个字典，键为 ph、hardness、solids、chloramines、sulfate、
+      conductivity、organic_carbon、trihalomethanes、turbidity 中的任意几个，未提供的参数将被忽略
+    
+    返回:
+    批量预测结果字符串，包含可饮用样本数量以及每个样本的结果、置信度和影响最大的参数
+    """
+    try:
+        # 统一参数名（忽略大小写），移除None值
+        normalized = []
+        for sample in samples:
+            params = {}
+            for key, value in sample.items():
+                name = WATER_PARAM_NAMES.get(str(key).lower())
+                if name and value is not None:
+                    params[name] = value
+            normalized.append(params)
+        
+        results = predictor.predict_batch(normalized, explain=True)
+        potable = sum(1 for r in results if r.is_potable)
+        lines = [
+            f"{i}. {'可饮用' if r.is_potable else '不可饮用'}，置信度: {r.confidence:.3f}"
+            + (f"，主要影响因素: {_format_drivers(r, 1)}" if r.contributions else "")
+            for i, r in enumerate(results, 1)
+        ]
+        return f"批量水质预测完成，共{len(results)}个样本，可饮用{potable}个。\n" + "\n".join(lines) + "\n"
+    except Exception as e:
+        logger.error(f"批量水质预测工具调用失败: {e}")
+        return f"批量水质预测失败: {str(e)}\n"
+
+@async_tool
+def search_regulations(query: str, k: int = 3, mode: str = "hybrid") -> str:
     """检索水利法规相关内容。
     
     参数:
     - query: 查询关键词或问题
     - k: 返回结果数量，默认为3条
+    - mode: 检索模式，默认"hybrid"（语义+关键词融合）；查询具体法律名称、条款编号等精确关键词时可用"lexical"（仅关键词，速度最快）；"vector"为仅语义检索
     
     返回:
     相关法规条文字符串，包含匹配的法规内容摘要
     """
     try:
-        result = search_tool.search(query, k=k)
+        result = search_tool.search(query, k=k, mode=mode)
         if not result:
             return "未找到相关法规条文\n"
         
+        # 合并相邻块，每段只保留与查询最相关的句子，总长度不超过token预算
+        packed = pack_context(query, result, token_budget=int(os.getenv("SEARCH_CONTEXT_TOKENS", "800")))
         regulations = []
-        for i, item in enumerate(result, 1):
-            regulations.append(f"{i}. {item['content'][:200]}...")
+        for i, context in enumerate(packed, 1):
+            # 有结构化来源时标注法律名称与条款，并附上各路分数
+            source = f"[{context.source}] " if context.source else ""
+            scores = "，".join(f"{SCORE_LABELS.get(name, name)} {value:.3f}" for name, value in context.scores.items())
+            regulations.append(f"{i}. {source}{context.text}" + (f"（{scores}）" if scores else ""))
         
-        return f"找到{len(regulations)}条相关法规: " + " | ".join(regulations) + "\n"
+        return f"找到{len(regulations)}条相关法规:\n" + "\n".join(regulations) + "\n"
     except Exception as e:
         logger.error(f"法规检索工具调用失败: {e}")
         return f"法规检索失败: {str(e)}\n"
 
+@async_tool
+def lookup_regulation_article(law_name: str, article: str) -> str:
+    """按法律名称和条款编号精确查询法规原文，适用于用户直接引用"某法第X条"的情况，比语义检索更快更准确。
+    
+    参数:
+    - law_name: 法律法规名称，可用全称或简称，如"中华人民共和国水法"、"水法"
+    - article: 条款编号，如"第十二条"、"12"
+    
+    返回:
+    条文原文字符串，包含法律名称、章节和条款编号；未找到时返回提示
+    """
+    try:
+        entry = article_index.lookup(law_name, article)
+        if not entry:
+            return f"未找到《{law_name}》{article}，可改用search_regulations检索\n"
+        chapter = f" {entry['chapter']}" if entry.get('chapter') else ""
+        return f"《{entry['law_name']}》{chapter} {entry['article_no']}: {entry['content']}\n"
+    except Exception as e:
+        logger.error(f"条文查询工具调用失败: {e}")
+        return f"条文查询失败: {str(e)}\n"
+
 class ToolManager:
     def __init__(self):
-        self.tools = [execute_code, predict_water, search_regulations]
+        self.tools = [execute_code, predict_water, predict_water_batch, search_regulations, lookup_regulation_article]
+        # 工具后端均为延迟加载，首次调用或预热时才真正创建
+        self.backends = [executor, predictor, search_tool, article_index]
         logger.info("工具管理器初始化完成")
     
+    def warm_up(self):
+        """在后台线程中预先加载工具后端"""
+        return warm_up(self.backends)
+    
     def get_tools(self) -> List:
         """获取LangChain工具列表"""
         return self.tools
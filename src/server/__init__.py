@@ -0,0 +1,4 @@
+"""
+http_server:多会话HTTP服务
+session_store:会话存储
+"""
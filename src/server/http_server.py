@@ -0,0 +1,188 @@
+import os
+import json
+import asyncio
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Tuple
+from src.utils.logger import setup_logger
+from src.agent.core import WaterAgent, create_response_cache
+from src.agent.memory import create_session_store
+from src.agent.llm_manager import LLMManager
+from src.agent.tool_manager import ToolManager
+from src.server.session_store import SessionStore
+
+logger = setup_logger("HTTPServer")
+
+# 请求体大小上限
+MAX_BODY_BYTES = 1 << 20
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class AgentServer:
+    """基于asyncio的多会话HTTP服务：模型与工具后端全局共享，每个会话独立记忆，SSE流式输出
+
+    接口:
+    - GET    /health                 服务状态
+    - POST   /sessions               创建会话
+    - DELETE /sessions/{session_id}  删除会话
+    - POST   /chat                   {"session_id"?, "message"} -> {"session_id", "output"}
+    - POST   /chat/stream            同上，以SSE逐个推送token/tool_start/tool_end/final事件
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, session_ttl: float = 1800,
+                 max_sessions: int = 200, max_concurrency: int = 8, llm_type: str = "auto"):
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        # 共享的LLM客户端与工具后端，所有会话只加载一次
+        self.llm_manager = LLMManager(llm_type, streaming=True)
+        self.tool_manager = ToolManager()
+        # 语义回答缓存在会话间共享
+        self.response_cache = create_response_cache()
+        # 会话记忆持久化存储（MEMORY_DB_PATH），会话过期淘汰后可按ID恢复
+        self.memory_store = create_session_store()
+        self.sessions = SessionStore(self._create_agent, ttl_seconds=session_ttl, max_sessions=max_sessions)
+        # 同时进行的对话轮次上限（每轮包含多次LLM调用）
+        self.llm_semaphore = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_env(cls) -> "AgentServer":
+        return cls(
+            host=os.getenv("SERVER_HOST", "127.0.0.1"),
+            port=int(os.getenv("SERVER_PORT", "8000")),
+            session_ttl=float(os.getenv("SESSION_TTL", "1800")),
+            max_sessions=int(os.getenv("MAX_SESSIONS", "200")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        )
+
+    def _create_agent(self, session_id: str) -> WaterAgent:
+        return WaterAgent(llm_manager=self.llm_manager, tool_manager=self.tool_manager,
+                          response_cache=self.response_cache, warm_up_tools=False,
+                          session_id=session_id, memory_store=self.memory_store)
+
+    async def serve(self):
+        self.tool_manager.warm_up()
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sweeper = asyncio.create_task(self.sessions.run_sweeper())
+        logger.info(f"HTTP服务已启动: http://{self.host}:{self.port} (并发上限: {self.max_concurrency})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ConnectionResetError
+        try:
+            method, path, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "无效的请求行")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, _, body = await self._read_request(reader)
+            await self._route(method, path, body, writer)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError):
+            pass
+        except Exception as e:
+            logger.error(f"请求处理失败: {e}")
+            try:
+                await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "服务器内部错误"})
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        if method == "GET" and path == "/health":
+            await self._send_json(writer, HTTPStatus.OK, {
+                "status": "ok",
+                "llm": self.llm_manager.llm_type,
+                "llm_health": self.llm_manager.health(),
+                "sessions": len(self.sessions),
+                "backends": {backend.name: backend.loaded for backend in self.tool_manager.backends},
+            })
+        elif method == "POST" and path == "/sessions":
+            session = self.sessions.get_or_create()
+            await self._send_json(writer, HTTPStatus.CREATED, {"session_id": session.session_id})
+        elif method == "DELETE" and path.startswith("/sessions/"):
+            session_id = path.rsplit("/", 1)[-1]
+            deleted = self.sessions.delete(session_id)
+            if self.memory_store is not None:
+                deleted = self.memory_store.delete(session_id) or deleted
+            await self._send_json(writer, HTTPStatus.OK if deleted else HTTPStatus.NOT_FOUND, {"deleted": deleted})
+        elif method == "POST" and path == "/chat":
+            session_id, message = self._parse_chat(body)
+            # 从取得会话起即标记为使用中，等待锁期间不会被容量淘汰
+            async with self.sessions.turn(session_id) as session:
+                async with session.lock, self.llm_semaphore:
+                    output = await session.agent.achat(message)
+                await self._send_json(writer, HTTPStatus.OK, {"session_id": session.session_id, "output": output})
+        elif method == "POST" and path == "/chat/stream":
+            session_id, message = self._parse_chat(body)
+            async with self.sessions.turn(session_id) as session:
+                await self._stream_chat(writer, session, message)
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"未知接口: {method} {path}")
+
+    def _parse_chat(self, body: bytes) -> Tuple[Optional[str], str]:
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "请求体不是有效的JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "请求体必须是JSON对象")
+        message = payload.get("message", "")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "message必须是非空字符串")
+        session_id = payload.get("session_id")
+        if session_id is not None and not isinstance(session_id, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "session_id必须是字符串")
+        return session_id or None, message.strip()
+
+    async def _stream_chat(self, writer: asyncio.StreamWriter, session, message: str):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await self._send_event(writer, "session", {"session_id": session.session_id})
+        async with session.lock, self.llm_semaphore:
+            async for event in session.agent.astream(message):
+                await self._send_event(writer, event["type"], event)
+        await self._send_event(writer, "done", {})
+
+    async def _send_event(self, writer: asyncio.StreamWriter, event: str, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        writer.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Optional
+from src.utils.logger import setup_logger
+
+logger = setup_logger("SessionStore")
+
+@dataclass
+class Session:
+    session_id: str
+    agent: Any
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    # 同一会话的对话轮次串行执行，保证记忆顺序一致
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # 已取得会话、尚未结束的对话轮次数（含等待锁的轮次）
+    active: int = 0
+
+    def in_use(self) -> bool:
+        return self.active > 0 or self.lock.locked()
+
+class SessionStore:
+    """会话存储：按最近访问排序，超过TTL或容量上限时淘汰最久未访问的会话"""
+
+    def __init__(self, factory: Callable[[str], Any], ttl_seconds: float = 1800, max_sessions: int = 200):
+        self.factory = factory
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.last_access > self.ttl_seconds:
+            self.delete(session_id)
+            return None
+        session.last_access = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        if session_id:
+            session = self.get(session_id)
+            if session is not None:
+                return session
+        # 工厂按会话ID创建智能体，已持久化的会话可据此恢复记忆
+        session_id = session_id or uuid.uuid4().hex
+        session = Session(session_id=session_id, agent=self.factory(session_id))
+        self._sessions[session.session_id] = session
+        self._evict_for_capacity(keep=session.session_id)
+        logger.info(f"创建会话: {session.session_id}，当前会话数: {len(self._sessions)}")
+        return session
+
+    @asynccontextmanager
+    async def turn(self, session_id: Optional[str] = None) -> AsyncIterator[Session]:
+        """取得（或创建）会话用于一轮对话：返回前即标记为使用中，发送响应、等待锁期间都不会被淘汰"""
+        session = self.get_or_create(session_id)
+        session.active += 1
+        try:
+            yield session
+        finally:
+            session.active -= 1
+
+    def _evict_for_capacity(self, keep: str):
+        # 容量已满时淘汰最久未访问的空闲会话；正在进行对话的会话不淘汰，全部忙碌时暂时超出上限
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        idle = [sid for sid, session in self._sessions.items()
+                if sid != keep and not session.in_use()][:excess]
+        for sid in idle:
+            del self._sessions[sid]
+            logger.info(f"会话数达到上限，淘汰会话: {sid}")
+        if len(idle) < excess:
+            logger.warning(f"会话均在进行中，暂时超出上限: {len(self._sessions)}/{self.max_sessions}")
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def evict_expired(self) -> int:
+        deadline = time.time() - self.ttl_seconds
+        expired = [sid for sid, session in self._sessions.items()
+                   if session.last_access < deadline and not session.in_use()]
+        for sid in expired:
+            del self._sessions[sid]
+        if expired:
+            logger.info(f"清理过期会话 {len(expired)} 个，当前会话数: {len(self._sessions)}")
+        return len(expired)
+
+    async def run_sweeper(self, interval: float = 60):
+        # 定期清理过期会话
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired()
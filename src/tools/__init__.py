@@ -2,6 +2,15 @@
 code_executor:代码执行工具
 vector_search:向量搜索工具
 water_predictor:水质预测工具
+embedding_cache:查询向量缓存
+lexical_index:BM25倒排索引
+article_index:法规条文精确索引
+code_cache:代码执行结果缓存
+embeddings:嵌入模型后端
+numpy_store:内存映射的NumPy精确检索库
+reranker:交叉编码器重排
+context_packer:检索结果上下文打包
+catboost_numpy:CatBoost对称树的NumPy求值器
 """
 
 
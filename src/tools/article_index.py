@@ -0,0 +1,124 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from src.utils.logger import setup_logger
+from src.utils.lazy import LazyBackend
+
+logger = setup_logger("ArticleIndex")
+
+_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+def chinese_to_int(text: str) -> int:
+    # 中文数字转整数，如"十二"->12、"一百零五"->105，也接受阿拉伯数字
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    total, current = 0, 0
+    for ch in text:
+        if ch in _DIGITS:
+            current = _DIGITS[ch]
+        elif ch in _UNITS:
+            total += (current or 1) * _UNITS[ch]
+            current = 0
+        else:
+            raise ValueError(f"无法解析的数字: {text}")
+    return total + current
+
+def parse_article_number(article: Any) -> int:
+    # 接受 12 / "12" / "第12条" / "第十二条" / "十二"
+    if isinstance(article, int):
+        return article
+    match = re.fullmatch(r'\s*第?\s*([零〇一二两三四五六七八九十百千\d]+)\s*条?\s*', str(article))
+    if not match:
+        raise ValueError(f"无法解析的条款编号: {article}")
+    return chinese_to_int(match.group(1))
+
+def normalize_law_name(name: str) -> str:
+    name = re.sub(r'[《》\s]', '', name)
+    return name.removeprefix("中华人民共和国")
+
+class ArticleIndex:
+    """(法律名称, 条款编号) -> 条文 的精确查找索引"""
+
+    def __init__(self, laws: Optional[Dict[str, Dict[int, Dict[str, Any]]]] = None):
+        self.laws = laws or {}
+        # 去掉"中华人民共和国"、书名号后的别名
+        self.aliases = {normalize_law_name(law): law for law in self.laws}
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Any]) -> "ArticleIndex":
+        # 由带law_name/article_no元数据的文档块构建。同一条文被切成多块时只拼接紧邻的块；
+        # 同名同号但不相邻的块来自另一部法律（标题未识别），保留先出现的，不拼接
+        laws: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        previous_key = None
+        conflicts = 0
+        for chunk in chunks:
+            law_name = chunk.metadata.get('law_name')
+            article_no = chunk.metadata.get('article_no')
+            key = (law_name, chunk.metadata.get('article_num')) if law_name and article_no else None
+            adjacent, previous_key = key == previous_key, key
+            if key is None:
+                continue
+            entry = laws.setdefault(law_name, {}).get(key[1])
+            if entry is None:
+                laws[law_name][key[1]] = {
+                    'article_no': article_no,
+                    'chapter': chunk.metadata.get('chapter', ''),
+                    'page': chunk.metadata.get('page'),
+                    'chunk_ids': [chunk.metadata.get('chunk_id')],
+                    'content': chunk.page_content,
+                }
+            elif not adjacent:
+                conflicts += 1
+            elif chunk.metadata.get('chunk_id') not in entry['chunk_ids']:
+                entry['chunk_ids'].append(chunk.metadata.get('chunk_id'))
+                entry['content'] += chunk.page_content
+        if conflicts:
+            logger.warning(f"{conflicts} 个文档块与已有条文同名同号但不相邻，未拼接")
+        return cls(laws)
+
+    def resolve_law(self, law_name: str) -> Optional[str]:
+        if law_name in self.laws:
+            return law_name
+        normalized = normalize_law_name(law_name)
+        if normalized in self.aliases:
+            return self.aliases[normalized]
+        # 简称匹配（如"水法"），多个候选时取名称最短者
+        candidates = [law for alias, law in self.aliases.items() if normalized and normalized in alias]
+        return min(candidates, key=len) if candidates else None
+
+    def lookup(self, law_name: str, article: Any) -> Optional[Dict[str, Any]]:
+        law = self.resolve_law(law_name)
+        if law is None:
+            return None
+        entry = self.laws[law].get(parse_article_number(article))
+        return {'law_name': law, **entry} if entry else None
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        data = {law: {str(num): entry for num, entry in articles.items()} for law, articles in self.laws.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "ArticleIndex":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls({law: {int(num): entry for num, entry in articles.items()} for law, articles in data.items()})
+
+    def __len__(self) -> int:
+        return sum(len(articles) for articles in self.laws.values())
+
+def load_article_index() -> ArticleIndex:
+    from src.tools.embeddings import vector_db_path
+    index_path = vector_db_path()/"article_index.json"
+    if not index_path.exists():
+        raise FileNotFoundError(f"条文索引不存在，请先运行build_vector_db.py: {index_path}")
+    index = ArticleIndex.load(str(index_path))
+    logger.info(f"条文索引加载成功: {len(index.laws)} 部法规, {len(index)} 条")
+    return index
+
+# 全局条文索引实例（首次使用时加载）
+article_index = LazyBackend("article_index", load_article_index)
@@ -0,0 +1,240 @@
+import json
+import tempfile
+import threading
+from math import factorial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from src.utils.logger import setup_logger
+
+logger = setup_logger("CatBoostNumpy")
+
+# 分块计算，(树数, 行数) 的中间矩阵大小有上限，百万行时内存平稳
+BLOCK_ROWS = 4096
+
+def convert_model_json(model_json: dict, feature_names) -> Dict[str, np.ndarray]:
+    # CatBoost JSON格式 -> 定长打包数组；只支持数值特征的二分类对称树模型
+    if model_json.get("features_info", {}).get("categorical_features") or model_json.get("ctr_data"):
+        raise ValueError("不支持含类别特征的模型")
+    float_features = model_json["features_info"]["float_features"]
+    flat_index = {feature["feature_index"]: feature["flat_feature_index"] for feature in float_features}
+    n_features = max(flat_index.values()) + 1
+    nan_as_true = np.zeros(n_features, dtype=bool)
+    for feature in float_features:
+        # AsTrue（训练时Max处理）：缺失值大于所有阈值；AsFalse/AsIs：比较结果为假
+        nan_as_true[feature["flat_feature_index"]] = feature.get("nan_value_treatment") == "AsTrue"
+
+    trees = model_json["oblivious_trees"]
+    depth = max(len(tree["splits"]) for tree in trees)
+    split_feature = np.zeros((len(trees), depth), dtype=np.int32)
+    # 较浅的树用+inf阈值补齐，补齐位恒为0，叶子编号不变
+    split_border = np.full((len(trees), depth), np.inf, dtype=np.float32)
+    leaf_values = np.zeros((len(trees), 1 << depth), dtype=np.float64)
+    # 训练样本在各叶子上的权重，用于树SHAP的条件期望；补齐的叶子权重为0
+    leaf_weights = np.zeros((len(trees), 1 << depth), dtype=np.float64)
+    for t, tree in enumerate(trees):
+        if len(tree["leaf_values"]) != 1 << len(tree["splits"]):
+            raise ValueError("只支持一维输出（二分类/回归）的模型")
+        for d, split in enumerate(tree["splits"]):
+            if split.get("split_type", "FloatFeature") != "FloatFeature":
+                raise ValueError(f"不支持的分裂类型: {split.get('split_type')}")
+            split_feature[t, d] = flat_index[split["float_feature_index"]]
+            split_border[t, d] = split["border"]
+        leaf_values[t, :len(tree["leaf_values"])] = tree["leaf_values"]
+        leaf_weights[t, :len(tree["leaf_weights"])] = tree["leaf_weights"]
+
+    scale, bias = model_json.get("scale_and_bias", [1.0, [0.0]])
+    if isinstance(bias, list):
+        bias = bias[0] if bias else 0.0
+    return {
+        "split_feature": split_feature,
+        "split_border": split_border,
+        "leaf_values": leaf_values,
+        "leaf_weights": leaf_weights,
+        "nan_as_true": nan_as_true,
+        "scale": np.float64(scale),
+        "bias": np.float64(bias),
+        "feature_names": np.array(feature_names, dtype=str),
+    }
+
+def model_json(model: Any) -> dict:
+    # 经JSON格式读取CatBoost模型结构（save_model只支持写文件）
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "model.json"
+        model.save_model(str(json_path), format="json")
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+def _shapley_coefficients(signature: Tuple[int, ...]) -> np.ndarray:
+    """一种"层->特征"分组方式下的Shapley系数：coef[层, 层掩码]。
+    signature[d]为第d层所属特征的序号（按首次出现编号，-1为补齐层）；每个特征的贡献记在它首次出现的层上。
+    φ_i = Σ_{S不含i} |S|!(k-|S|-1)!/k! · (v(S∪{i}) - v(S))，v(S)取"S中特征所在层与补齐层按样本路径走"的条件期望"""
+    depth = len(signature)
+    k = max(signature) + 1
+    padded = sum(1 << d for d, player in enumerate(signature) if player < 0)
+    levels = [sum(1 << d for d, player in enumerate(signature) if player == i) for i in range(k)]
+    first_level = [signature.index(i) for i in range(k)]
+    weight = [factorial(s) * factorial(k - s - 1) / factorial(k) for s in range(k)]
+    coef = np.zeros((depth, 1 << depth))
+    for subset in range(1 << k):
+        size = bin(subset).count("1")
+        mask = padded | sum(levels[i] for i in range(k) if subset >> i & 1)
+        for i in range(k):
+            if subset >> i & 1:
+                coef[first_level[i], mask] += weight[size - 1]
+            else:
+                coef[first_level[i], mask] -= weight[size]
+    return coef
+
+class CatBoostNumpyModel:
+    """对称树（oblivious trees）的NumPy向量化求值，推理时不依赖catboost。
+    数组由scripts/model_export/export_catboost_numpy.py从.cbm导出：
+    - split_feature / split_border: (树数, 最大深度)，较浅的树以 +inf 阈值补齐（该位恒为0）
+    - leaf_values / leaf_weights: (树数, 2^最大深度)
+    - nan_as_true: 每个特征的缺失值是否视为大于所有阈值（对应CatBoost的Max缺失值处理）"""
+
+    def __init__(self, path: Optional[str] = None, arrays: Optional[Dict[str, np.ndarray]] = None):
+        self.path = Path(path) if path else None
+        if arrays is None:
+            with np.load(self.path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        self.split_feature = arrays["split_feature"].astype(np.intp)
+        # CatBoost以float32比较特征与阈值，阈值和输入都用float32才能逐位一致
+        self.split_border = arrays["split_border"].astype(np.float32)
+        self.leaf_values = arrays["leaf_values"].astype(np.float64)
+        # 较早导出的文件没有叶子权重，只能预测不能解释
+        self.leaf_weights = arrays["leaf_weights"].astype(np.float64) if "leaf_weights" in arrays else None
+        self.nan_as_true = arrays["nan_as_true"].astype(bool)
+        self.scale = float(arrays["scale"])
+        self.bias = float(arrays["bias"])
+        self.feature_names: List[str] = [str(name) for name in arrays["feature_names"]]
+        self.n_trees, self.depth = self.split_feature.shape
+        # 缺失值替换为±inf：AsTrue特征的缺失值大于所有有限阈值，其余小于所有阈值；补齐位阈值为+inf，比较恒为假
+        self._nan_fill = np.where(self.nan_as_true, np.inf, -np.inf).astype(np.float32)
+        # 各树共用的(特征, 阈值)只比较一次，_split_index把每棵树每层映射到对应的比较结果
+        pairs = np.stack([self.split_feature.ravel().astype(np.float64), self.split_border.ravel().astype(np.float64)], axis=1)
+        unique_pairs, split_index = np.unique(pairs, axis=0, return_inverse=True)
+        self._unique_feature = unique_pairs[:, 0].astype(np.intp)
+        self._unique_border = unique_pairs[:, 1].astype(np.float32)
+        self._split_index = split_index.reshape(self.split_feature.shape)
+        # 叶子编号的位宽：深度不超过8时用uint8，减少中间数组的内存带宽
+        self._leaf_dtype = np.uint8 if self.depth <= 8 else np.uint32
+        self._flat_leaves = self.leaf_values.ravel()
+        self._leaf_offset = (np.arange(self.n_trees, dtype=np.intp) * self.leaf_values.shape[1])[:, None]
+        # 树SHAP查找表由prepare_explanations计算（或在首次解释时计算）
+        self._shap_table = None
+        self._shap_lock = threading.Lock()
+        self.expected_value: Optional[float] = None
+        logger.info(f"NumPy CatBoost模型加载成功: {self.path or '内存'}, {self.n_trees} 棵树, 深度 {self.depth}")
+
+    @classmethod
+    def from_catboost(cls, model: Any, feature_names: List[str]) -> "CatBoostNumpyModel":
+        # 由已加载的CatBoost模型在内存中构建，无需先导出.npz
+        return cls(arrays=convert_model_json(model_json(model), feature_names))
+
+    def _prepare(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        if x.shape[1] != len(self.feature_names):
+            raise ValueError(f"特征数量不匹配: 期望{len(self.feature_names)}，实际{x.shape[1]}")
+        return x
+
+    def _leaves(self, x: np.ndarray) -> np.ndarray:
+        x = np.where(np.isnan(x), self._nan_fill, x)
+        # (不同分裂数, 行数)的比较结果
+        bits = np.ascontiguousarray((x[:, self._unique_feature] > self._unique_border).T).astype(self._leaf_dtype)
+        # (树数, 行数)的叶子编号：第d层分裂对应叶子编号的第d位
+        leaves = bits[self._split_index[:, 0]]
+        for d in range(1, self.depth):
+            leaves |= bits[self._split_index[:, d]] << d
+        return leaves
+
+    def _raw_block(self, x: np.ndarray) -> np.ndarray:
+        return np.take(self._flat_leaves, self._leaves(x) + self._leaf_offset).sum(axis=0)
+
+    def predict_raw(self, x: np.ndarray) -> np.ndarray:
+        x = self._prepare(x)
+        raw = np.empty(len(x), dtype=np.float64)
+        for start in range(0, len(x), BLOCK_ROWS):
+            raw[start:start + BLOCK_ROWS] = self._raw_block(x[start:start + BLOCK_ROWS])
+        return raw * self.scale + self.bias
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        # 与CatBoostClassifier.predict_proba相同的(行数, 2)输出，第1列为正类概率
+        positive = 1.0 / (1.0 + np.exp(-self.predict_raw(x)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def _build_shap_table(self):
+        """路径相关树SHAP（与CatBoost的ShapValues相同，按训练样本的叶子权重求条件期望）。
+        对称树中样本的SHAP值只取决于它落在哪个叶子，因此预先算出 (树数, 叶子数, 层数) 的贡献表，
+        解释时与预测一样只需查表"""
+        n_leaves = 1 << self.depth
+        shape = (self.n_trees,) + (2,) * self.depth
+        # reshape后第1+j个轴对应叶子编号的第 depth-1-j 位
+        axis_of = [1 + self.depth - 1 - d for d in range(self.depth)]
+        weights = self.leaf_weights.reshape(shape)
+
+        # 未按样本路径走的层，按子节点与父节点的权重之比向两侧分配。与CatBoost一致，最后一层分裂视为根节点：
+        # covers[d]为第d层分裂所在节点（第d位及以上各位相同的叶子）的总权重
+        def _cover(d):
+            return np.broadcast_to(weights.sum(axis=tuple(axis_of[:d]), keepdims=True), shape).reshape(self.n_trees, n_leaves)
+        covers = [_cover(d) for d in range(self.depth + 1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = [np.nan_to_num(covers[d] / covers[d + 1]) for d in range(self.depth)]
+
+        # 每棵树按"层->特征"的分组方式取对应的Shapley系数
+        coefficients: Dict[Tuple[int, ...], np.ndarray] = {}
+        coef = np.zeros((self.n_trees, self.depth, n_leaves))
+        for t in range(self.n_trees):
+            players: Dict[int, int] = {}
+            signature = tuple(-1 if np.isinf(self.split_border[t, d]) else players.setdefault(int(self.split_feature[t, d]), len(players))
+                              for d in range(self.depth))
+            if not players:
+                continue
+            if signature not in coefficients:
+                coefficients[signature] = _shapley_coefficients(signature)
+            coef[t] = coefficients[signature]
+
+        # 按层掩码逐一计算条件期望 v(掩码)[树, 叶子]，按系数累加到贡献表
+        table = np.zeros((self.n_trees, n_leaves, self.depth))
+        for mask in range(n_leaves):
+            if not coef[:, :, mask].any():
+                continue
+            weighted = self.leaf_values.copy()
+            for d in range(self.depth):
+                if not mask >> d & 1:
+                    weighted *= ratios[d]
+            # 掩码外的层求和（与样本无关），掩码内的层与样本路径一致
+            free = tuple(axis_of[d] for d in range(self.depth) if not mask >> d & 1)
+            expectation = np.broadcast_to(weighted.reshape(shape).sum(axis=free, keepdims=True), shape)
+            table += expectation.reshape(self.n_trees, n_leaves)[:, :, None] * coef[:, None, :, mask]
+        total = self.leaf_weights.sum(axis=1)
+        expected = np.divide((self.leaf_values * self.leaf_weights).sum(axis=1), total,
+                             out=np.zeros(self.n_trees), where=total > 0)
+        self.expected_value = float(expected.sum() * self.scale + self.bias)
+        # 每层的贡献按该层的特征汇总到特征列
+        self._shap_onehot = np.zeros((self.n_trees * self.depth, len(self.feature_names)))
+        self._shap_onehot[np.arange(self.n_trees * self.depth), self.split_feature.ravel()] = 1.0
+        self._shap_table = table * self.scale
+
+    def prepare_explanations(self):
+        """预先计算树SHAP查找表（几百毫秒），之后每次解释只需查表"""
+        if self.leaf_weights is None:
+            raise ValueError("模型文件缺少leaf_weights，请重新运行export_catboost_numpy.py导出")
+        if self._shap_table is None:
+            with self._shap_lock:
+                if self._shap_table is None:
+                    self._build_shap_table()
+
+    def explain(self, x: np.ndarray) -> Tuple[np.ndarray, float]:
+        """各特征对原始输出（对数几率）的贡献 (行数, 特征数) 与期望值；贡献之和加期望值等于predict_raw"""
+        self.prepare_explanations()
+        x = self._prepare(x)
+        contributions = np.empty((len(x), len(self.feature_names)))
+        tree_index = np.arange(self.n_trees)[:, None]
+        for start in range(0, len(x), BLOCK_ROWS):
+            leaves = self._leaves(x[start:start + BLOCK_ROWS])
+            per_level = self._shap_table[tree_index, leaves]  # (树数, 行数, 层数)
+            contributions[start:start + BLOCK_ROWS] = per_level.transpose(1, 0, 2).reshape(len(leaves[0]), -1) @ self._shap_onehot
+        return contributions, self.expected_value
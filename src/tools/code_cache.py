@@ -0,0 +1,127 @@
+import ast
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 引入这些模块（或其子模块）的代码结果可能随时间、随机数、网络、文件或进程环境变化；按完整的点分路径前缀匹配
+NONDETERMINISTIC_MODULES = {
+    'time', 'datetime', 'random', 'secrets', 'uuid', 'os', 'sys', 'platform', 'getpass',
+    'socket', 'ssl', 'requests', 'urllib', 'urllib3', 'http', 'httpx', 'aiohttp', 'ftplib', 'smtplib', 'webbrowser',
+    'subprocess', 'shutil', 'tempfile', 'glob', 'pathlib', 'io', 'sqlite3', 'pickle', 'csv',
+    'threading', 'multiprocessing', 'concurrent', 'asyncio', 'signal',
+    'builtins', 'importlib', 'ctypes', 'gc', 'inspect',
+    # 第三方库中的随机采样
+    'numpy.random', 'scipy.stats.qmc', 'scipy.stats.sampling', 'sklearn.datasets', 'torch.random',
+}
+# 直接调用即不确定的内置函数；set/frozenset的字符串迭代顺序受哈希随机化影响，跨进程不稳定；
+# getattr/globals等动态访问可以绕过名称检查（如 getattr(__builtins__, "op"+"en")），一律不缓存
+NONDETERMINISTIC_NAMES = {
+    'open', 'input', 'exec', 'eval', '__import__', 'breakpoint', 'id', 'hash', 'set', 'frozenset',
+    'getattr', '__builtins__', 'globals', 'locals', 'vars', 'compile', '__loader__', '__spec__',
+}
+NONDETERMINISTIC_ATTRIBUTES = {
+    'random', 'now', 'today', 'utcnow', 'urandom', 'getenv', 'environ',
+    # numpy/scipy的采样接口，如 scipy.stats.norm.rvs()、rng.standard_normal()
+    'rvs', 'default_rng', 'RandomState', 'Generator', 'rand', 'randn', 'randint', 'random_sample',
+    # 经对象属性到达内置函数或模块
+    '__builtins__', '__globals__', '__dict__', '__subclasses__', '__import__', '__loader__', '__code__',
+    # 读文件：文件内容可能变化，如 pd.read_csv('data/water_potability.csv')、np.loadtxt('x.txt')
+    'read_csv', 'read_excel', 'read_json', 'read_parquet', 'read_table', 'read_fwf', 'read_pickle',
+    'read_sql', 'read_html', 'read_feather', 'read_hdf', 'loadtxt', 'genfromtxt', 'fromfile', 'load', 'memmap',
+    # 采样与打乱：未固定随机种子时每次结果不同，按名称一律不缓存
+    'sample', 'shuffle', 'permutation', 'choice', 'train_test_split',
+}
+# 作为参数表示当前时间的字符串，如 pd.Timestamp('now')、np.datetime64('today')
+NONDETERMINISTIC_STRINGS = {'now', 'today', 'utcnow'}
+
+def _module_denied(path: str) -> bool:
+    # "numpy.random.mtrand" 的任一前缀（numpy / numpy.random / ...）在黑名单中即不确定
+    parts = path.split('.')
+    return any('.'.join(parts[:i]) in NONDETERMINISTIC_MODULES for i in range(1, len(parts) + 1))
+
+def _nondeterministic(tree: ast.AST) -> Optional[str]:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if _module_denied(alias.name):
+                    return alias.name
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if _module_denied(module):
+                return module
+            for alias in node.names:
+                # from numpy import random / from numpy.random import rand / from x import *
+                if alias.name == '*' or _module_denied(f"{module}.{alias.name}") \
+                        or alias.name in NONDETERMINISTIC_NAMES or alias.name in NONDETERMINISTIC_ATTRIBUTES:
+                    return f"{module}.{alias.name}"
+        elif isinstance(node, ast.Name) and node.id in NONDETERMINISTIC_NAMES:
+            return node.id
+        elif isinstance(node, ast.Attribute) and node.attr in NONDETERMINISTIC_ATTRIBUTES:
+            return node.attr
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return "set"
+        elif isinstance(node, ast.Call):
+            for arg in node.args + [keyword.value for keyword in node.keywords]:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str) \
+                        and arg.value.strip().lower() in NONDETERMINISTIC_STRINGS:
+                    return arg.value
+    return None
+
+def cache_key(code: str, language: str) -> Tuple[Optional[str], Optional[str]]:
+    # 返回(缓存键, 不可缓存原因)；Python代码按AST归一化，忽略注释、空白与格式差异
+    if language.lower() not in ("python", "python3", "py"):
+        return None, f"不缓存{language}代码"
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None, "语法错误"
+    reason = _nondeterministic(tree)
+    if reason:
+        return None, f"使用了不确定的操作: {reason}"
+    normalized = ast.dump(tree, annotate_fields=False)
+    return hashlib.sha256(f"python\n{normalized}".encode("utf-8")).hexdigest(), None
+
+class CodeResultCache:
+    """确定性代码执行结果缓存，按最近使用淘汰并带过期时间"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "uncacheable": self.uncacheable,
+                "evictions": self.evictions, "expirations": self.expirations}
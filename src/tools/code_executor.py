@@ -1,11 +1,33 @@
 import os
+import sys
+import json
 import time
+import queue
+import signal
+import atexit
+import shutil
+import asyncio
+import tempfile
+import weakref
+import threading
+import subprocess
 import requests
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
 from src.utils.logger import setup_logger
+from src.tools.code_cache import CodeResultCache, cache_key
+from src.utils.lazy import LazyBackend
+from src.utils.tracing import trace_span
 
 logger = setup_logger(__name__)
 
+# HTTP连接超时，以及在执行超时之外为编译/网络预留的时间（秒）
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_TIMEOUT_MARGIN = 5
+
 @dataclass
 class CodeExecutionResult:
     success: bool
@@ -13,72 +35,396 @@ class CodeExecutionResult:
     error: str
     execution_time: float
 
-class SandboxFusionExecutor:
+class CodeExecutorBackend(ABC):
+    """代码执行后端接口，子类至少实现同步的execute_code"""
+    
+    name = "base"
+    max_concurrency = 1
+    
+    @abstractmethod
+    def execute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        ...
+    
+    async def aexecute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        # 默认在线程池中执行同步实现
+        return await asyncio.to_thread(self.execute_code, code, language, timeout)
+    
+    def execute_many(self, codes: List[str], language: str = "python", timeout: Optional[int] = None) -> List[CodeExecutionResult]:
+        # 并行执行多段代码，结果与输入顺序一致，并发受后端自身的信号量限制
+        if not codes:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(codes))) as pool:
+            return list(pool.map(lambda code: self.execute_code(code, language, timeout), codes))
+    
+    async def aexecute_many(self, codes: List[str], language: str = "python", timeout: Optional[int] = None) -> List[CodeExecutionResult]:
+        return list(await asyncio.gather(*(self.aexecute_code(code, language, timeout) for code in codes)))
+
+class SandboxFusionExecutor(CodeExecutorBackend):
+    name = "sandbox_fusion"
+    
     def __init__(self):
         self.base_url = os.getenv("SANDBOX_FUSION_URL", "http://localhost:8080").rstrip('/')
+        
+        # 从环境变量读取超时与并发配置
+        self.default_timeout = int(os.getenv("CODE_EXECUTION_TIMEOUT", "30"))
+        self.max_concurrency = int(os.getenv("CODE_EXECUTION_MAX_CONCURRENCY", "8"))
+        
+        # 连接池大小与并发上限一致，超出的请求在信号量处排队
         self.session = requests.Session()
         self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
         
-        # 从环境变量读取超时配置
-        self.default_timeout = int(os.getenv("CODE_EXECUTION_TIMEOUT", "30"))
+        # 同步与异步调用共用同一个并发上限；异步客户端与等待队列绑定事件循环，按事件循环分别创建
+        self._async_states: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
         
-        logger.info(f"初始化SandboxFusion执行器: {self.base_url}, 默认超时: {self.default_timeout}秒")
+        logger.info(f"初始化SandboxFusion执行器: {self.base_url}, 默认超时: {self.default_timeout}秒, 并发上限: {self.max_concurrency}")
     
-    def execute_code(self, code: str, language: str = "python", timeout: int = 30) -> CodeExecutionResult:
-        # 使用环境变量的超时配置
-        timeout = self.default_timeout
+    def _payload(self, code: str, language: str, timeout: int) -> Dict:
+        # run_timeout由沙箱强制执行，HTTP超时额外留出编译与网络开销
+        return {"code": code, "language": language, "run_timeout": timeout}
+    
+    def _parse_response(self, status_code: int, body: Dict, text: str, execution_time: float) -> CodeExecutionResult:
+        if status_code == 200:
+            result = body
+            success = result.get('status') == 'Success'
+            
+            run_result = result.get('run_result') or {}
+            output = run_result.get('stdout', '')
+            error = run_result.get('stderr', '')
+            
+            if not success:
+                message = result.get('message', '')
+                if message:
+                    error = f"{error}\n{message}".strip()
+            
+            logger.info(f"代码执行{'成功' if success else '失败'}，耗时{execution_time:.3f}秒")
+            
+            return CodeExecutionResult(success, output, error, execution_time)
+        else:
+            error_msg = f'HTTP {status_code}: {text}'
+            logger.error(f"代码执行失败: {error_msg}")
+            return CodeExecutionResult(False, '', error_msg, execution_time)
+    
+    def execute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        timeout = timeout or self.default_timeout
             
         logger.debug(f"执行{language}代码，超时{timeout}秒")
-        start_time = time.time()
         
-        try:
-            payload = {"code": code, "language": language}
-            response = self.session.post(
-                f"{self.base_url}/run_code",
-                json=payload, 
-                timeout=timeout
+        with self._semaphore, trace_span("sandbox.execute", backend=self.name):
+            start_time = time.time()
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/run_code",
+                    json=self._payload(code, language, timeout),
+                    timeout=(HTTP_CONNECT_TIMEOUT, timeout + HTTP_TIMEOUT_MARGIN)
+                )
+                execution_time = time.time() - start_time
+                body = response.json() if response.status_code == 200 else {}
+                return self._parse_response(response.status_code, body, response.text, execution_time)
+                    
+            except requests.exceptions.Timeout:
+                error_msg = f'代码执行超时 ({timeout}秒)'
+                logger.warning(error_msg)
+                return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+                
+            except requests.exceptions.ConnectionError:
+                error_msg = '无法连接到SandboxFusion服务'
+                logger.error(error_msg)
+                return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+                
+            except Exception as e:
+                error_msg = f'执行出错: {str(e)}'
+                logger.error(error_msg)
+                return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+    
+    def _async_state(self):
+        # 当前事件循环的(httpx客户端, 等待队列)；事件循环被回收后随之释放
+        loop = asyncio.get_running_loop()
+        state = self._async_states.get(loop)
+        if state is None:
+            import httpx
+            client = httpx.AsyncClient(
+                headers={'Content-Type': 'application/json'},
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
             )
-            
-            execution_time = time.time() - start_time
-            
-            if response.status_code == 200:
-                result = response.json()
-                success = result.get('status') == 'Success'
+            state = (client, asyncio.Semaphore(self.max_concurrency))
+            self._async_states[loop] = state
+        return state
+    
+    async def _acquire_shared(self):
+        # 获取与同步调用共享的许可；需要等待时在线程中阻塞，不占用事件循环
+        if self._semaphore.acquire(blocking=False):
+            return
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._semaphore.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # 调用方被取消时线程仍会拿到许可，拿到后立即归还
+            waiter.add_done_callback(lambda f: f.cancelled() or f.exception() or self._semaphore.release())
+            raise
+    
+    async def aexecute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        import httpx
+        timeout = timeout or self.default_timeout
+        client, waiters = self._async_state()
+        
+        logger.debug(f"异步执行{language}代码，超时{timeout}秒")
+        
+        with trace_span("sandbox.execute", backend=self.name):
+            # 事件循环内的信号量限制同时等待共享许可的线程数
+            async with waiters:
+                await self._acquire_shared()
+                start_time = time.time()
+                try:
+                    response = await client.post(
+                        f"{self.base_url}/run_code",
+                        json=self._payload(code, language, timeout),
+                        timeout=httpx.Timeout(timeout + HTTP_TIMEOUT_MARGIN, connect=HTTP_CONNECT_TIMEOUT)
+                    )
+                    execution_time = time.time() - start_time
+                    body = response.json() if response.status_code == 200 else {}
+                    return self._parse_response(response.status_code, body, response.text, execution_time)
                 
-                run_result = result.get('run_result', {})
-                output = run_result.get('stdout', '')
-                error = run_result.get('stderr', '')
+                except httpx.TimeoutException:
+                    error_msg = f'代码执行超时 ({timeout}秒)'
+                    logger.warning(error_msg)
+                    return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
                 
-                if not success:
-                    message = result.get('message', '')
-                    if message:
-                        error = f"{error}\n{message}".strip()
+                except httpx.ConnectError:
+                    error_msg = '无法连接到SandboxFusion服务'
+                    logger.error(error_msg)
+                    return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
                 
-                logger.info(f"代码执行{'成功' if success else '失败'}，耗时{execution_time:.3f}秒")
+                except Exception as e:
+                    error_msg = f'执行出错: {str(e)}'
+                    logger.error(error_msg)
+                    return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
                 
+                finally:
+                    self._semaphore.release()
+
+# 本地工作进程脚本：先完成预导入，再阻塞等待任务；收到任务后设置资源限制并执行
+_WORKER_SCRIPT = r"""
+import sys, json, importlib, traceback
+for _name in sys.argv[1:]:
+    try:
+        importlib.import_module(_name)
+    except Exception:
+        pass
+_header = json.loads(sys.stdin.readline())
+try:
+    import resource
+    _usage = resource.getrusage(resource.RUSAGE_SELF)
+    _cpu = int(_usage.ru_utime + _usage.ru_stime) + _header["timeout"] + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (_cpu, _cpu + 1))
+    if _header["memory"]:
+        resource.setrlimit(resource.RLIMIT_AS, (_header["memory"], _header["memory"]))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (_header["max_file"], _header["max_file"]))
+except ImportError:
+    pass
+_code = sys.stdin.read()
+try:
+    exec(compile(_code, "<sandbox>", "exec"), {"__name__": "__main__"})
+except SystemExit:
+    raise
+except BaseException:
+    traceback.print_exc()
+    sys.exit(1)
+"""
+
+@dataclass
+class _Worker:
+    process: subprocess.Popen
+    workdir: str
+
+class LocalSubprocessExecutor(CodeExecutorBackend):
+    """本地预启动Python工作进程池：进程提前启动并完成预导入，每个进程只执行一段代码，
+    在独立的临时目录中运行，并受CPU时间、内存、文件大小(rlimit)与墙钟超时限制。
+    注意：它不提供文件系统与网络隔离，仅适合离线开发测试或受信任的环境。"""
+    
+    name = "local"
+    
+    def __init__(self):
+        self.default_timeout = int(os.getenv("CODE_EXECUTION_TIMEOUT", "30"))
+        self.pool_size = int(os.getenv("LOCAL_SANDBOX_WORKERS", "4"))
+        self.max_concurrency = int(os.getenv("CODE_EXECUTION_MAX_CONCURRENCY", str(self.pool_size)))
+        self.memory_limit = int(os.getenv("LOCAL_SANDBOX_MEMORY_MB", "1024")) * 1024 * 1024
+        self.max_file_size = int(os.getenv("LOCAL_SANDBOX_MAX_FILE_MB", "16")) * 1024 * 1024
+        self.max_output = int(os.getenv("LOCAL_SANDBOX_MAX_OUTPUT", "65536"))
+        self.preimport = [name.strip() for name in os.getenv(
+            "LOCAL_SANDBOX_PREIMPORT", "math,json,re,random,itertools,collections,statistics,datetime,decimal,fractions"
+        ).split(",") if name.strip()]
+        
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._ready: "queue.Queue[_Worker]" = queue.Queue()
+        self._refill_lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.pool_size):
+            self._ready.put(self._spawn())
+        atexit.register(self.shutdown)
+        
+        logger.info(f"初始化本地沙箱执行器: {self.pool_size} 个预启动进程, 默认超时: {self.default_timeout}秒")
+    
+    def _spawn(self) -> _Worker:
+        workdir = tempfile.mkdtemp(prefix="sandbox_")
+        process = subprocess.Popen(
+            [sys.executable, "-I", "-c", _WORKER_SCRIPT, *self.preimport],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=workdir, env={"PATH": os.environ.get("PATH", ""), "HOME": workdir, "PYTHONIOENCODING": "utf-8"},
+            start_new_session=True,
+        )
+        return _Worker(process, workdir)
+    
+    def _acquire(self) -> _Worker:
+        # 优先使用已就绪的进程，池空时临时启动一个
+        while True:
+            try:
+                worker = self._ready.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            if worker.process.poll() is None:
+                return worker
+            self._discard(worker)
+    
+    def _discard(self, worker: _Worker):
+        # 工作进程以独立会话启动，按进程组结束，用户代码派生的子孙进程一并结束
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(worker.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if worker.process.poll() is None:
+            worker.process.kill()
+        worker.process.wait()
+        shutil.rmtree(worker.workdir, ignore_errors=True)
+    
+    def _refill(self):
+        # 在后台补充就绪进程，使下一次调用无需等待进程启动和预导入
+        if not self._refill_lock.acquire(blocking=False):
+            return
+        try:
+            while not self._closed and self._ready.qsize() < self.pool_size:
+                self._ready.put(self._spawn())
+        finally:
+            self._refill_lock.release()
+    
+    def _truncate(self, text: str) -> str:
+        if len(text) > self.max_output:
+            return text[:self.max_output] + f"\n...（输出过长，已截断，共{len(text)}字符）"
+        return text
+    
+    def execute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        if language.lower() not in ("python", "python3", "py"):
+            return CodeExecutionResult(False, '', f'本地沙箱仅支持Python，不支持: {language}', 0.0)
+        timeout = timeout or self.default_timeout
+        
+        logger.debug(f"本地执行{language}代码，超时{timeout}秒")
+        
+        with self._semaphore, trace_span("sandbox.execute", backend=self.name):
+            worker = self._acquire()
+            threading.Thread(target=self._refill, name="sandbox-refill", daemon=True).start()
+            start_time = time.time()
+            header = json.dumps({"timeout": timeout, "memory": self.memory_limit, "max_file": self.max_file_size})
+            try:
+                stdout, stderr = worker.process.communicate(
+                    input=(header + "\n" + code).encode("utf-8"), timeout=timeout
+                )
+                execution_time = time.time() - start_time
+                success = worker.process.returncode == 0
+                output = self._truncate(stdout.decode("utf-8", errors="replace"))
+                error = self._truncate(stderr.decode("utf-8", errors="replace"))
+                if not success and not error:
+                    error = f"进程退出码: {worker.process.returncode}（可能超出CPU或内存限制）"
+                logger.info(f"代码执行{'成功' if success else '失败'}，耗时{execution_time:.3f}秒")
                 return CodeExecutionResult(success, output, error, execution_time)
-            else:
-                error_msg = f'HTTP {response.status_code}: {response.text}'
-                logger.error(f"代码执行失败: {error_msg}")
-                return CodeExecutionResult(False, '', error_msg, execution_time)
                 
-        except requests.exceptions.Timeout:
-            error_msg = f'代码执行超时 ({timeout}秒)'
-            logger.warning(error_msg)
-            return CodeExecutionResult(False, '', error_msg, timeout)
-            
-        except requests.exceptions.ConnectionError:
-            error_msg = '无法连接到SandboxFusion服务'
-            logger.error(error_msg)
-            return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+            except subprocess.TimeoutExpired:
+                error_msg = f'代码执行超时 ({timeout}秒)'
+                logger.warning(error_msg)
+                return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+                
+            except Exception as e:
+                error_msg = f'执行出错: {str(e)}'
+                logger.error(error_msg)
+                return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
             
-        except Exception as e:
-            error_msg = f'执行出错: {str(e)}'
-            logger.error(error_msg)
-            return CodeExecutionResult(False, '', error_msg, time.time() - start_time)
+            finally:
+                self._discard(worker)
+    
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._ready.get_nowait())
+            except queue.Empty:
+                break
+
+class CachedExecutor(CodeExecutorBackend):
+    """为任意后端加一层确定性结果缓存：只缓存执行成功且不涉及时间、随机数、网络、文件的Python代码"""
+    
+    def __init__(self, backend: CodeExecutorBackend, cache: CodeResultCache):
+        self.backend = backend
+        self.cache = cache
+        self.name = f"cached_{backend.name}"
+        self.max_concurrency = backend.max_concurrency
+    
+    def _lookup(self, code: str, language: str) -> Tuple[Optional[str], Optional[CodeExecutionResult]]:
+        start_time = time.perf_counter()
+        key, reason = cache_key(code, language)
+        if key is None:
+            self.cache.uncacheable += 1
+            logger.debug(f"代码结果不缓存: {reason}")
+            return None, None
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("代码执行结果命中缓存")
+            return key, replace(cached, execution_time=time.perf_counter() - start_time)
+        return key, None
+    
+    def _store(self, key: Optional[str], result: CodeExecutionResult) -> CodeExecutionResult:
+        if key is not None and result.success:
+            self.cache.put(key, result)
+        return result
+    
+    def execute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        key, cached = self._lookup(code, language)
+        if cached is not None:
+            return cached
+        return self._store(key, self.backend.execute_code(code, language, timeout))
+    
+    async def aexecute_code(self, code: str, language: str = "python", timeout: Optional[int] = None) -> CodeExecutionResult:
+        key, cached = self._lookup(code, language)
+        if cached is not None:
+            return cached
+        return self._store(key, await self.backend.aexecute_code(code, language, timeout))
+    
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+def create_executor() -> CodeExecutorBackend:
+    # 通过CODE_EXECUTOR_BACKEND选择后端: sandbox_fusion（默认）/ local
+    backend = os.getenv("CODE_EXECUTOR_BACKEND", "sandbox_fusion").lower()
+    if backend == "local":
+        executor = LocalSubprocessExecutor()
+    elif backend == "sandbox_fusion":
+        executor = SandboxFusionExecutor()
+    else:
+        raise ValueError(f"不支持的代码执行后端: {backend}")
+    # 可选的确定性结果缓存
+    if os.getenv("CODE_RESULT_CACHE", "0").lower() in ("1", "true", "yes"):
+        cache = CodeResultCache(
+            max_entries=int(os.getenv("CODE_RESULT_CACHE_SIZE", "256")),
+            ttl_seconds=float(os.getenv("CODE_RESULT_CACHE_TTL", "3600"))
+        )
+        logger.info(f"启用代码执行结果缓存: 容量{cache.max_entries}, 过期时间{cache.ttl_seconds}秒")
+        executor = CachedExecutor(executor, cache)
+    return executor
 
-# 全局执行器实例
-executor = SandboxFusionExecutor()
+# 全局执行器实例（首次使用时创建）
+executor = LazyBackend("code_executor", create_executor)
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,126 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from src.tools.lexical_index import tokenize
+from src.utils.tokens import estimate_tokens
+
+# 按句末标点与换行切句，标点保留在句尾
+_SENTENCE = re.compile(r'[^。；！？\n]+[。；！？]?|\n')
+# 相邻块重叠部分的最大检查长度（分块重叠默认200字，留出余量）
+MAX_OVERLAP = 400
+MIN_OVERLAP = 10
+# 越小越相关的分数（向量检索返回的是平方L2距离），合并时取最小值，其余分数取最大值
+DISTANCE_SCORES = frozenset({"similarity_score"})
+
+@dataclass
+class PackedContext:
+    """打包后的一段检索上下文：来源、合并的文档块、保留的各路分数与挑选出的句子"""
+    law_name: str
+    article_no: str
+    chunk_ids: List[str]
+    text: str
+    scores: Dict[str, float] = field(default_factory=dict)
+    tokens: int = 0
+
+    @property
+    def source(self) -> str:
+        return " ".join(filter(None, [self.law_name, self.article_no]))
+
+def _chunk_number(item: Dict[str, Any]) -> Optional[int]:
+    match = re.search(r'(\d+)$', str(item['metadata'].get('chunk_id', '')))
+    return int(match.group(1)) if match else None
+
+def _join(left: str, right: str) -> str:
+    # 去掉分块时相邻块之间的重叠文本
+    for n in range(min(len(left), len(right), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:n]):
+            return left + right[n:]
+    return left + right
+
+def _merge(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 同一文件同一法规同一条中编号相邻的块合并为一段，排名取组内最靠前者。
+    # 块编号跨文件连续，未识别法规名称的块无法确认属于同一段，不合并
+    groups: List[Dict[str, Any]] = []
+    for rank, item in enumerate(results):
+        metadata = item['metadata']
+        key = (metadata.get('source'), metadata.get('law_name'), metadata.get('article_no'))
+        groups.append({"rank": rank, "items": [item], "key": key, "numbers": [_chunk_number(item)]})
+    merged = True
+    while merged:
+        merged = False
+        for a in groups:
+            for b in groups:
+                if a is b or a["key"] != b["key"] or not a["key"][1] or None in a["numbers"] or None in b["numbers"]:
+                    continue
+                if min(b["numbers"]) - max(a["numbers"]) == 1:
+                    a["items"] += b["items"]
+                    a["numbers"] += b["numbers"]
+                    a["rank"] = min(a["rank"], b["rank"])
+                    groups.remove(b)
+                    merged = True
+                    break
+            if merged:
+                break
+    for group in groups:
+        ordered = sorted(group["items"], key=lambda item: _chunk_number(item) or 0)
+        text = ordered[0]['content']
+        for item in ordered[1:]:
+            text = _join(text, item['content'])
+        group["items"], group["text"] = ordered, text
+    return sorted(groups, key=lambda group: group["rank"])
+
+def _select(text: str, query_terms: set, budget: int) -> str:
+    # 按与查询的词项重合数挑句子（同分时靠前优先），在预算内按原文顺序输出，跳过处用省略号
+    if estimate_tokens(text) <= budget:
+        return text.strip()
+    sentences = [s.strip() for s in _SENTENCE.findall(text) if s.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-len(set(tokenize(sentences[i])) & query_terms), i))
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        # 单句即超出预算时截取最相关的一句
+        return sentences[ranked[0]][:budget] + "…" if sentences else ""
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if i != previous + 1:
+            parts.append("…")
+        parts.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        parts.append("…")
+    return "".join(parts)
+
+def pack_context(query: str, results: List[Dict[str, Any]], token_budget: int = 800) -> List[PackedContext]:
+    """把检索结果打包为不超过token预算的上下文：合并相邻/重叠块，每段只保留与查询最相关的句子。
+    预算按排名依次分配，较短的段落用不完的份额留给后面的段落"""
+    groups = _merge(results)
+    query_terms = set(tokenize(query))
+    packed, remaining = [], token_budget
+    for i, group in enumerate(groups):
+        share = remaining // (len(groups) - i)
+        if share <= 0:
+            break
+        text = _select(group["text"], query_terms, share)
+        tokens = estimate_tokens(text)
+        remaining -= tokens
+        scores: Dict[str, float] = {}
+        for item in group["items"]:
+            for key, value in item.items():
+                if key.endswith('_score') and isinstance(value, (int, float)):
+                    best = min if key in DISTANCE_SCORES else max
+                    scores[key] = best(scores.get(key, value), value)
+        metadata = group["items"][0]['metadata']
+        packed.append(PackedContext(
+            law_name=metadata.get('law_name', ''),
+            article_no=metadata.get('article_no', ''),
+            chunk_ids=[item['metadata'].get('chunk_id', '') for item in group["items"]],
+            text=text,
+            scores=scores,
+            tokens=tokens,
+        ))
+    return packed
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.utils.logger import setup_logger
+from src.utils.tracing import trace_span
+
+logger = setup_logger("EmbeddingCache")
+
+def normalize_query(text: str) -> str:
+    # 全角转半角、合并空白，使等价查询命中同一缓存项
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+class SQLiteEmbeddingStore:
+    """持久化查询向量缓存，按模型名+文本哈希索引，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, db_path: str, max_entries: int = 100000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON query_embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        logger.info(f"持久化向量缓存: {self.db_path}, 已有 {self._size} 条")
+
+    def get(self, model: str, text_hash: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND text_hash = ?", (model, text_hash)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                (time.time(), model, text_hash)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def put(self, model: str, text_hash: str, vector: List[float]):
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO query_embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                (model, text_hash, blob, time.time())
+            )
+            self._size += cursor.rowcount
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM query_embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+                self._size -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self._size, "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+class CachedEmbeddings(Embeddings):
+    """查询向量两级缓存：进程内LRU在前，可选SQLite持久层在后；文档向量不缓存"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_entries: int = 1024,
+                 store: Optional[SQLiteEmbeddingStore] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+        return None
+
+    def _remember(self, key: str, vector: List[float]):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized = normalize_query(text)
+        key = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+        with trace_span("embedding.query") as span:
+            vector = self._lookup(key)
+            source = "memory"
+            if vector is None and self.store is not None:
+                vector = self.store.get(self.model_name, key)
+                source = "disk"
+            if vector is None:
+                vector = self.embeddings.embed_query(normalized)
+                source = "model"
+                if self.store is not None:
+                    self.store.put(self.model_name, key, vector)
+            if source != "memory":
+                self._remember(key, vector)
+            if span is not None:
+                span.set(source=source)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {"memory": {"size": len(self._cache), "max_entries": self.max_entries,
+                            "hits": self.hits, "misses": self.misses, "evictions": self.evictions}}
+        if self.store is not None:
+            stats["disk"] = self.store.stats()
+        return stats
@@ -0,0 +1,158 @@
+import os
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.utils.logger import setup_logger
+
+logger = setup_logger("Embeddings")
+
+DEFAULT_MODEL_NAME = "BAAI/bge-large-zh-v1.5"
+
+def vector_db_path() -> Path:
+    # 向量库目录，可通过VECTOR_DB_PATH指向其他位置（基准测试、评测使用临时库）
+    default = Path(__file__).parent.parent.parent/"models/vector_db"
+    return Path(os.getenv("VECTOR_DB_PATH") or default)
+
+class HashEmbeddings(Embeddings):
+    """特征哈希嵌入：中文二元组与英文单词哈希到固定维度后归一化。
+    无需模型文件与网络，仅用于离线基准测试与开发调试，检索质量远低于BGE"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        from src.tools.lexical_index import tokenize
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+class OnnxEmbeddings(Embeddings):
+    """ONNX Runtime推理的BGE嵌入（CLS池化+归一化，与HuggingFaceEmbeddings一致），
+    可加载int8动态量化模型；模型由scripts/model_export/export_onnx_embeddings.py导出"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, threads: int = 0,
+                 max_length: int = 512, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        model_path = Path(model_dir) / ("model.int8.onnx" if quantized else "model.onnx")
+        if not model_path.exists():
+            raise FileNotFoundError(f"ONNX模型不存在，请先运行export_onnx_embeddings.py: {model_path}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        # tokenizers库比transformers轻量得多，不拖慢冷启动
+        self.tokenizer = Tokenizer.from_file(str(Path(model_dir) / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        logger.info(f"ONNX嵌入模型加载成功: {model_path}, 线程数: {threads or '默认'}")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        cls = hidden[:, 0]
+        return cls / np.linalg.norm(cls, axis=1, keepdims=True)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 按长度排序后分批，减少同批内的填充
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+def onnx_model_dir() -> Path:
+    default = Path(__file__).parent.parent.parent/"models/onnx"/Path(os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_MODEL_NAME)).name
+    return Path(os.getenv("EMBEDDING_ONNX_DIR") or default)
+
+def _huggingface_embeddings(model_name: str, batch_size: Optional[int]) -> Embeddings:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    # 优先使用本地缓存
+    model_kwargs = {
+        'device': 'cpu',
+        'local_files_only': True,  # 只使用本地文件
+    }
+    encode_kwargs = {
+        'normalize_embeddings': True
+    }
+    if batch_size:
+        encode_kwargs['batch_size'] = batch_size
+    logger.info(f"尝试从本地缓存加载模型: {model_name}")
+    try:
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs=encode_kwargs
+        )
+        logger.info("成功从本地缓存加载模型")
+    except Exception as e:
+        logger.error(f"本地缓存加载失败: {e}")
+        logger.info("尝试在线下载模型...")
+        # 如果本地缓存失败，尝试在线下载
+        model_kwargs['local_files_only'] = False
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs=encode_kwargs
+        )
+        logger.info("在线下载模型成功")
+    return embeddings
+
+def embedding_model_id() -> str:
+    # 模型标识用于向量缓存键与向量库清单，切换后端或量化方式时不会混用向量；不加载模型
+    backend = os.getenv("EMBEDDING_BACKEND", "huggingface").lower()
+    if backend == "hash":
+        return f"hash-{int(os.getenv('HASH_EMBEDDING_DIM', '512'))}"
+    model_name = os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_MODEL_NAME)
+    if backend == "onnx":
+        quantized = os.getenv("EMBEDDING_ONNX_QUANTIZED", "1").lower() in ("1", "true", "yes")
+        return f"{model_name}#onnx-{'int8' if quantized else 'fp32'}"
+    return model_name
+
+def create_embeddings(batch_size: Optional[int] = None) -> Tuple[Embeddings, str]:
+    """按EMBEDDING_BACKEND创建嵌入模型: huggingface（默认，PyTorch）/ onnx（ONNX Runtime，可int8量化）/ hash（离线桩）。
+    返回(嵌入模型, 模型标识)"""
+    backend = os.getenv("EMBEDDING_BACKEND", "huggingface").lower()
+    model_id = embedding_model_id()
+    if backend == "huggingface":
+        return _huggingface_embeddings(model_id, batch_size), model_id
+    if backend == "onnx":
+        embeddings = OnnxEmbeddings(
+            str(onnx_model_dir()),
+            quantized=os.getenv("EMBEDDING_ONNX_QUANTIZED", "1").lower() in ("1", "true", "yes"),
+            threads=int(os.getenv("EMBEDDING_THREADS", "0")),
+            max_length=int(os.getenv("EMBEDDING_MAX_LENGTH", "512")),
+            batch_size=batch_size or 32,
+        )
+        return embeddings, model_id
+    if backend == "hash":
+        dim = int(os.getenv("HASH_EMBEDDING_DIM", "512"))
+        logger.warning(f"使用哈希嵌入（{dim}维），仅适用于离线测试")
+        return HashEmbeddings(dim), model_id
+    raise ValueError(f"不支持的嵌入后端: {backend}")
@@ -0,0 +1,106 @@
+import math
+import pickle
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from src.utils.logger import setup_logger
+
+logger = setup_logger("LexicalIndex")
+
+# 中文字符连续片段 / 英文数字片段
+_CJK_RUN = re.compile(r'[一-鿿㐀-䶿]+')
+_ASCII_RUN = re.compile(r'[A-Za-z0-9]+')
+
+def tokenize(text: str) -> List[str]:
+    # 中文按字符二元组切分（单字片段保留单字），英文数字按词切分
+    text = unicodedata.normalize("NFKC", text)
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(word.lower() for word in _ASCII_RUN.findall(text))
+    return tokens
+
+class BM25Index:
+    """基于中文字符n-gram的BM25倒排索引"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Dict[str, Any]] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_doc_length = 0.0
+
+    def build(self, documents: List[Any]):
+        # documents: LangChain Document列表（page_content + metadata）
+        postings = defaultdict(list)
+        self.documents = []
+        self.doc_lengths = []
+        for doc_id, doc in enumerate(documents):
+            tokens = tokenize(doc.page_content)
+            for term, freq in Counter(tokens).items():
+                postings[term].append((doc_id, freq))
+            self.doc_lengths.append(len(tokens))
+            self.documents.append({"content": doc.page_content, "metadata": dict(doc.metadata)})
+        self.postings = dict(postings)
+        self.avg_doc_length = sum(self.doc_lengths) / max(len(self.doc_lengths), 1)
+        logger.info(f"BM25索引构建完成: {len(self.documents)} 个文档, {len(self.postings)} 个词项")
+        return self
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        n_docs = len(self.documents)
+        if n_docs == 0:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, freq in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {
+                'content': self.documents[doc_id]['content'],
+                'metadata': self.documents[doc_id]['metadata'],
+                'bm25_score': float(score)
+            }
+            for doc_id, score in top
+        ]
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls()
+        with open(path, 'rb') as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 5, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    # 按chunk_id合并多路结果，得分为各路 1/(rrf_k + rank) 之和
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, 1):
+            key = item['metadata'].get('chunk_id') or item['content']
+            entry = fused.setdefault(key, {**item, 'rrf_score': 0.0})
+            # 保留各路的原始分数
+            for field, value in item.items():
+                if field.endswith('_score'):
+                    entry.setdefault(field, value)
+            entry['rrf_score'] += 1.0 / (rrf_k + rank)
+    ranked = sorted(fused.values(), key=lambda item: item['rrf_score'], reverse=True)
+    return ranked[:k]
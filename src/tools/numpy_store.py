@@ -0,0 +1,150 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from src.utils.logger import setup_logger
+
+logger = setup_logger("NumpyStore")
+
+# 向量库目录下的子目录名；由build_vector_db.py --numpy-store生成
+STORE_DIR = "numpy_store"
+DTYPES = ("float32", "float16", "int8")
+FORMAT_VERSION = 1
+# 不预先反量化时，按块反量化后计算，限制临时内存
+BLOCK_ROWS = 4096
+
+def l2_distance(cosine: np.ndarray) -> np.ndarray:
+    # 与Chroma默认l2空间返回的平方L2距离一致（归一化向量下为2-2cos，越小越相关），两种后端的得分可以直接比较
+    return np.maximum(2.0 - 2.0 * cosine, 0.0)
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def _replace(path: Path, write):
+    # 先写临时文件再原子替换，正在内存映射旧文件的进程不受影响
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+def _save_array(path: Path, array: np.ndarray):
+    # np.save按文件名会追加.npy后缀，临时文件用文件对象写入
+    def write(tmp: Path):
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+    _replace(path, write)
+
+def write_numpy_store(path: str, vectors: Sequence[Sequence[float]], contents: List[str],
+                      metadatas: List[Dict[str, Any]], dtype: str = "float16", embedding_model: str = ""):
+    """写出向量矩阵（float32/float16/int8）与按列存储的元数据"""
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的向量类型: {dtype}，可选 {', '.join(DTYPES)}")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(contents), -1))
+
+    if dtype == "int8":
+        # 逐行对称量化，每行一个缩放系数
+        scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127
+        stored = np.round(matrix / scales[:, None]).astype(np.int8)
+        _save_array(path / "scales.npy", scales.astype(np.float32))
+    else:
+        stored = matrix.astype(dtype)
+    _save_array(path / "vectors.npy", stored)
+
+    keys = sorted({key for metadata in metadatas for key in metadata})
+    sidecar = {"content": contents, "columns": {key: [metadata.get(key) for metadata in metadatas] for key in keys}}
+    _replace(path / "metadata.json", lambda tmp: tmp.write_text(json.dumps(sidecar, ensure_ascii=False), encoding="utf-8"))
+    # store.json最后写入，作为格式完整的标志
+    info = {"format": FORMAT_VERSION, "dtype": dtype, "count": len(contents), "dim": int(matrix.shape[1]),
+            "embedding_model": embedding_model}
+    _replace(path / "store.json", lambda tmp: tmp.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8"))
+    logger.info(f"NumPy向量库已写出: {path}, {len(contents)} 条, {dtype}, "
+                f"{stored.nbytes / 1024 / 1024:.1f} MB")
+
+class NumpyVectorStore:
+    """内存映射的精确向量检索：一次矩阵-向量乘积 + argpartition 取top-k，召回率与暴力检索一致。
+    float32矩阵直接在映射上计算，多个进程经页缓存共享同一份数据；float16/int8默认加载时反量化为float32"""
+
+    def __init__(self, path: str, upcast: bool = True):
+        self.path = Path(path)
+        with open(self.path / "store.json", 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        if self.info.get("format") != FORMAT_VERSION:
+            raise ValueError(f"NumPy向量库格式版本不匹配: {self.info.get('format')}，请重新构建")
+        self.embedding_model = self.info.get("embedding_model", "")
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(self.path / "scales.npy", mmap_mode="r") if self.info["dtype"] == "int8" else None
+        with open(self.path / "metadata.json", 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        self.contents: List[str] = sidecar["content"]
+        self.columns: Dict[str, List[Any]] = sidecar["columns"]
+
+        # 参与计算的float32矩阵；为None时按块反量化
+        if self.info["dtype"] == "float32":
+            self.matrix = self.vectors
+        elif upcast:
+            self.matrix = self._dequantize(0, len(self))
+        else:
+            self.matrix = None
+        logger.info(f"NumPy向量库加载成功: {len(self)} 条, {self.info['dtype']}, "
+                    f"{'内存映射' if self.matrix is self.vectors else ('已反量化' if upcast else '按块反量化')}")
+
+    def __len__(self) -> int:
+        return int(self.info["count"])
+
+    def _dequantize(self, start: int, end: int) -> np.ndarray:
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:end, None]
+        # 量化误差使行向量不再是单位长度，重新归一化后与自身的余弦相似度为1
+        return _normalize(block)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        # (查询数, 维度) -> (查询数, 文档数) 的余弦相似度
+        if self.matrix is not None:
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self))
+            scores[:, start:end] = queries @ self._dequantize(start, end).T
+        return scores
+
+    def _result(self, row: int, cosine: float) -> Dict[str, Any]:
+        metadata = {key: column[row] for key, column in self.columns.items() if column[row] is not None}
+        return {
+            'content': self.contents[row],
+            'metadata': metadata,
+            'similarity_score': float(l2_distance(cosine))
+        }
+
+    def search_batch(self, embeddings: Sequence[Sequence[float]], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """多个查询向量一次矩阵乘法完成检索，返回每个查询的top-k结果（格式同VectorSearchTool）"""
+        n = len(self)
+        if n == 0 or k <= 0:
+            return [[] for _ in embeddings]
+        queries = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        scores = self._scores(queries)
+        k = min(k, n)
+        if k < n:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [[self._result(int(row), float(cosine)) for row, cosine in zip(rows, row_scores)]
+                for rows, row_scores in zip(top, top_scores)]
+
+    def search(self, embedding: Sequence[float], k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_batch([embedding], k)[0]
+
+def load_numpy_store(db_path: str) -> Optional[NumpyVectorStore]:
+    # NUMPY_STORE_UPCAST=0 时不反量化，进程私有内存最小，但每次查询需按块转换
+    path = Path(db_path) / STORE_DIR
+    if not (path / "store.json").exists():
+        logger.warning(f"未找到NumPy向量库，请使用 build_vector_db.py --numpy-store 生成: {path}")
+        return None
+    return NumpyVectorStore(str(path), upcast=os.getenv("NUMPY_STORE_UPCAST", "1").lower() in ("1", "true", "yes"))
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from src.utils.logger import setup_logger
+from src.tools.embedding_cache import normalize_query
+
+logger = setup_logger("Reranker")
+
+DEFAULT_RERANK_MODEL = "BAAI/bge-reranker-base"
+
+class CrossEncoderReranker:
+    """交叉编码器重排：按初检排名分批打分，超出延迟预算时未打分的候选保持原顺序排在后面；
+    (查询, chunk_id) 分数进程内LRU缓存，命中的候选不占用预算"""
+
+    def __init__(self, model: Any, candidates: int = 20, budget_ms: float = 300,
+                 batch_size: int = 8, max_entries: int = 4096):
+        # model: sentence_transformers.CrossEncoder 或任何提供 predict(pairs) 的对象
+        self.model = model
+        self.candidates = candidates
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.over_budget = 0
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chunk_key(item: Dict[str, Any]) -> str:
+        chunk_id = item['metadata'].get('chunk_id')
+        if chunk_id is not None:
+            return str(chunk_id)
+        return hashlib.sha256(item['content'].encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def _remember(self, key: Tuple[str, str], score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """对初检结果重排并截取前k个，结果格式不变，另加rerank_score字段"""
+        query = normalize_query(query)
+        keys = [(query, self._chunk_key(item)) for item in results]
+        scores: List[Optional[float]] = [self._lookup(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+
+        start = time.perf_counter()
+        batch_seconds = 0.0
+        for offset in range(0, len(pending), self.batch_size):
+            # 按已测得的单批耗时预估，下一批会超出预算时停止
+            elapsed = time.perf_counter() - start
+            if offset and elapsed + batch_seconds > self.budget:
+                self.over_budget += 1
+                logger.debug(f"重排超出预算，已打分 {offset}/{len(pending)} 个候选")
+                break
+            batch = pending[offset:offset + self.batch_size]
+            batch_start = time.perf_counter()
+            predicted = self.model.predict([(query, results[i]['content']) for i in batch])
+            batch_seconds = time.perf_counter() - batch_start
+            for i, score in zip(batch, predicted):
+                scores[i] = float(score)
+                self._remember(keys[i], scores[i])
+
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: scores[i], reverse=True)
+        unscored = [i for i, score in enumerate(scores) if score is None]
+        return [{**results[i], 'rerank_score': scores[i]} if scores[i] is not None else results[i]
+                for i in (scored + unscored)[:k]]
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "over_budget": self.over_budget}
+
+def _load_cross_encoder(model_name: str, max_length: int):
+    from sentence_transformers import CrossEncoder
+    # 优先使用本地缓存，失败再在线下载
+    try:
+        return CrossEncoder(model_name, max_length=max_length, device='cpu', local_files_only=True)
+    except Exception as e:
+        logger.error(f"本地缓存加载重排模型失败: {e}，尝试在线下载...")
+        return CrossEncoder(model_name, max_length=max_length, device='cpu')
+
+def create_reranker() -> Optional[CrossEncoderReranker]:
+    # RERANK_ENABLED=1 时启用；模型加载失败时不重排，检索照常返回初检结果
+    if os.getenv("RERANK_ENABLED", "0").lower() not in ("1", "true", "yes"):
+        return None
+    model_name = os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+    try:
+        model = _load_cross_encoder(model_name, int(os.getenv("RERANK_MAX_LENGTH", "512")))
+    except Exception as e:
+        logger.error(f"重排模型加载失败，关闭重排: {e}")
+        return None
+    reranker = CrossEncoderReranker(
+        model,
+        candidates=int(os.getenv("RERANK_CANDIDATES", "20")),
+        budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+        batch_size=int(os.getenv("RERANK_BATCH_SIZE", "8")),
+        max_entries=int(os.getenv("RERANK_CACHE_SIZE", "4096")),
+    )
+    logger.info(f"重排模型加载成功: {model_name}, 候选数: {reranker.candidates}, 预算: {reranker.budget * 1000:.0f}ms")
+    return reranker
@@ -1,58 +1,59 @@
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from src.utils.logger import setup_logger
+from src.utils.lazy import LazyBackend
+from src.utils.tracing import trace_span
+from src.tools.embeddings import create_embeddings, embedding_model_id, vector_db_path
 
 logger = setup_logger("VectorSearch")
 
 class VectorSearchTool:
-    def __init__(self):
+    def __init__(self, db_path: Optional[str] = None, embeddings: Optional[Any] = None):
+        self.db_path = Path(db_path) if db_path else vector_db_path()
+        # 向量库后端：chroma（默认，HNSW近似检索）/ numpy（内存映射精确检索）
+        self.backend = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+        if self.backend not in ("chroma", "numpy"):
+            raise ValueError(f"不支持的向量库后端: {self.backend}")
         self.vectorstore = None
+        # 可传入已加载的嵌入模型，评测时多个索引共享同一模型
+        self.embeddings = embeddings
+        self.lexical_index = None
+        self._load_lexical_index()
         self._load_vectorstore()
+        # 可选的交叉编码器重排（RERANK_ENABLED=1）
+        from src.tools.reranker import create_reranker
+        self.reranker = create_reranker()
+    
+    def _load_lexical_index(self):
+        # BM25索引由build_vector_db.py与向量库一同生成
+        index_path = self.db_path / "lexical_index.pkl"
+        if not index_path.exists():
+            logger.warning(f"未找到BM25索引，将仅使用向量检索: {index_path}")
+            return
+        try:
+            from src.tools.lexical_index import BM25Index
+            self.lexical_index = BM25Index.load(str(index_path))
+            logger.info(f"BM25索引加载成功，文档数: {len(self.lexical_index)}")
+        except Exception as e:
+            logger.error(f"BM25索引加载失败: {e}")
+            self.lexical_index = None
     
     def _load_vectorstore(self):
+        if self.backend == "numpy":
+            self._load_numpy_store()
+            return
         try:
             from langchain_community.vectorstores import Chroma
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-            # 从环境变量读取配置
-            db_path = str(Path(__file__).parent.parent.parent/"models/vector_db")
+            db_path = str(self.db_path)
             collection_name = "water_regulations"
-            model_name = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-large-zh-v1.5")
-            # 强制使用本地缓存
-            model_kwargs = {
-                'device': 'cpu',
-                'local_files_only': True,  # 只使用本地文件
-            }
-            encode_kwargs = {
-                'normalize_embeddings': True
-            }
-            logger.info(f"尝试从本地缓存加载模型: {model_name}")
-            
-            try:
-                # 初始化embedding（离线模式）
-                embeddings = HuggingFaceEmbeddings(
-                    model_name=model_name,
-                    model_kwargs=model_kwargs,
-                    encode_kwargs=encode_kwargs
-                )
-                logger.info("成功从本地缓存加载模型")
-                
-            except Exception as e:
-                logger.error(f"本地缓存加载失败: {e}")
-                logger.info("尝试在线下载模型...")
-                # 如果本地缓存失败，尝试在线下载
-                model_kwargs['local_files_only'] = False
-                embeddings = HuggingFaceEmbeddings(
-                    model_name=model_name,
-                    model_kwargs=model_kwargs,
-                    encode_kwargs=encode_kwargs
-                )
-                logger.info("在线下载模型成功")
+            if self.embeddings is None:
+                self.embeddings = self._create_embeddings()
             
             # 加载向量存储
             self.vectorstore = Chroma(
                 persist_directory=db_path,
-                embedding_function=embeddings,
+                embedding_function=self.embeddings,
                 collection_name=collection_name
             )
             
@@ -67,14 +68,90 @@ class VectorSearchTool:
             logger.error(f"向量搜索工具初始化失败: {e}")
             self.vectorstore = None
     
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        if not self.vectorstore:
-            raise ValueError("向量搜索工具未初始化")
+    def _load_numpy_store(self):
+        try:
+            from src.tools.numpy_store import load_numpy_store
+            store = load_numpy_store(str(self.db_path))
+            if store is None:
+                return
+            # 向量必须与查询向量来自同一嵌入模型
+            if store.embedding_model != embedding_model_id():
+                logger.error(f"NumPy向量库的嵌入模型（{store.embedding_model}）与当前配置（{embedding_model_id()}）不一致，请重新构建")
+                return
+            if self.embeddings is None:
+                self.embeddings = self._create_embeddings()
+            self.vectorstore = store
+            logger.info(f"向量搜索工具初始化成功（NumPy精确检索），文档数: {len(store)}")
+        except Exception as e:
+            logger.error(f"NumPy向量库加载失败: {e}")
+            self.vectorstore = None
+
+    def _create_embeddings(self):
+        # 嵌入后端由EMBEDDING_BACKEND选择，默认HuggingFace BGE
+        embeddings, model_name = create_embeddings()
+        # 查询向量缓存：进程内LRU + 可选SQLite持久层
+        from src.tools.embedding_cache import CachedEmbeddings, SQLiteEmbeddingStore
+        cache_db = os.getenv("EMBEDDING_CACHE_DB", "")
+        store = None
+        if cache_db:
+            store = SQLiteEmbeddingStore(cache_db, max_entries=int(os.getenv("EMBEDDING_CACHE_DB_MAX", "100000")))
+        return CachedEmbeddings(
+            embeddings,
+            model_name=model_name,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+            store=store
+        )
+    
+    def search(self, query: str, k: int = 5, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        # mode: hybrid（向量+BM25倒排融合）/ vector（仅向量）/ lexical（仅BM25，不调用嵌入模型）
+        mode = mode or os.getenv("SEARCH_MODE", "hybrid")
+        if mode not in ("hybrid", "vector", "lexical"):
+            raise ValueError(f"不支持的检索模式: {mode}")
+        if self.lexical_index is None and mode != "vector":
+            mode = "vector"
+        if mode != "lexical" and not self.vectorstore:
+            if self.lexical_index is None:
+                raise ValueError("向量搜索工具未初始化")
+            logger.warning("向量库不可用，退化为BM25检索")
+            mode = "lexical"
+        
+        logger.debug(f"搜索查询: {query}, 模式: {mode}")
         
-        logger.debug(f"搜索查询: {query}")
+        # 启用重排时先取更多候选，重排后再截取前k个
+        candidates = max(k, self.reranker.candidates) if self.reranker else k
+        with trace_span("search", mode=mode, k=k):
+            if mode == "lexical":
+                formatted_results = self._lexical_search(query, candidates)
+            elif mode == "vector":
+                formatted_results = self._vector_search(query, candidates)
+            else:
+                # 两路各取更多候选，再用倒数排名融合
+                from src.tools.lexical_index import reciprocal_rank_fusion
+                fetch_k = max(candidates * 4, 20)
+                formatted_results = reciprocal_rank_fusion(
+                    [self._vector_search(query, fetch_k), self._lexical_search(query, fetch_k)],
+                    k=candidates
+                )
+            if self.reranker and formatted_results:
+                with trace_span("rerank", candidates=len(formatted_results)):
+                    formatted_results = self.reranker.rerank(query, formatted_results, k)
         
-        # 相似度搜索
-        results = self.vectorstore.similarity_search_with_score(query, k=k)
+        logger.info(f"搜索完成（{mode}），返回 {len(formatted_results)} 个结果")
+        return formatted_results
+    
+    def _lexical_search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        with trace_span("bm25.search", k=k):
+            return self.lexical_index.search(query, k=k)
+    
+    def _vector_search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        # 先单独计算查询向量，使嵌入与Chroma检索的耗时分开统计；结果与similarity_search_with_score一致
+        # similarity_score在两种后端下都是平方L2距离（越小越相关）
+        embedding = self.embeddings.embed_query(query)
+        if self.backend == "numpy":
+            with trace_span("numpy.search", k=k):
+                return self.vectorstore.search(embedding, k=k)
+        with trace_span("chroma.search", k=k):
+            results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
         # 格式化结果
         formatted_results = []
         for doc, score in results:
@@ -83,15 +160,35 @@ class VectorSearchTool:
                 'metadata': doc.metadata,
                 'similarity_score': float(score)
             })
-        
-        logger.info(f"搜索完成，返回 {len(formatted_results)} 个结果")
         return formatted_results
     
+    def vector_search_batch(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """批量向量检索；NumPy后端一次矩阵乘法完成全部查询"""
+        if not self.vectorstore:
+            raise ValueError("向量搜索工具未初始化")
+        if self.backend != "numpy":
+            return [self._vector_search(query, k) for query in queries]
+        embeddings = [self.embeddings.embed_query(query) for query in queries]
+        with trace_span("numpy.search", k=k, batch=len(queries)):
+            return self.vectorstore.search_batch(embeddings, k=k)
+
+    def embed_query(self, text: str) -> List[float]:
+        # 复用已加载的嵌入模型与查询向量缓存
+        if not self.embeddings:
+            raise ValueError("嵌入模型未初始化")
+        return self.embeddings.embed_query(text)
+    
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = self.embeddings.stats() if hasattr(self.embeddings, "stats") else {}
+        if self.reranker:
+            stats["rerank"] = self.reranker.stats()
+        return stats
+    
     def is_available(self) -> bool:
-        return self.vectorstore is not None
+        return self.vectorstore is not None or self.lexical_index is not None
 
-# 全局搜索工具实例
-search_tool = VectorSearchTool()
+# 全局搜索工具实例（首次使用时加载模型与向量库）
+search_tool = LazyBackend("vector_search", VectorSearchTool)
 
 if __name__ == "__main__":
     pass
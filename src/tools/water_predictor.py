@@ -1,7 +1,16 @@
 from pathlib import Path
-from typing import Dict
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple, Union, TYPE_CHECKING
 from dataclasses import dataclass
+import numpy as np
 from src.utils.logger import setup_logger
+from src.utils.lazy import LazyBackend
+from src.utils.tracing import trace_span
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = setup_logger("WaterPredictor")
 
@@ -10,13 +19,44 @@ class WaterQualityResult:
     is_potable: bool
     confidence: float
     input_features: Dict[str, float]
+    # explain=True时为各特征对可饮用对数几率的贡献（树SHAP值），与base_value之和即模型原始输出
+    contributions: Optional[Dict[str, float]] = None
+    base_value: Optional[float] = None
+
+    def top_drivers(self, n: int = 3) -> List[Tuple[str, float]]:
+        # 按贡献绝对值排序的前n个特征，正值推向可饮用，负值推向不可饮用
+        if not self.contributions:
+            return []
+        return sorted(self.contributions.items(), key=lambda item: abs(item[1]), reverse=True)[:n]
 
 class WaterQualityPredictor: 
     def __init__(self):
         self.model_path = Path(__file__).parent.parent.parent/"models/catboost_models/catboost_water_quality.cbm"
         self.model = None
         self.feature_names = []
-        self._load_model()
+        # 解释用的对称树SHAP求值器（首次解释时构建）与模型期望值
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self._explain_unavailable = False
+        self.expected_value: Optional[float] = None
+        # 推理后端：catboost（默认）/ numpy（导出的对称树数组，推理时不导入catboost）
+        self.backend = os.getenv("WATER_MODEL_BACKEND", "catboost").lower()
+        if not (self.backend == "numpy" and self._load_numpy_model()):
+            self.backend = "catboost"
+            self._load_model()
+        # 加载模型时（工具预热阶段）就算好树SHAP查找表，首次预测与之后一样只增加查表的开销
+        self._load_explainer()
+    
+    def _load_numpy_model(self) -> bool:
+        numpy_path = self.model_path.with_suffix(".npz")
+        if not numpy_path.exists():
+            logger.warning(f"未找到NumPy模型，改用CatBoost: {numpy_path}（请运行 export_catboost_numpy.py 导出）")
+            return False
+        from src.tools.catboost_numpy import CatBoostNumpyModel
+        self.model = CatBoostNumpyModel(str(numpy_path))
+        self.feature_names = self.model.feature_names
+        logger.info(f"特征数量: {len(self.feature_names)}")
+        return True
     
     def _load_model(self):
         try:
@@ -47,40 +87,107 @@ class WaterQualityPredictor:
             logger.error(f"模型加载失败: {e}")
             raise
     
-    def predict(self, water_params: Dict[str, float]) -> WaterQualityResult:
+    def _load_explainer(self):
+        # 树SHAP都由对称树数组查表计算：numpy后端直接复用推理模型，catboost后端从已加载模型转换，均无需再加载.cbm
+        if self._explainer is not None or self._explain_unavailable:
+            return self._explainer
+        with self._explainer_lock:
+            if self._explainer is None and not self._explain_unavailable:
+                try:
+                    from src.tools.catboost_numpy import CatBoostNumpyModel
+                    if self.backend == "numpy":
+                        self._explainer = self.model
+                    else:
+                        self._explainer = CatBoostNumpyModel.from_catboost(self.model, self.feature_names)
+                    with trace_span("catboost.explain_table", backend=self.backend):
+                        self._explainer.prepare_explanations()
+                except Exception as e:
+                    self._explain_unavailable = True
+                    logger.warning(f"无法计算特征贡献，预测结果将不含解释: {e}")
+        return self._explainer
+    
+    def explain(self, matrix: np.ndarray) -> Optional[np.ndarray]:
+        """树SHAP：返回(行数, 特征数)的对数几率贡献（与CatBoost的ShapValues一致），不可用时返回None"""
+        explainer = self._load_explainer()
+        if explainer is None:
+            return None
+        with trace_span("catboost.explain", rows=len(matrix), backend=self.backend):
+            contributions, self.expected_value = explainer.explain(matrix)
+        return contributions
+    
+    def predict(self, water_params: Dict[str, float], explain: bool = False) -> WaterQualityResult:
         if not self.model:
             raise ValueError("模型未加载")
         
-        # 按顺序构建特征向量，缺失值用None表示
-        features = []
-        missing_features = []
-        
-        for name in self.feature_names:
-            if name in water_params:
-                features.append(water_params[name])
-            else:
-                features.append(None)  # CatBoost自动处理缺失值
-                missing_features.append(name)
-        
         # 记录缺失参数
+        missing_features = [name for name in self.feature_names if name not in water_params]
         if missing_features:
             logger.info(f"检测到缺失参数，CatBoost将自动处理: {missing_features}")
         
-        # 预测
-        prediction = self.model.predict([features])[0]
-        probabilities = self.model.predict_proba([features])[0]
-        # 获取可饮用的概率作为置信度
-        confidence = float(probabilities[1])  # 类别1是可饮用
-        logger.info(f"水质预测完成: {'可饮用' if prediction == 1 else '不可饮用'}, 置信度: {confidence:.3f}")
+        result = self.predict_batch([water_params], explain=explain)[0]
+        logger.info(f"水质预测完成: {'可饮用' if result.is_potable else '不可饮用'}, 置信度: {result.confidence:.3f}")
+        return result
+    
+    def _to_feature_matrix(self, samples: Union[List[Dict[str, float]], "pd.DataFrame", np.ndarray]) -> np.ndarray:
+        # 按模型特征顺序构建矩阵，缺失值用NaN表示（CatBoost自动处理）
+        if isinstance(samples, np.ndarray):
+            matrix = np.asarray(samples, dtype=float)
+            if matrix.ndim == 1:
+                matrix = matrix.reshape(1, -1)
+            if matrix.shape[1] != len(self.feature_names):
+                raise ValueError(f"特征数量不匹配: 期望{len(self.feature_names)}，实际{matrix.shape[1]}")
+            return matrix
+        # 调用方未导入pandas时不可能传入DataFrame，避免为此导入pandas
+        pandas = sys.modules.get("pandas")
+        if pandas is not None and isinstance(samples, pandas.DataFrame):
+            return samples.reindex(columns=self.feature_names).to_numpy(dtype=float)
+        return np.array([
+            [np.nan if sample.get(name) is None else sample[name] for name in self.feature_names]
+            for sample in samples
+        ], dtype=float).reshape(-1, len(self.feature_names))
+    
+    def predict_batch(self, samples: Union[List[Dict[str, float]], "pd.DataFrame", np.ndarray],
+                      explain: bool = False) -> List[WaterQualityResult]:
+        if not self.model:
+            raise ValueError("模型未加载")
+        
+        matrix = self._to_feature_matrix(samples)
+        if len(matrix) == 0:
+            return []
+        
+        # 一次predict_proba同时得到类别和置信度（二分类阈值0.5与predict一致）
+        with trace_span("catboost.predict", rows=len(matrix), backend=self.backend):
+            confidences = self.model.predict_proba(matrix)[:, 1]  # 类别1是可饮用
+        labels = confidences > 0.5
+        
+        # 可选：每个样本的特征贡献，与预测同批计算
+        contributions = [None] * len(matrix)
+        shap_values = self.explain(matrix) if explain else None
+        if shap_values is not None:
+            contributions = [
+                {name: float(value) for name, value in zip(self.feature_names, row)}
+                for row in shap_values
+            ]
+        
+        # 只返回用户实际提供的参数
+        if isinstance(samples, (list, tuple)):
+            inputs = [{k: v for k, v in sample.items() if v is not None} for sample in samples]
+        else:
+            inputs = [
+                {name: float(value) for name, value in zip(self.feature_names, row) if not np.isnan(value)}
+                for row in matrix
+            ]
         
-        return WaterQualityResult(
-            is_potable=bool(prediction),
-            confidence=confidence,
-            input_features=water_params.copy()  # 只返回用户实际提供的参数
-        )
+        logger.info(f"批量水质预测完成: {len(matrix)} 个样本，可饮用 {int(labels.sum())} 个")
+        base_value = self.expected_value if shap_values is not None else None
+        return [
+            WaterQualityResult(is_potable=bool(label), confidence=float(confidence), input_features=features,
+                               contributions=contribution, base_value=base_value)
+            for label, confidence, features, contribution in zip(labels, confidences, inputs, contributions)
+        ]
 
-# 全局预测器实例
-predictor = WaterQualityPredictor()
+# 全局预测器实例（首次使用时加载模型）
+predictor = LazyBackend("water_predictor", WaterQualityPredictor)
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,93 @@
+"""
+工具后端的延迟加载、后台预热与启动耗时统计
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from src.utils.logger import setup_logger
+
+logger = setup_logger("Startup")
+
+# 各组件冷启动耗时（秒），按记录顺序保存
+_timings: Dict[str, float] = {}
+_timings_lock = threading.Lock()
+
+def record_timing(name: str, seconds: float):
+    with _timings_lock:
+        _timings[name] = seconds
+
+@contextmanager
+def timed(name: str):
+    # 记录代码块耗时到启动报告
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def get_startup_timings() -> Dict[str, float]:
+    with _timings_lock:
+        return dict(_timings)
+
+def format_startup_report() -> str:
+    timings = get_startup_timings()
+    lines = ["启动耗时报告:"]
+    for name, seconds in timings.items():
+        lines.append(f"  {name:<16} {seconds * 1000:>10.1f} ms")
+    pending = [backend.name for backend in _registry if not backend.loaded]
+    if pending:
+        lines.append(f"  未加载: {', '.join(pending)}")
+    return "\n".join(lines)
+
+class LazyBackend:
+    """首次使用时才创建的全局实例，属性访问透明转发到真实对象"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                # 双重检查，避免预热线程与调用方重复创建
+                if self._instance is None:
+                    logger.info(f"加载工具后端: {self.name}")
+                    with timed(self.name):
+                        self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self.get(), item)
+
+    def __repr__(self) -> str:
+        state = "已加载" if self.loaded else "未加载"
+        return f"<LazyBackend {self.name} ({state})>"
+
+# 全部已注册的延迟后端
+_registry: List[LazyBackend] = []
+
+def warm_up(backends: Optional[Iterable[LazyBackend]] = None) -> threading.Thread:
+    # 在后台守护线程中依次加载后端，失败只记录日志
+    targets = list(backends) if backends is not None else list(_registry)
+
+    def _run():
+        start = time.perf_counter()
+        for backend in targets:
+            try:
+                backend.get()
+            except Exception as e:
+                logger.warning(f"后台预热 {backend.name} 失败: {e}")
+        logger.info(f"后台预热完成，耗时{time.perf_counter() - start:.3f}秒")
+        logger.info(format_startup_report())
+
+    thread = threading.Thread(target=_run, name="tool-warmup", daemon=True)
+    thread.start()
+    return thread
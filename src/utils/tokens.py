@@ -0,0 +1,30 @@
+import math
+import re
+from typing import Any, Iterable
+
+# 中文字符 / 英文数字词 / 其他非空白符号
+_CJK = re.compile(r'[一-鿿㐀-䶿]')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_SYMBOL = re.compile(r'[^\sA-Za-z0-9一-鿿㐀-䶿]')
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD = 4
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的token数估算，偏保守：中文约每字0.7个token，英文单词约每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = sum(math.ceil(len(word) / 4) for word in _WORD.findall(text))
+    symbols = len(_SYMBOL.findall(text))
+    return math.ceil(cjk * 0.7) + words + symbols
+
+def message_text(message: Any) -> str:
+    # LangChain消息的content可能是字符串或多模态片段列表
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def estimate_message_tokens(messages: Iterable[Any]) -> int:
+    return sum(estimate_tokens(message_text(message)) + MESSAGE_OVERHEAD for message in messages)
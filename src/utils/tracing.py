@@ -0,0 +1,284 @@
+"""
+对话轮次追踪：嵌套span记录各阶段耗时（LLM、查询嵌入、Chroma、CatBoost、沙箱等）与token用量，
+可导出为JSONL或OpenTelemetry(OTLP/JSON)格式，进程退出时输出各阶段p50/p95/p99
+"""
+import os
+import json
+import time
+import atexit
+import secrets
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from src.utils.logger import setup_logger
+
+logger = setup_logger("Tracing")
+
+# 每个阶段保留的最近耗时样本数
+STAGE_WINDOW = 10000
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start_ns": self.start_ns, "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3), "attributes": self.attributes, "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id, "spanId": self.span_id, "parentSpanId": self.parent_id or "",
+            "name": self.name, "kind": 1,
+            "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """收集span：同一轮次的span共享trace_id，根span结束时整条trace写出并计入阶段统计"""
+
+    def __init__(self, enabled: bool = True, export_path: Optional[str] = None, export_format: str = "jsonl"):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.export_format = export_format
+        self._open: Dict[str, List[Span]] = defaultdict(list)
+        self._durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=STAGE_WINDOW))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        return cls(
+            enabled=os.getenv("TRACE_ENABLED", "1").lower() in ("1", "true", "yes"),
+            export_path=os.getenv("TRACE_EXPORT_PATH") or None,
+            export_format=os.getenv("TRACE_EXPORT_FORMAT", "jsonl"),
+        )
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        parent = parent or _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+        )
+        with self._lock:
+            self._open[span.trace_id].append(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        if span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._durations[span.name].append(span.duration_ms)
+            if span.parent_id is not None:
+                return
+            trace = self._open.pop(span.trace_id, [])
+        # 根span结束，整条trace完成
+        self._export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.end_span(span, error)
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 异步生成器可能在其他上下文中结束
+                _current_span.set(None)
+
+    def _export(self, trace: List[Span]):
+        if not self.export_path or not trace:
+            return
+        if self.export_format == "otlp":
+            lines = [json.dumps({"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "water-agent"}}]},
+                "scopeSpans": [{"scope": {"name": "src.utils.tracing"}, "spans": [span.to_otlp() for span in trace]}],
+            }]}, ensure_ascii=False)]
+        else:
+            lines = [json.dumps(span.to_record(), ensure_ascii=False, default=str) for span in trace]
+        try:
+            with self._lock, open(self.export_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning(f"trace导出失败: {e}")
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._durations.items() if values}
+        stats = {}
+        for name, values in snapshot.items():
+            def quantile(q):
+                return values[min(len(values) - 1, int(q * len(values)))]
+            stats[name] = {"count": len(values), "p50_ms": quantile(0.5), "p95_ms": quantile(0.95),
+                           "p99_ms": quantile(0.99), "total_ms": sum(values)}
+        return stats
+
+    def format_latency_report(self) -> str:
+        stats = self.stage_stats()
+        if not stats:
+            return "无追踪数据"
+        width = max(len(name) for name in stats)
+        lines = [f"{'阶段'.ljust(width)}  {'次数':>6}  {'p50(ms)':>9}  {'p95(ms)':>9}  {'p99(ms)':>9}  {'总计(ms)':>10}"]
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name.ljust(width)}  {s['count']:>6}  {s['p50_ms']:>9.1f}  {s['p95_ms']:>9.1f}  "
+                         f"{s['p99_ms']:>9.1f}  {s['total_ms']:>10.1f}")
+        return "各阶段耗时统计:\n" + "\n".join(lines)
+
+tracer = Tracer.from_env()
+
+def trace_span(name: str, **attributes):
+    # 在当前span下创建子span，未启用追踪时几乎无开销
+    return tracer.span(name, **attributes)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+@atexit.register
+def _report_on_exit():
+    if tracer.enabled and tracer.stage_stats():
+        logger.info(tracer.format_latency_report())
+
+class TracingCallback(BaseCallbackHandler):
+    """把LangChain回调转换为span：LLM调用（含token用量与首token延迟）、工具调用、agent链。
+    工具span会设为当前span，工具内部的嵌入、检索、预测等阶段自动挂在其下"""
+
+    # 内联执行，保证异步路径中设置的上下文变量能传递给工具协程
+    run_inline = True
+
+    def __init__(self, tracer: Tracer = tracer):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Span] = {}
+        self._tokens: Dict[UUID, contextvars.Token] = {}
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, **attributes) -> Optional[Span]:
+        if not self.tracer.enabled:
+            return None
+        parent = self._spans.get(parent_run_id) if parent_run_id else None
+        span = self.tracer.start_span(name, parent=parent, **attributes)
+        self._spans[run_id] = span
+        return span
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None):
+        span = self._spans.pop(run_id, None)
+        token = self._tokens.pop(run_id, None)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass
+        if span is not None:
+            self.tracer.end_span(span, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        # 只记录顶层链（AgentExecutor），内部的提示词/解析等Runnable不单独成span
+        if parent_run_id is None:
+            self._start(run_id, None, "agent.executor")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model_name") or (kwargs.get("metadata") or {}).get("ls_model_name")
+        span = self._start(run_id, self._traced_parent(parent_run_id), "llm", messages=sum(len(batch) for batch in messages))
+        if span is not None and model:
+            span.set(model=model)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is not None and "ttft_ms" not in span.attributes:
+            span.set(ttft_ms=round(span.duration_ms, 1))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is not None:
+            span.set(**_token_usage(response))
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name", "")
+        span = self._start(run_id, self._traced_parent(parent_run_id), f"tool.{name}")
+        if span is not None:
+            self._tokens[run_id] = _current_span.set(span)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def _traced_parent(self, parent_run_id: Optional[UUID]) -> Optional[UUID]:
+        # 中间链没有span，挂到最近的已追踪祖先；找不到时使用顶层链
+        if parent_run_id in self._spans:
+            return parent_run_id
+        for run_id, span in reversed(self._spans.items()):
+            if span.name == "agent.executor":
+                return run_id
+        return None
+
+def _token_usage(response) -> Dict[str, int]:
+    # 非流式从llm_output读取，流式或路由模型从消息的usage_metadata读取
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {"prompt_tokens": metadata.get("input_tokens", 0),
+                        "completion_tokens": metadata.get("output_tokens", 0)}
+    return {}
@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# 与scripts相同，测试中以项目根目录导入src；数据处理脚本按其目录导入
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts/data_processing"))
+
+# 测试不需要耗时统计；退出时的统计报告会写到pytest已关闭的输出流
+os.environ.setdefault("TRACE_ENABLED", "0")
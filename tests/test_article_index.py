@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+import pytest
+from src.tools.article_index import ArticleIndex
+
+def _chunk(law_name, article_num, chunk_id, content):
+    metadata = {'law_name': law_name, 'article_no': f"第{article_num}条", 'article_num': article_num,
+                'chapter': '', 'page': 0, 'chunk_id': chunk_id}
+    return SimpleNamespace(metadata=metadata, page_content=content)
+
+def test_from_chunks_joins_only_adjacent_chunks():
+    index = ArticleIndex.from_chunks([
+        _chunk("中华人民共和国水土保持法", 1, "chunk_000000", "水土保持法第一条前半。"),
+        _chunk("中华人民共和国水土保持法", 1, "chunk_000001", "水土保持法第一条后半。"),
+        _chunk("中华人民共和国水土保持法", 2, "chunk_000002", "水土保持法第二条。"),
+        # 同名同号但不相邻：来自另一部法律，不能拼到第一条后面
+        _chunk("中华人民共和国水土保持法", 1, "chunk_000003", "地下水管理条例第一条。"),
+    ])
+    entry = index.lookup("水土保持法", 1)
+    assert entry['content'] == "水土保持法第一条前半。水土保持法第一条后半。"
+    assert entry['chunk_ids'] == ["chunk_000000", "chunk_000001"]
+
+# 三部法律连排：第二部标题带注记、第三部标题折成两行且未被识别（编号重新从第一条开始）
+PAGES = [
+    "中华人民共和国水土保持法\n（1991年6月29日通过）\n第一章 总则\n"
+    "第一条 为了预防和治理水土流失，制定本法。\n第二条 在中华人民共和国境内从事水土保持活动，应当遵守本法。",
+    "第三条 本法自2011年3月1日起施行。\n"
+    "地下水管理条例（2021年）\n第一条 为了加强地下水管理，制定本条例。\n第二条 地下水调查适用本条例。",
+    "大中型水利水电工程建设征地补偿\n和移民安置条例\n"
+    "第一条 为了做好大中型水利水电工程建设征地补偿和移民安置工作，制定本条例。\n"
+    "第二条 移民安置适用本条例。",
+]
+
+KNOWN_ARTICLES = [
+    ("中华人民共和国水土保持法", 1, "预防和治理水土流失"),
+    ("中华人民共和国水土保持法", 3, "2011年3月1日"),
+    ("地下水管理条例", 1, "加强地下水管理"),
+    ("地下水管理条例", 2, "地下水调查"),
+    ("大中型水利水电工程建设征地补偿和移民安置条例", 1, "做好大中型水利水电工程"),
+    ("大中型水利水电工程建设征地补偿和移民安置条例", 2, "移民安置适用"),
+]
+
+def _split(pages):
+    pytest.importorskip("langchain_text_splitters")
+    from langchain.schema import Document
+    from document_processor import ArticleSplitter
+    splitter = ArticleSplitter()
+    chunks = []
+    for page, text in enumerate(pages):
+        chunks += splitter.feed(Document(page_content=text, metadata={'source': 'test.pdf', 'page': page}))
+    chunks += splitter.finish()
+    for i, chunk in enumerate(chunks):
+        chunk.metadata['chunk_id'] = f"chunk_{i:06d}"
+    return ArticleIndex.from_chunks(chunks)
+
+@pytest.fixture(scope="module")
+def split_index():
+    return _split(PAGES)
+
+@pytest.mark.parametrize("law_name, article, expected", KNOWN_ARTICLES)
+def test_split_known_articles(split_index, law_name, article, expected):
+    entry = split_index.lookup(law_name, article)
+    assert entry is not None and entry['law_name'] == law_name
+    assert expected in entry['content']
+
+def test_restart_is_not_merged_into_previous_law(split_index):
+    assert set(split_index.laws) == {law for law, _, _ in KNOWN_ARTICLES}
+    assert "地下水" not in split_index.lookup("中华人民共和国水土保持法", 1)['content']
+    assert "地下水管理条例" not in split_index.lookup("中华人民共和国水土保持法", 3)['content']
+
+def test_wrapped_cross_reference_is_not_a_restart():
+    # 正文折行后以"第一条规定"开头，是对第一条的引用，不是新法律
+    index = _split([
+        "中华人民共和国水法\n（2016年修正）\n"
+        "第一条 为了合理开发、利用、节约和保护水资源，制定本法。\n"
+        "第二条 任何单位和个人有本法\n第一条规定的情形的，依法处理。\n"
+        "第三条 水资源属于国家所有。\n第四条 本法自2002年10月1日起施行。",
+    ])
+    assert set(index.laws) == {"中华人民共和国水法"}
+    assert index.lookup("水法", 2)['content'].endswith("第一条规定的情形的，依法处理。")
+    assert [index.lookup("水法", n) is not None for n in (1, 2, 3, 4)] == [True] * 4
@@ -0,0 +1,121 @@
+import json
+import sys
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("catboost")
+from catboost import CatBoostClassifier, Pool
+from src.tools.catboost_numpy import CatBoostNumpyModel, convert_model_json, model_json
+from scripts.model_export.export_catboost_numpy import (
+    MODEL_PATH, export, load_reference_rows, model_borders, parity_error, parity_samples
+)
+
+FEATURES = ["a", "b", "c", "d", "e"]
+
+def _training_data(rng):
+    x = rng.normal(size=(600, len(FEATURES))) * [1, 10, 100, 0.1, 5]
+    y = (x[:, 0] + x[:, 1] / 10 - x[:, 3] * 5 > 0).astype(int)
+    x[rng.random(x.shape) < 0.15] = np.nan
+    return x, y
+
+def _check(model, npz_path, reference):
+    numpy_model = CatBoostNumpyModel(str(npz_path))
+    x = parity_samples(model_borders(model), len(FEATURES), np.random.default_rng(1), reference)
+    max_error, label_mismatch = parity_error(model, numpy_model, x)
+    assert max_error < 1e-9 and label_mismatch == 0
+
+@pytest.mark.parametrize("nan_mode", ["Min", "Max"])
+def test_parity_on_borders_and_missing_values(tmp_path, nan_mode):
+    x, y = _training_data(np.random.default_rng(0))
+    model = CatBoostClassifier(iterations=40, depth=4, nan_mode=nan_mode, verbose=0, random_seed=0).fit(x, y)
+    export(model, tmp_path / "model.npz", FEATURES)
+    # 真实样本与没有参考数据时按阈值范围采样两种情况
+    _check(model, tmp_path / "model.npz", x)
+    _check(model, tmp_path / "model.npz", None)
+
+def _shallow_model(tmp_path):
+    x, y = _training_data(np.random.default_rng(2))
+    model = CatBoostClassifier(iterations=20, depth=5, nan_mode="Max", verbose=0, random_seed=0).fit(x, y)
+    # 去掉部分树的末层分裂得到深度不一的模型，求值时这些树需要补齐
+    data = model_json(model)
+    for depth, tree in zip([1, 2, 3], data["oblivious_trees"]):
+        tree["splits"] = tree["splits"][:depth]
+        tree["leaf_values"] = tree["leaf_values"][:1 << depth]
+        tree["leaf_weights"] = tree["leaf_weights"][:1 << depth]
+    json_path = tmp_path / "shallow.json"
+    json_path.write_text(json.dumps(data), encoding="utf-8")
+    shallow = CatBoostClassifier()
+    shallow.load_model(str(json_path), format="json")
+    return shallow, x
+
+def test_parity_with_padded_shallow_trees(tmp_path):
+    shallow, x = _shallow_model(tmp_path)
+    arrays = convert_model_json(model_json(shallow), FEATURES)
+    assert np.isinf(arrays["split_border"][0, 1:]).all()
+    np.savez(tmp_path / "shallow.npz", **arrays)
+    _check(shallow, tmp_path / "shallow.npz", x)
+
+def test_shipped_model_parity(tmp_path):
+    if not MODEL_PATH.exists():
+        pytest.skip("未找到训练好的模型")
+    model = CatBoostClassifier()
+    model.load_model(str(MODEL_PATH))
+    export(model, tmp_path / "water.npz", list(model.feature_names_))
+    numpy_model = CatBoostNumpyModel(str(tmp_path / "water.npz"))
+    n_features = len(numpy_model.feature_names)
+    reference = load_reference_rows(n_features)
+    x = parity_samples(model_borders(model), n_features, np.random.default_rng(0), reference)
+    max_error, label_mismatch = parity_error(model, numpy_model, x)
+    assert max_error < 1e-9 and label_mismatch == 0
+
+def _check_explain(model, numpy_model, x):
+    contributions, base_value = numpy_model.explain(x)
+    # 贡献之和加期望值等于原始输出，且与CatBoost的ShapValues逐项一致
+    assert np.allclose(contributions.sum(axis=1) + base_value, numpy_model.predict_raw(x), atol=1e-9)
+    reference = model.get_feature_importance(Pool(x), type="ShapValues")
+    assert np.allclose(contributions, reference[:, :-1], atol=1e-9)
+    assert base_value == pytest.approx(reference[0, -1], abs=1e-9)
+
+@pytest.mark.parametrize("nan_mode", ["Min", "Max"])
+def test_explain_matches_catboost_shap(nan_mode):
+    x, y = _training_data(np.random.default_rng(0))
+    model = CatBoostClassifier(iterations=40, depth=4, nan_mode=nan_mode, verbose=0, random_seed=0).fit(x, y)
+    _check_explain(model, CatBoostNumpyModel.from_catboost(model, FEATURES), x)
+
+def test_explain_with_padded_shallow_trees(tmp_path):
+    shallow, x = _shallow_model(tmp_path)
+    _check_explain(shallow, CatBoostNumpyModel.from_catboost(shallow, FEATURES), x)
+
+def test_explain_without_catboost(tmp_path, monkeypatch):
+    x, y = _training_data(np.random.default_rng(0))
+    model = CatBoostClassifier(iterations=10, depth=3, verbose=0, random_seed=0).fit(x, y)
+    export(model, tmp_path / "model.npz", FEATURES)
+    # numpy后端的解释只用导出的数组
+    monkeypatch.setitem(sys.modules, "catboost", None)
+    numpy_model = CatBoostNumpyModel(str(tmp_path / "model.npz"))
+    contributions, base_value = numpy_model.explain(x)
+    assert np.allclose(contributions.sum(axis=1) + base_value, numpy_model.predict_raw(x), atol=1e-9)
+
+def test_explain_requires_leaf_weights(tmp_path):
+    x, y = _training_data(np.random.default_rng(0))
+    model = CatBoostClassifier(iterations=5, depth=3, verbose=0, random_seed=0).fit(x, y)
+    arrays = convert_model_json(model_json(model), FEATURES)
+    del arrays["leaf_weights"]
+    np.savez(tmp_path / "old.npz", **arrays)
+    numpy_model = CatBoostNumpyModel(str(tmp_path / "old.npz"))
+    numpy_model.predict_proba(x)
+    with pytest.raises(ValueError):
+        numpy_model.explain(x)
+
+def test_predictor_contributions_add_up_to_margin():
+    if not MODEL_PATH.exists():
+        pytest.skip("未找到训练好的模型")
+    from src.tools.water_predictor import WaterQualityPredictor
+    predictor = WaterQualityPredictor()
+    # 查找表在加载模型时已经算好，首次预测不再承担构建开销
+    assert predictor._explainer is not None and predictor._explainer._shap_table is not None
+    samples = [{"ph": 7.0, "Hardness": 200.0, "Sulfate": 330.0}, {"ph": 3.5, "Turbidity": 6.0}, {}]
+    for result in predictor.predict_batch(samples, explain=True):
+        margin = np.log(result.confidence / (1 - result.confidence))
+        assert sum(result.contributions.values()) + result.base_value == pytest.approx(margin, abs=1e-9)
+        assert len(result.top_drivers(3)) == 3
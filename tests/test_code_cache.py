@@ -0,0 +1,42 @@
+import pytest
+from src.tools.code_cache import CodeResultCache, cache_key
+
+@pytest.mark.parametrize("code", [
+    "import random\nprint(random.random())",
+    "from numpy.random import rand\nprint(rand())",
+    "from numpy import random as r\nprint(r.rand())",
+    "import numpy.random as npr\nprint(npr.rand())",
+    "import numpy as np\nprint(np.random.rand())",
+    "import scipy.stats\nprint(scipy.stats.norm.rvs())",
+    "from scipy.stats import norm\nprint(norm.rvs(size=3))",
+    "from scipy.stats import qmc\nprint(qmc.Sobol(2).random(4))",
+    "from numpy import *\nprint(random.rand())",
+    'getattr(__builtins__, "op" + "en")("/etc/passwd")',
+    '__import__("os").getcwd()',
+    "print(__builtins__)",
+    "print(().__class__.__base__.__subclasses__())",
+    "print(set('abc'))",
+    "import pandas as pd\nprint(pd.read_csv('data/water_potability.csv').sample(5))",
+    "import numpy as np\nprint(np.loadtxt('x.txt'))",
+    "import sklearn.model_selection as ms\nprint(ms.train_test_split([1, 2, 3, 4]))",
+    "from sklearn.model_selection import train_test_split\nprint(train_test_split([1, 2, 3, 4]))",
+    "import pandas as pd\nprint(pd.Timestamp('now'))",
+    "import numpy as np\nprint(np.datetime64('today'))",
+])
+def test_nondeterministic_code_is_not_cached(code):
+    key, reason = cache_key(code, "python")
+    assert key is None and reason
+
+def test_deterministic_code_key_ignores_formatting():
+    key, reason = cache_key("import math\nprint(math.sqrt(2))  # 注释", "python")
+    assert reason is None
+    assert key == cache_key("import math\n\nprint( math.sqrt(2) )", "python")[0]
+    # numpy中确定性的部分仍可缓存
+    assert cache_key("import numpy as np\nprint(np.linalg.norm([3, 4]))", "python")[0] is not None
+
+def test_cache_expires_and_evicts():
+    cache = CodeResultCache(max_entries=1, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") is None and cache.get("b") == 2
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,28 @@
+from src.tools.context_packer import pack_context
+
+def _hit(chunk_id, content, source="a.pdf", law_name="中华人民共和国水法", article_no="第一条", **scores):
+    metadata = {'source': source, 'law_name': law_name, 'article_no': article_no, 'chunk_id': chunk_id}
+    return dict({'content': content, 'metadata': metadata}, **scores)
+
+def test_merged_distance_keeps_best_hit():
+    packed = pack_context("水资源", [
+        _hit("chunk_000001", "水资源属于国家所有。", similarity_score=0.4, rerank_score=0.2),
+        _hit("chunk_000002", "水资源的所有权由国务院代表国家行使。", similarity_score=0.9, rerank_score=0.7),
+    ])
+    assert len(packed) == 1 and packed[0].chunk_ids == ["chunk_000001", "chunk_000002"]
+    # 向量距离越小越相关，其余分数越大越相关
+    assert packed[0].scores == {"similarity_score": 0.4, "rerank_score": 0.7}
+
+def test_adjacent_chunks_from_other_files_are_not_merged():
+    packed = pack_context("水资源", [
+        _hit("chunk_000010", "甲文件的结尾。", source="a.pdf"),
+        _hit("chunk_000011", "乙文件的开头。", source="b.pdf"),
+    ])
+    assert [context.chunk_ids for context in packed] == [["chunk_000010"], ["chunk_000011"]]
+
+def test_chunks_without_law_name_are_not_merged():
+    packed = pack_context("水资源", [
+        _hit("chunk_000010", "前言第一段。", law_name="", article_no=""),
+        _hit("chunk_000011", "前言第二段。", law_name="", article_no=""),
+    ])
+    assert len(packed) == 2
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain_openai")
+from src.agent.llm_manager import LLMManager, PROVIDERS
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    for _, prefix, _, _ in PROVIDERS.values():
+        monkeypatch.delenv(f"{prefix}_API_KEY", raising=False)
+    for name in ("LLM_TIMEOUT", "LLM_MAX_RETRIES", "LLM_ROUTED_TIMEOUT", "LLM_HEDGE_AFTER"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+def test_routed_clients_leave_retries_to_the_router(clean_env):
+    clean_env.setenv("OPENAI_API_KEY", "test")
+    clean_env.setenv("DEEPSEEK_API_KEY", "test")
+    manager = LLMManager("auto")
+    # 对冲会使慢请求的花费翻倍，默认关闭
+    assert manager.llm.hedge_after == 0
+    for provider in manager.llm.providers:
+        assert provider.client.max_retries == 0
+        assert provider.client.request_timeout == 20
+
+def test_single_provider_keeps_sdk_retries(clean_env):
+    clean_env.setenv("OPENAI_API_KEY", "test")
+    manager = LLMManager("auto")
+    assert manager.llm_type == "OpenAI"
+    assert manager.llm.max_retries == 3
+    assert manager.llm.request_timeout == 60
+
+def test_hedging_is_opt_in(clean_env):
+    clean_env.setenv("OPENAI_API_KEY", "test")
+    clean_env.setenv("DEEPSEEK_API_KEY", "test")
+    clean_env.setenv("LLM_HEDGE_AFTER", "8")
+    assert LLMManager("auto").llm.hedge_after == 8
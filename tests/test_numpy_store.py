@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+from src.tools.numpy_store import NumpyVectorStore, write_numpy_store
+
+def _vectors():
+    vectors = np.random.default_rng(0).normal(size=(40, 16))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _store(tmp_path, vectors, dtype, upcast=True):
+    write_numpy_store(str(tmp_path), vectors, [f"doc{i}" for i in range(len(vectors))],
+                      [{'chunk_id': f"chunk_{i:06d}"} for i in range(len(vectors))], dtype=dtype)
+    return NumpyVectorStore(str(tmp_path), upcast=upcast)
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+@pytest.mark.parametrize("upcast", [True, False])
+def test_scores_are_squared_l2_distances(tmp_path, dtype, upcast):
+    vectors = _vectors()
+    results = _store(tmp_path, vectors, dtype, upcast).search(vectors[3], k=5)
+    # 与自身的距离为0（量化后重新归一化），其余按距离升序
+    assert results[0]['content'] == "doc3"
+    assert results[0]['similarity_score'] == pytest.approx(0.0, abs=1e-4)
+    scores = [result['similarity_score'] for result in results]
+    assert scores == sorted(scores)
+    expected = np.sort(2 - 2 * vectors @ vectors[3])[:5]
+    assert np.allclose(scores, expected, atol=2e-2 if dtype == "int8" else 2e-3)
+
+def test_scores_match_chroma(tmp_path):
+    pytest.importorskip("chromadb")
+    from langchain_community.vectorstores import Chroma
+    vectors = _vectors()
+    texts = [f"doc{i}" for i in range(len(vectors))]
+    chroma = Chroma(collection_name="numpy_store_test", persist_directory=str(tmp_path / "chroma"))
+    chroma._collection.add(ids=texts, embeddings=vectors.tolist(), documents=texts)
+    expected = chroma.similarity_search_by_vector_with_relevance_scores(vectors[7].tolist(), k=5)
+    results = _store(tmp_path / "numpy", vectors, "float32").search(vectors[7], k=5)
+    assert [result['content'] for result in results] == [doc.page_content for doc, _ in expected]
+    assert np.allclose([result['similarity_score'] for result in results], [score for _, score in expected], atol=1e-5)
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+from src.agent.response_cache import SemanticResponseCache, is_context_dependent
+
+# 用字符集合构造的玩具向量：字面相近的问题相似度高
+VOCAB = "地下水超采区划定条件怎么管理取水许可为什么要保护水资源"
+
+def _embed(text):
+    return [float(ch in text) for ch in VOCAB]
+
+def test_independent_question_hits_cache():
+    cache = SemanticResponseCache(_embed, threshold=0.95)
+    question = "为什么要保护地下水资源"
+    assert not is_context_dependent(question, has_history=True)
+    cache.store(question, "因为……")
+    assert cache.lookup("为什么要保护地下水资源？") == "因为……"
+    assert cache.stats()["hits"] == 1
+
+def test_numbers_must_match():
+    cache = SemanticResponseCache(_embed, threshold=0.95)
+    cache.store("取水许可管理第10条", "第十条……")
+    assert cache.lookup("取水许可管理第11条") is None
+
+@pytest.mark.parametrize("question", ["为什么？", "为什么呢", "为什么这样规定", "那这条呢", "继续说"])
+def test_follow_up_questions_bypass_cache(question):
+    assert is_context_dependent(question, has_history=True)
+    # 没有历史时任何问题都是独立问题
+    assert not is_context_dependent(question, has_history=False)
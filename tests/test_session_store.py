@@ -0,0 +1,32 @@
+import asyncio
+from src.server.session_store import SessionStore
+
+def test_capacity_eviction_skips_sessions_mid_turn():
+    async def scenario():
+        store = SessionStore(factory=lambda session_id: object(), max_sessions=2)
+        busy = store.get_or_create("busy")
+        store.get_or_create("idle")
+        async with busy.lock:
+            # busy最久未访问，但正在进行对话，应淘汰idle
+            store.get_or_create("new")
+            assert set(store._sessions) == {"busy", "new"}
+            # 其余会话都在进行中时暂时超出上限，而不是淘汰它们
+            async with store.get("new").lock:
+                store.get_or_create("extra")
+                assert set(store._sessions) == {"busy", "new", "extra"}
+    asyncio.run(scenario())
+
+def test_session_is_not_evicted_between_lookup_and_lock():
+    async def scenario():
+        store = SessionStore(factory=lambda session_id: object(), max_sessions=1)
+        async with store.turn("streaming") as session:
+            # 已取得会话但尚未持有锁（如正在发送SSE头部）时，新会话不能挤掉它
+            await asyncio.sleep(0)
+            store.get_or_create("other")
+            assert "streaming" in store._sessions
+            async with session.lock:
+                pass
+        assert session.active == 0 and not session.in_use()
+        store.get_or_create("third")
+        assert "streaming" not in store._sessions
+    asyncio.run(scenario())